@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+"""
+Frame retrieval benchmark.
+
+Serves fake PNG frames from a local stand-in for ComfyUI's /view endpoint and
+compares the old serial fetch (one fresh requests.get per frame) against the
+handler's pooled, parallel fetcher for increasing frame counts.
+
+Usage: python benchmarks/bench_frame_fetch.py [--frames 17 65 130 258] [--latency-ms 5] [--frame-kb 500]
+"""
+
+import argparse
+import base64
+import os
+import sys
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+import handler  # noqa: E402
+
+
+def make_server(latency_ms, frame_bytes):
+    payload = os.urandom(frame_bytes)
+
+    class ViewHandler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"
+
+        def do_GET(self):
+            if not urllib.parse.urlparse(self.path).path == "/view":
+                self.send_error(404)
+                return
+            time.sleep(latency_ms / 1000)
+            self.send_response(200)
+            self.send_header("Content-Type", "image/png")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), ViewHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def fetch_serial(host, items):
+    """Baseline: the pre-pooling implementation (fresh connection, serial, encode after)."""
+    frames = []
+    for item in items:
+        query = urllib.parse.urlencode({"filename": item["filename"], "subfolder": "", "type": "output"})
+        response = requests.get(f"http://{host}/view?{query}", timeout=60)
+        response.raise_for_status()
+        frames.append(base64.b64encode(response.content).decode("utf-8"))
+    return frames
+
+
+def fetch_parallel(items):
+    return [encoded for _, encoded in handler.iter_frames(items, transform=handler.encode_frame)]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark frame retrieval from a local /view stand-in")
+    parser.add_argument("--frames", type=int, nargs="+", default=[17, 65, 130, 258])
+    parser.add_argument("--latency-ms", type=float, default=5.0, help="Per-request server latency")
+    parser.add_argument("--frame-kb", type=int, default=500, help="Size of each frame in KB")
+    parser.add_argument("--workers", type=int, default=handler.FRAME_FETCH_WORKERS)
+    args = parser.parse_args()
+
+    server = make_server(args.latency_ms, args.frame_kb * 1024)
+    host = f"127.0.0.1:{server.server_address[1]}"
+    handler.COMFY_HOST = host
+    handler.FRAME_FETCH_WORKERS = args.workers
+
+    print(f"latency={args.latency_ms}ms frame={args.frame_kb}KB workers={args.workers}")
+    print(f"{'frames':>8} {'serial_s':>10} {'parallel_s':>11} {'speedup':>8}")
+    for count in args.frames:
+        items = [{"filename": f"interpolated_frames_{i:05d}_.png", "subfolder": "", "type": "output"} for i in range(count)]
+
+        start = time.perf_counter()
+        serial = fetch_serial(host, items)
+        serial_s = time.perf_counter() - start
+
+        start = time.perf_counter()
+        parallel = fetch_parallel(items)
+        parallel_s = time.perf_counter() - start
+
+        assert serial == parallel, "parallel fetch returned different frames"
+        print(f"{count:>8} {serial_s:>10.3f} {parallel_s:>11.3f} {serial_s / parallel_s:>7.1f}x")
+
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,137 @@
+#!/usr/bin/env python3
+"""
+Handler benchmark against the local ComfyUI stand-in.
+
+Runs complete jobs through ``handler.handler`` for each frame count and
+resolution, with ComfyUI replaced by benchmarks/fake_comfyui.py so only the
+worker's own overhead is measured (uploads, websocket, frame retrieval,
+encoding and response building). Every case runs in a fresh process to get
+its peak RSS. Frame sizes follow the resolution: width x height x 3 bytes
+times ``--png-ratio``.
+
+Usage: python benchmarks/bench_handler.py [--frames 17 65 129] [--resolutions 480 640 720 1080]
+                                          [--latency-ms 100] [--repeat 1] [--output-format frames] [--json out.json]
+                                          [--verbose]
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import resource
+import sys
+import time
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), "..")))
+from benchmarks.fake_comfyui import FakeComfyUI  # noqa: E402
+from src.workflow_registry import resolution_to_dimensions  # noqa: E402
+
+PHASES = ("server_check", "upload", "queue", "execution", "history_fetch", "frame_fetch", "encode", "response_build")
+
+
+def run_case(host, job, repeat, results, verbose=False):
+    """Child process: import the handler against the stand-in and run the job ``repeat`` times."""
+    os.environ.update({"COMFY_HOST": host, "PROGRESS_UPDATES": "false", "RETENTION_SWEEP_INTERVAL_S": "0"})
+    if not verbose:
+        sys.stdout = open(os.devnull, "w")
+    import handler
+
+    baseline_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    runs = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = handler.handler(job)
+        wall = time.perf_counter() - start
+        if "error" in result:
+            results.put({"error": result["error"]})
+            return
+        runs.append({
+            "wall_s": wall,
+            "timings": result["metadata"]["timings"],
+            "response_bytes": len(json.dumps(result)),
+        })
+    handler.comfy_events.close()
+    results.put({
+        "runs": runs,
+        "baseline_rss_mb": baseline_kb / 1024,
+        "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    })
+
+
+def benchmark(server, frames, resolution, args):
+    width, height = resolution_to_dimensions(resolution)
+    server.frames = frames
+    server.frame_bytes = int(width * height * 3 * args.png_ratio)
+    job = {
+        "id": f"bench-{frames}-{resolution}",
+        "input": {
+            "start_image_base64": "c3RhcnQ=",
+            "end_image_base64": "ZW5k",
+            "frame_length": frames,
+            "resolution": resolution,
+            "output_format": args.output_format,
+        },
+    }
+    context = multiprocessing.get_context("spawn")
+    results = context.Queue()
+    child = context.Process(target=run_case, args=(server.host, job, args.repeat, results, args.verbose))
+    child.start()
+    outcome = results.get(timeout=600)
+    child.join(60)
+    if "error" in outcome:
+        return {"frames": frames, "resolution": resolution, "error": outcome["error"]}
+
+    runs = outcome["runs"]
+    phases = {phase: sum(run["timings"].get(phase, 0.0) for run in runs) / len(runs) for phase in PHASES}
+    return {
+        "frames": frames,
+        "resolution": resolution,
+        "frame_bytes": server.frame_bytes,
+        "wall_s": sum(run["wall_s"] for run in runs) / len(runs),
+        "phases_ms": phases,
+        "baseline_rss_mb": outcome["baseline_rss_mb"],
+        "peak_rss_mb": outcome["peak_rss_mb"],
+        "response_bytes": runs[-1]["response_bytes"],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the handler against a local ComfyUI stand-in")
+    parser.add_argument("--frames", type=int, nargs="+", default=[17, 65, 129])
+    parser.add_argument("--resolutions", type=int, nargs="+", default=[480, 640, 720, 1080])
+    parser.add_argument("--latency-ms", type=float, default=100.0, help="Simulated ComfyUI execution time per prompt")
+    parser.add_argument("--png-ratio", type=float, default=0.5, help="Frame size as a fraction of raw RGB")
+    parser.add_argument("--repeat", type=int, default=1, help="Jobs per case (averaged)")
+    parser.add_argument("--output-format", default="frames", choices=["frames", "mp4", "webm"])
+    parser.add_argument("--json", help="Also write the results to this file")
+    parser.add_argument("--verbose", action="store_true", help="Show the handler's log output")
+    args = parser.parse_args()
+
+    server = FakeComfyUI(latency_ms=args.latency_ms)
+    server.start()
+
+    print(f"latency={args.latency_ms}ms png_ratio={args.png_ratio} repeat={args.repeat} output={args.output_format}")
+    header = f"{'frames':>6} {'res':>5} {'frame_kb':>8} {'wall_s':>7} " + " ".join(f"{p:>14}" for p in PHASES)
+    print(header + f" {'rss_mb':>7} {'resp_mb':>8}")
+    results = []
+    for frames in args.frames:
+        for resolution in args.resolutions:
+            result = benchmark(server, frames, resolution, args)
+            results.append(result)
+            if "error" in result:
+                print(f"{frames:>6} {resolution:>5} error: {result['error']}")
+                continue
+            phases = " ".join(f"{result['phases_ms'][p]:>14.1f}" for p in PHASES)
+            print(
+                f"{frames:>6} {resolution:>5} {result['frame_bytes'] // 1024:>8} {result['wall_s']:>7.2f} {phases}"
+                f" {result['peak_rss_mb']:>7.0f} {result['response_bytes'] / 1024**2:>8.1f}"
+            )
+
+    server.stop()
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
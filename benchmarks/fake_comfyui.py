@@ -0,0 +1,342 @@
+#!/usr/bin/env python3
+"""
+Local stand-in for the ComfyUI server.
+
+Implements the parts of ComfyUI's API the handler uses (``/``, ``/upload/image``,
+``/prompt``, ``/ws``, ``/history``, ``/view``, ``/interrupt``, ``/queue``,
+``/system_stats`` and ``/free``) without a GPU. Prompts run one at a time like in ComfyUI:
+every node of the submitted workflow is reported over the websocket, sampler
+nodes send per-step progress events, and each SaveImage node ends up in
+``/history`` with ``frames`` generated frames of ``frame_bytes`` bytes.
+Nodes whose class and inputs (including everything upstream) match the
+previous run are reported as ``execution_cached`` instead, like ComfyUI's
+node cache; ``/free`` with ``free_memory`` drops that cache.
+
+Failures can be injected by name:
+  upload     /upload/image returns 500
+  prompt     /prompt rejects the workflow (400, like a validation error)
+  execution  the prompt fails with an execution_error halfway through
+  view       every /view request returns 500
+  websocket  the websocket is closed halfway through the first execution
+
+Usage: python benchmarks/fake_comfyui.py [--port 8188] [--latency-ms 2000] [--frames 65] [--frame-kb 500]
+"""
+
+import argparse
+import asyncio
+import hashlib
+import json
+import struct
+import threading
+import uuid
+
+from aiohttp import WSMsgType, web
+
+PNG_SIGNATURE = b"\x89PNG\r\n\x1a\n"
+FAILURES = ("upload", "prompt", "execution", "view", "websocket")
+
+
+class FakeComfyUI:
+    def __init__(self, latency_ms=200, frames=17, frame_bytes=64 * 1024, steps=4, failures=(), preview_bytes=0):
+        unknown = set(failures) - set(FAILURES)
+        if unknown:
+            raise ValueError(f"Unknown failures: {', '.join(sorted(unknown))}. Available: {', '.join(FAILURES)}")
+        self.latency_ms = latency_ms
+        self.frames = frames
+        self.frame_bytes = frame_bytes
+        self.steps = steps
+        self.failures = set(failures)
+        self.preview_bytes = preview_bytes
+        self.uploads = {}
+        self.history = {}
+        self.prompts = []
+        self.requests = {}
+        self.frees = []
+        # Reported by /system_stats; tests can lower them to simulate memory pressure
+        self.vram_total = 80 * 1024**3
+        self.vram_free = 60 * 1024**3
+        self.ram_free = 48 * 1024**3
+        self.executed = {}
+        self._cache = {}
+        self._sockets = {}
+        self._pending = []
+        self._running = None
+        self._interrupted = set()
+        self._loop = None
+        self._runner = None
+        self._thread = None
+        self._queue = None
+        self._worker_task = None
+        self.host = None
+
+    # -- lifecycle ---------------------------------------------------------
+
+    def start(self, port=0):
+        """Serve on a background thread. Returns the ``host:port`` to point COMFY_HOST at."""
+        started = threading.Event()
+        self._thread = threading.Thread(target=self._serve, args=(port, started), name="fake-comfyui", daemon=True)
+        self._thread.start()
+        started.wait(10)
+        return self.host
+
+    def stop(self):
+        if self._loop:
+            asyncio.run_coroutine_threadsafe(self._shutdown(), self._loop).result(10)
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join(10)
+
+    async def _shutdown(self):
+        self._worker_task.cancel()
+        try:
+            await self._worker_task
+        except asyncio.CancelledError:
+            pass
+        await self._runner.cleanup()
+
+    def _serve(self, port, started):
+        self._loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self._loop)
+        self._runner = web.AppRunner(self.app())
+        self._loop.run_until_complete(self._runner.setup())
+        site = web.TCPSite(self._runner, "127.0.0.1", port)
+        self._loop.run_until_complete(site.start())
+        self.host = f"127.0.0.1:{self._runner.addresses[0][1]}"
+        self._queue = asyncio.Queue()
+        self._worker_task = self._loop.create_task(self._worker())
+        started.set()
+        self._loop.run_forever()
+        self._loop.close()
+
+    def app(self):
+        app = web.Application(client_max_size=1024**3)
+        app.router.add_get("/", self.index)
+        app.router.add_post("/upload/image", self.upload_image)
+        app.router.add_post("/prompt", self.prompt)
+        app.router.add_get("/ws", self.websocket)
+        app.router.add_get("/history/{prompt_id}", self.get_history)
+        app.router.add_post("/history", self.post_history)
+        app.router.add_get("/view", self.view)
+        app.router.add_post("/interrupt", self.interrupt)
+        app.router.add_get("/queue", self.get_queue)
+        app.router.add_post("/queue", self.post_queue)
+        app.router.add_get("/system_stats", self.system_stats)
+        app.router.add_post("/free", self.free)
+        return app
+
+    def _count(self, name):
+        self.requests[name] = self.requests.get(name, 0) + 1
+
+    # -- HTTP endpoints ----------------------------------------------------
+
+    async def index(self, request):
+        self._count("index")
+        return web.Response(text="ComfyUI stand-in")
+
+    async def upload_image(self, request):
+        self._count("upload")
+        if "upload" in self.failures:
+            return web.Response(status=500, text="upload failed")
+        form = await request.post()
+        image = form["image"]
+        self.uploads[image.filename] = image.file.read()
+        return web.json_response({"name": image.filename, "subfolder": "", "type": "input"})
+
+    async def prompt(self, request):
+        self._count("prompt")
+        body = await request.json()
+        if "prompt" in self.failures:
+            return web.json_response({"error": {"type": "prompt_outputs_failed_validation"}, "node_errors": {}}, status=400)
+        prompt_id = str(uuid.uuid4())
+        self.prompts.append(body["prompt"])
+        self._pending.append(prompt_id)
+        await self._queue.put((prompt_id, body["prompt"], body.get("client_id")))
+        return web.json_response({"prompt_id": prompt_id, "number": len(self.prompts), "node_errors": {}})
+
+    async def websocket(self, request):
+        self._count("ws")
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        client_id = request.query.get("clientId") or uuid.uuid4().hex
+        self._sockets[client_id] = ws
+        await ws.send_json({"type": "status", "data": {"status": {"exec_info": {"queue_remaining": len(self._pending)}}, "sid": client_id}})
+        try:
+            async for message in ws:
+                if message.type == WSMsgType.ERROR:
+                    break
+        finally:
+            if self._sockets.get(client_id) is ws:
+                del self._sockets[client_id]
+        return ws
+
+    async def get_history(self, request):
+        self._count("history")
+        prompt_id = request.match_info["prompt_id"]
+        return web.json_response({prompt_id: self.history[prompt_id]} if prompt_id in self.history else {})
+
+    async def post_history(self, request):
+        body = await request.json()
+        for prompt_id in body.get("delete", []):
+            self.history.pop(prompt_id, None)
+        if body.get("clear"):
+            self.history.clear()
+        return web.json_response({})
+
+    async def view(self, request):
+        self._count("view")
+        if "view" in self.failures:
+            return web.Response(status=500, text="view failed")
+        filename = request.query.get("filename", "")
+        if request.query.get("type") == "input":
+            if filename not in self.uploads:
+                return web.Response(status=404)
+            return web.Response(body=self.uploads[filename], content_type="image/png")
+        return web.Response(body=self.frame(filename), content_type="image/png")
+
+    async def interrupt(self, request):
+        if self._running:
+            self._interrupted.add(self._running)
+        return web.json_response({})
+
+    async def get_queue(self, request):
+        running = [[0, self._running]] if self._running else []
+        pending = [[idx + 1, prompt_id] for idx, prompt_id in enumerate(self._pending)]
+        return web.json_response({"queue_running": running, "queue_pending": pending})
+
+    async def post_queue(self, request):
+        body = await request.json()
+        for prompt_id in body.get("delete", []):
+            if prompt_id in self._pending:
+                self._pending.remove(prompt_id)
+        return web.json_response({})
+
+    async def system_stats(self, request):
+        device = {"name": "cuda:0 stand-in", "type": "cuda", "index": 0, "vram_total": self.vram_total, "vram_free": self.vram_free}
+        return web.json_response({"system": {"ram_total": 64 * 1024**3, "ram_free": self.ram_free}, "devices": [device]})
+
+    async def free(self, request):
+        self._count("free")
+        body = await request.json()
+        self.frees.append(body)
+        if body.get("unload_models"):
+            self.vram_free = self.vram_total
+        if body.get("free_memory"):
+            self._cache.clear()
+            self.ram_free = 48 * 1024**3
+        return web.json_response({})
+
+    # -- execution ---------------------------------------------------------
+
+    def frame(self, filename):
+        """Deterministic fake PNG bytes for an output filename."""
+        header = PNG_SIGNATURE + filename.encode("utf-8")
+        return header + b"\0" * max(0, self.frame_bytes - len(header))
+
+    async def _send(self, client_id, event_type, data):
+        ws = self._sockets.get(client_id)
+        if ws is not None and not ws.closed:
+            await ws.send_json({"type": event_type, "data": data})
+
+    async def _worker(self):
+        while True:
+            prompt_id, workflow, client_id = await self._queue.get()
+            if prompt_id not in self._pending:
+                continue  # deleted from the queue
+            self._pending.remove(prompt_id)
+            self._running = prompt_id
+            try:
+                await self._execute(prompt_id, workflow, client_id)
+            finally:
+                self._running = None
+
+    @staticmethod
+    def cache_keys(workflow):
+        """Key of every node: its class and inputs, with links replaced by the key of the linked node."""
+        keys = {}
+
+        def key(node_id):
+            if node_id not in keys:
+                node = workflow[node_id]
+                inputs = {
+                    name: [key(str(value[0])), value[1]] if isinstance(value, list) and len(value) == 2 and str(value[0]) in workflow else value
+                    for name, value in node.get("inputs", {}).items()
+                }
+                keys[node_id] = hashlib.sha256(json.dumps([node.get("class_type"), inputs], sort_keys=True).encode()).hexdigest()
+            return keys[node_id]
+
+        for node_id in workflow:
+            key(node_id)
+        return keys
+
+    async def _execute(self, prompt_id, workflow, client_id):
+        keys = self.cache_keys(workflow)
+        cached = [node_id for node_id in workflow if node_id in self._cache and self._cache[node_id][0] == keys[node_id]]
+        nodes = [node_id for node_id in workflow if node_id not in cached]
+        self.executed[prompt_id] = nodes
+        delay = self.latency_ms / 1000 / max(1, len(workflow))
+        await self._send(client_id, "execution_start", {"prompt_id": prompt_id})
+        outputs = {node_id: self._cache[node_id][1] for node_id in cached if self._cache[node_id][1] is not None}
+        if cached:
+            await self._send(client_id, "execution_cached", {"nodes": cached, "prompt_id": prompt_id})
+        for idx, node_id in enumerate(nodes):
+            if prompt_id in self._interrupted:
+                await self._send(client_id, "execution_interrupted", {"prompt_id": prompt_id, "node_id": node_id})
+                self.history[prompt_id] = {"outputs": {}, "status": {"status_str": "error", "messages": []}}
+                return
+            if "execution" in self.failures and idx == len(nodes) // 2:
+                error = {"prompt_id": prompt_id, "node_id": node_id, "exception_message": "injected failure"}
+                await self._send(client_id, "execution_error", error)
+                self.history[prompt_id] = {"outputs": {}, "status": {"status_str": "error", "messages": [["execution_error", error]]}}
+                return
+            if "websocket" in self.failures and idx == len(nodes) // 2 and client_id in self._sockets:
+                self.failures.discard("websocket")
+                await self._sockets.pop(client_id).close()
+
+            class_type = workflow[node_id].get("class_type", "")
+            await self._send(client_id, "executing", {"node": node_id, "display_node": node_id, "prompt_id": prompt_id})
+            if "Sampler" in class_type:
+                steps = self.steps
+                for step in range(1, steps + 1):
+                    await asyncio.sleep(delay / steps)
+                    await self._send(client_id, "progress", {"value": step, "max": steps, "prompt_id": prompt_id, "node": node_id})
+                    await self._send_preview(client_id)
+            else:
+                await asyncio.sleep(delay)
+            if class_type == "SaveImage":
+                images = [
+                    {"filename": f"{prompt_id[:8]}_{node_id}_{i:05d}_.png", "subfolder": "", "type": "output"}
+                    for i in range(self.frames)
+                ]
+                outputs[node_id] = {"images": images}
+                await self._send(client_id, "executed", {"node": node_id, "output": {"images": images}, "prompt_id": prompt_id})
+            self._cache[node_id] = (keys[node_id], outputs.get(node_id))
+
+        self.history[prompt_id] = {"outputs": outputs, "status": {"status_str": "success", "completed": True, "messages": []}}
+        await self._send(client_id, "executing", {"node": None, "prompt_id": prompt_id})
+
+    async def _send_preview(self, client_id):
+        ws = self._sockets.get(client_id)
+        if self.preview_bytes and ws is not None and not ws.closed:
+            # Binary event type 1 (PREVIEW_IMAGE), image type 1 (JPEG)
+            await ws.send_bytes(struct.pack(">II", 1, 1) + b"\xff\xd8\xff" + b"\0" * self.preview_bytes)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve a ComfyUI stand-in for local handler runs")
+    parser.add_argument("--port", type=int, default=8188)
+    parser.add_argument("--latency-ms", type=float, default=2000, help="Execution time per prompt")
+    parser.add_argument("--frames", type=int, default=65, help="Frames written by each SaveImage node")
+    parser.add_argument("--frame-kb", type=int, default=500, help="Size of each frame in KB")
+    parser.add_argument("--steps", type=int, default=4, help="Progress events per sampler node")
+    parser.add_argument("--fail", nargs="*", default=[], choices=FAILURES, help="Inject failures")
+    args = parser.parse_args()
+
+    server = FakeComfyUI(args.latency_ms, args.frames, args.frame_kb * 1024, args.steps, args.fail)
+    print(f"ComfyUI stand-in listening on {server.start(args.port)}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,359 @@
+#!/usr/bin/env python3
+"""
+Handler Output Decoder
+
+Turns a saved handler response back into files: the ``frames`` list into
+numbered PNGs or a video (frames are piped into ffmpeg), and a ``video`` field
+into the encoded file. Accepts the plain handler output, RunPod's ``/run``,
+``/runsync``, ``/status`` and ``/stream`` responses, the aggregated list of
+streamed items and newline-delimited streamed items.
+
+The response is parsed incrementally, so only the frames currently being
+decoded are held in memory, and base64 decoding (and PNG writing) runs in a
+process pool. Variants are written next to the first output with a ``_v1``,
+``_v2``, ... suffix.
+
+Usage:
+  python decode_output.py response.json --frames-dir frames
+  python decode_output.py response.json -o output.mp4 --fps 32 --crf 18
+  curl -s .../status/<job_id> -H "Authorization: Bearer $KEY" | python decode_output.py - -o output.webm
+"""
+
+import argparse
+import base64
+import json
+import os
+import re
+import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from src.video import VIDEO_FORMATS, VideoEncoder, VideoEncoderError
+
+DEFAULT_FPS = 32  # Matches the handler's default video fps
+CHUNK_SIZE = 1024 * 1024
+NON_WHITESPACE = re.compile(r"\S")
+LITERAL_END = re.compile(r"[\s,\]}]")
+LITERAL = re.compile(r"-?\d+(?:\.\d+)?(?:[eE][+-]?\d+)?|true|false|null")
+WEBM_SIGNATURE = b"\x1a\x45\xdf\xa3"
+
+
+class JsonStream:
+    """
+    Incremental JSON reader.
+
+    Iterating yields ``(path, value)`` for every string, number, boolean and
+    null in the document, where ``path`` is the tuple of object keys and list
+    indices leading to it. Text is read ``chunk_size`` characters at a time and
+    only the value being parsed is kept, so a response with hundreds of
+    megabytes of frames can be walked in constant memory. Several top-level
+    values (newline-delimited JSON) are read one after the other.
+    """
+
+    def __init__(self, fp, chunk_size=CHUNK_SIZE):
+        self.fp = fp
+        self.chunk_size = chunk_size
+        self.buf = ""
+        self.pos = 0
+        self.eof = False
+
+    def __iter__(self):
+        while self._peek():
+            yield from self._value(())
+
+    def _fill(self):
+        """Append the next chunk, dropping what was already parsed. Returns False at EOF."""
+        if self.eof:
+            return False
+        chunk = self.fp.read(self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buf = self.buf[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def _peek(self):
+        """Skip whitespace and return the next character, or "" at EOF."""
+        while True:
+            match = NON_WHITESPACE.search(self.buf, self.pos)
+            if match:
+                self.pos = match.start()
+                return self.buf[self.pos]
+            self.pos = len(self.buf)
+            if not self._fill():
+                return ""
+
+    def _expect(self, chars):
+        char = self._peek()
+        if not char or char not in chars:
+            raise ValueError(f"Invalid JSON: expected {' or '.join(repr(c) for c in chars)}, got {char or 'end of input'!r}")
+        self.pos += 1
+        return char
+
+    def _string(self):
+        scan = self.pos + 1
+        while True:
+            end = self.buf.find('"', scan)
+            if end == -1:
+                scan = len(self.buf) - self.pos
+                if not self._fill():
+                    raise ValueError("Invalid JSON: unterminated string")
+                scan += self.pos
+                continue
+            backslashes = 0
+            while self.buf[end - 1 - backslashes] == "\\":
+                backslashes += 1
+            if backslashes % 2:
+                scan = end + 1
+                continue
+            raw = self.buf[self.pos + 1:end]
+            self.pos = end + 1
+            return json.loads(f'"{raw}"') if "\\" in raw else raw
+
+    def _literal(self):
+        # A token running to the end of the buffer may continue in the next chunk
+        while True:
+            end = LITERAL_END.search(self.buf, self.pos)
+            if end or not self._fill():
+                break
+        token = self.buf[self.pos:end.start() if end else len(self.buf)]
+        if not LITERAL.fullmatch(token):
+            raise ValueError(f"Invalid JSON: unexpected {token[:20]!r}")
+        self.pos += len(token)
+        return json.loads(token)
+
+    def _value(self, path):
+        char = self._peek()
+        if char == "{":
+            self.pos += 1
+            if self._peek() == "}":
+                self.pos += 1
+                return
+            while True:
+                self._expect('"')
+                self.pos -= 1
+                key = self._string()
+                self._expect(":")
+                yield from self._value(path + (key,))
+                if self._expect(",}") == "}":
+                    return
+        elif char == "[":
+            self.pos += 1
+            if self._peek() == "]":
+                self.pos += 1
+                return
+            index = 0
+            while True:
+                yield from self._value(path + (index,))
+                index += 1
+                if self._expect(",]") == "]":
+                    return
+        elif char == '"':
+            yield path, self._string()
+        elif not char:
+            raise ValueError("Invalid JSON: unexpected end of input")
+        else:
+            yield path, self._literal()
+
+
+def iter_outputs(events):
+    """
+    Pick the handler output out of JSON events.
+
+    Yields ``(kind, variant, value)`` with kind ``"frame"`` (one base64 PNG),
+    ``"video"`` (a base64 encoded video) or ``"error"``. Results under
+    ``variants`` are numbered by their position; streamed items carry their
+    ``variant`` after the frames, so there each closing ``{"status":
+    "completed"}`` item starts the next variant instead.
+    """
+    completed = 0
+    for path, value in events:
+        if not path:
+            continue
+        if path[-1] == "status" and value == "completed":
+            completed += 1
+            continue
+        if not isinstance(value, str):
+            continue
+        variant = path[path.index("variants") + 1] if "variants" in path else completed
+        if len(path) >= 2 and path[-2] == "frames" and isinstance(path[-1], int):
+            yield "frame", variant, value
+        elif path[-1] == "video":
+            yield "video", variant, value
+        elif path[-1] == "error":
+            yield "error", variant, value
+
+
+def numbered(path, variant):
+    """Output path for a variant: the path itself for the first, ``name_v<n>.ext`` for the others."""
+    if not variant:
+        return path
+    root, ext = os.path.splitext(path.rstrip(os.sep))
+    return f"{root}_v{variant}{ext}"
+
+
+def decode_frame(data):
+    return base64.b64decode(data)
+
+
+def write_frame(data, path):
+    with open(path, "wb") as f:
+        f.write(base64.b64decode(data))
+
+
+class FrameDirectory:
+    """Writes frames as ``frame_00000.png``, ``frame_00001.png``, ... (in the worker processes)."""
+
+    def __init__(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        self.path = directory
+        self.frame_count = 0
+
+    def task(self, data):
+        path = os.path.join(self.path, f"frame_{self.frame_count:05d}.png")
+        self.frame_count += 1
+        return write_frame, (data, path)
+
+    def consume(self, result):
+        pass
+
+    def finish(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class VideoFile(VideoEncoder):
+    """Pipes decoded frames into ffmpeg, which writes the video straight to ``path``."""
+
+    def __init__(self, path, fps, crf=None, codec=None, ffmpeg=None):
+        container = os.path.splitext(path)[1].lstrip(".").lower()
+        video_format = VIDEO_FORMATS[container]
+        codec = codec or video_format["default_codec"]
+        crf = video_format["crf"][0] if crf is None else crf
+        super().__init__(container, codec, crf, fps, ffmpeg)
+        self.path = path
+        self.start()
+
+    def build_command(self, output_path):
+        return super().build_command(self.path)
+
+    def task(self, data):
+        return decode_frame, (data,)
+
+    def consume(self, result):
+        self.write_frame(result)
+
+    def finish(self):
+        try:
+            self._process.stdin.close()
+        except BrokenPipeError:
+            pass
+        returncode = self._process.wait()
+        if returncode != 0:
+            raise VideoEncoderError(f"ffmpeg exited with code {returncode}: {self._read_stderr()}")
+
+
+def decode_output(source, output=None, frames_dir="frames", fps=DEFAULT_FPS, crf=None, codec=None,
+                  workers=None, ffmpeg=None, chunk_size=CHUNK_SIZE):
+    """
+    Decode a handler response read from the text stream ``source``.
+
+    Frames go into ``output`` (a .mp4 or .webm path) when given, otherwise
+    into numbered PNGs in ``frames_dir``. At most ``workers * 4`` frames are
+    in flight; ``workers=0`` decodes in this process. Returns a dict of
+    variant -> ``{"path", "frames"}`` and the list of error messages found in
+    the response.
+    """
+    executor = ProcessPoolExecutor(workers) if workers != 0 else None
+    max_pending = (executor._max_workers if executor else 1) * 4
+    pending = deque()
+    sinks = {}
+    written = {}
+    errors = []
+
+    def drain(limit):
+        while len(pending) > limit:
+            sink, future = pending.popleft()
+            sink.consume(future.result())
+
+    try:
+        for kind, variant, value in iter_outputs(JsonStream(source, chunk_size)):
+            if kind == "frame":
+                if variant not in sinks:
+                    sinks[variant] = (VideoFile(numbered(output, variant), fps, crf, codec, ffmpeg) if output
+                                      else FrameDirectory(numbered(frames_dir, variant)))
+                sink = sinks[variant]
+                func, args = sink.task(value)
+                if executor:
+                    pending.append((sink, executor.submit(func, *args)))
+                    drain(max_pending)
+                else:
+                    sink.consume(func(*args))
+            elif kind == "video":
+                video = base64.b64decode(value)
+                path = output or ("output.webm" if video.startswith(WEBM_SIGNATURE) else "output.mp4")
+                path = numbered(path, variant)
+                with open(path, "wb") as f:
+                    f.write(video)
+                written[variant] = {"path": path, "frames": None}
+            else:
+                errors.append(value if variant == 0 else f"Variant {variant}: {value}")
+        drain(0)
+        for variant, sink in sinks.items():
+            sink.finish()
+            written[variant] = {"path": sink.path, "frames": sink.frame_count}
+        return dict(sorted(written.items())), errors
+    finally:
+        for sink in sinks.values():
+            sink.close()
+        if executor:
+            executor.shutdown(cancel_futures=True)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Decode a handler response into PNG frames or a video")
+    parser.add_argument("response", help="Response JSON file, or - for stdin")
+    parser.add_argument("-o", "--output", help="Encode the frames into this .mp4 or .webm file (needs ffmpeg)")
+    parser.add_argument("--frames-dir", default="frames", help="Directory for numbered PNGs when no --output is given")
+    parser.add_argument("--fps", type=int, default=DEFAULT_FPS, help="Frame rate of the encoded video")
+    parser.add_argument("--crf", type=int, help="Quality (default: the container's default)")
+    parser.add_argument("--codec", help="Codec, e.g. h264, h265 or vp9 (default: the container's default)")
+    parser.add_argument("--workers", type=int, help="Decoder processes (default: CPU count, 0 = no pool)")
+    parser.add_argument("--ffmpeg", help="ffmpeg binary (default: FFMPEG_PATH or ffmpeg)")
+    args = parser.parse_args(argv)
+
+    if args.output:
+        container = os.path.splitext(args.output)[1].lstrip(".").lower()
+        if container not in VIDEO_FORMATS:
+            parser.error(f"--output must end in one of: {', '.join('.' + name for name in VIDEO_FORMATS)}")
+        if args.codec and args.codec not in VIDEO_FORMATS[container]["codecs"]:
+            parser.error(f"Unknown codec for {container}: {args.codec}. Available: {', '.join(VIDEO_FORMATS[container]['codecs'])}")
+
+    try:
+        if args.response == "-":
+            written, errors = decode_output(sys.stdin, args.output, args.frames_dir, args.fps, args.crf, args.codec,
+                                            args.workers, args.ffmpeg)
+        else:
+            with open(args.response, encoding="utf-8") as f:
+                written, errors = decode_output(f, args.output, args.frames_dir, args.fps, args.crf, args.codec,
+                                                args.workers, args.ffmpeg)
+    except (OSError, ValueError, VideoEncoderError) as e:
+        print(f"❌ Decoding failed: {e}")
+        return 1
+
+    for error in errors:
+        print(f"Error in response: {error}")
+    for variant, result in written.items():
+        frames = "" if result["frames"] is None else f" ({result['frames']} frames)"
+        print(f"✅ Saved {result['path']}{frames}")
+    if not written:
+        print("❌ No frames or video found in the response")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
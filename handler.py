@@ -1,3 +1,4 @@
+import asyncio
 import runpod
 from runpod.serverless.utils import rp_upload
 import json
@@ -7,12 +8,35 @@ import time
 import os
 import requests
 import base64
+import binascii
 from io import BytesIO
 import websocket
-import uuid
-import random
-import string
 import traceback
+import uuid
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from requests.adapters import HTTPAdapter
+
+from src.comfy_events import ComfyEventClient
+from src.concurrency import PromptCancelled, PromptGate, free_ram_fraction, pending_prompts
+from src.execution_monitor import cancel_prompt, execution_deadline, queue_position
+from src.frame_fetcher import FrameFetcher
+from src.image_preprocess import ImagePreprocessError, image_size, needs_resize, preprocess_available, preprocess_image, resized_type
+from src.remote_inputs import InputFetchError, fetch_http, fetch_s3
+from src.result_cache import ResultCache, cache_key
+from src.retention import RetentionManager
+from src.startup import Readiness, StartupPipeline
+from src.output_sink import OutputSinkError, S3OutputSink
+from src.previews import PreviewEncoder
+from src.progress import ProgressTracker
+from src.tracing import JobTrace, TraceWriter
+from src.local_outputs import read_mapped, release, resolve_output_path
+from src.memory_profiles import device_vram_gb, megapixel_frames
+from src.metrics import MetricsRegistry, PhaseTimer
+from src.residency import ResidencyManager
+from src.upload_index import UploadIndex, content_filename, detect_image_type
+from src.video import VIDEO_FORMATS, VideoEncoder, VideoEncoderError
+from src.workflow_registry import WorkflowRegistry, resolution_to_dimensions
 
 # -----------------------------
 # Configuration
@@ -21,57 +45,403 @@ import traceback
 COMFY_API_AVAILABLE_INTERVAL_MS = int(os.environ.get("COMFY_POLLING_INTERVAL_MS", 500))
 COMFY_API_AVAILABLE_MAX_RETRIES = int(os.environ.get("COMFY_POLLING_MAX_RETRIES", 2000))
 COMFY_HOST = os.environ.get("COMFY_HOST", "127.0.0.1:8188")
-WORKFLOW_FILE = "workflow_runpod.json"
+
+# Readiness: polled with backoff (50 ms up to COMFY_POLLING_INTERVAL_MS) for up to
+# COMFY_POLLING_MAX_RETRIES intervals, then trusted for COMFY_READY_TTL_S across jobs
+COMFY_READY_TIMEOUT_S = COMFY_API_AVAILABLE_MAX_RETRIES * COMFY_API_AVAILABLE_INTERVAL_MS / 1000
+COMFY_READY_TTL_S = float(os.environ.get("COMFY_READY_TTL_S", 30))
+
+# Shared websocket: reconnect policy when the connection to ComfyUI drops
+WEBSOCKET_RECONNECT_ATTEMPTS = int(os.environ.get("WEBSOCKET_RECONNECT_ATTEMPTS", 5))
+WEBSOCKET_RECONNECT_DELAY_S = float(os.environ.get("WEBSOCKET_RECONNECT_DELAY_S", 3))
+WEBSOCKET_TRACE = os.environ.get("WEBSOCKET_TRACE", "false").lower() == "true"
+WEBSOCKET_HEARTBEAT_S = float(os.environ.get("WEBSOCKET_HEARTBEAT_S", 30))
+
+# Execution watchdog: per-job deadline scaled by steps x frames x pixels, after which the prompt is interrupted
+EXECUTION_TIMEOUT_S = int(os.environ.get("EXECUTION_TIMEOUT_S", 1200))
+EXECUTION_TIMEOUT_BASE_S = float(os.environ.get("EXECUTION_TIMEOUT_BASE_S", 120))
+EXECUTION_TIMEOUT_PER_UNIT_S = float(os.environ.get("EXECUTION_TIMEOUT_PER_UNIT_S", 0.5))
+EXECUTION_TIMEOUT_MIN_S = float(os.environ.get("EXECUTION_TIMEOUT_MIN_S", 300))
+EXECUTION_TIMEOUT_MAX_S = float(os.environ.get("EXECUTION_TIMEOUT_MAX_S", 3600))
+# The deadline starts when the prompt starts running; time spent waiting in ComfyUI's queue has its own limit
+QUEUE_TIMEOUT_S = float(os.environ.get("QUEUE_TIMEOUT_S", 2 * EXECUTION_TIMEOUT_MAX_S))
+
+# Progress: forward ComfyUI node/step events to RunPod's /status as stage, percent and ETA
+PROGRESS_UPDATES = os.environ.get("PROGRESS_UPDATES", "true").lower() == "true"
+PROGRESS_UPDATE_INTERVAL_S = float(os.environ.get("PROGRESS_UPDATE_INTERVAL_S", 2))
+
+# Concurrency: overlap uploads and result fetching of several jobs; ComfyUI's queue serializes GPU work
+WORKER_CONCURRENCY = int(os.environ.get("WORKER_CONCURRENCY", 3))
+MAX_PENDING_PROMPTS = int(os.environ.get("MAX_PENDING_PROMPTS", 1))
+MIN_FREE_RAM_FRACTION = float(os.environ.get("MIN_FREE_RAM_FRACTION", 0.15))
+BACKPRESSURE_PROBE_INTERVAL_S = float(os.environ.get("BACKPRESSURE_PROBE_INTERVAL_S", 2))
+
+# Residency: after each job, free ComfyUI memory through /free only when free VRAM or RAM
+# drops below these fractions, so the cached models otherwise stay loaded for the next job
+RESIDENCY_MANAGER = os.environ.get("RESIDENCY_MANAGER", "true").lower() == "true"
+RESIDENCY_MIN_FREE_VRAM_FRACTION = float(os.environ.get("RESIDENCY_MIN_FREE_VRAM_FRACTION", 0.1))
+RESIDENCY_MIN_FREE_RAM_FRACTION = float(os.environ.get("RESIDENCY_MIN_FREE_RAM_FRACTION", 0.1))
+RESIDENCY_SETTLE_S = float(os.environ.get("RESIDENCY_SETTLE_S", 2))
+
+# Metrics: Prometheus text format on a local port when SERVE_API_LOCALLY is set
+SERVE_API_LOCALLY = os.environ.get("SERVE_API_LOCALLY", "false").lower() == "true"
+METRICS_PORT = int(os.environ.get("METRICS_PORT", 9100))
+
+# Tracing: per-job Chrome trace_event files (opt-in per job with "trace", or for every job)
+TRACE_JOBS = os.environ.get("TRACE_JOBS", "false").lower() == "true"
+TRACE_DIR = os.environ.get("TRACE_DIR", "/tmp/comfy-traces")
+TRACE_MAX_MB = int(os.environ.get("TRACE_MAX_MB", 100))
+TRACE_MAX_FILES = int(os.environ.get("TRACE_MAX_FILES", 200))
+
+# Latent previews (opt-in per job with "previews"; ComfyUI must run with --preview-method, see COMFY_PREVIEW_METHOD)
+PREVIEWS_ENABLED = os.environ.get("PREVIEWS_ENABLED", "false").lower() == "true"
+PREVIEW_MAX_SIZE = int(os.environ.get("PREVIEW_MAX_SIZE", 256))
+PREVIEW_QUALITY = int(os.environ.get("PREVIEW_QUALITY", 70))
+PREVIEW_INTERVAL_S = float(os.environ.get("PREVIEW_INTERVAL_S", 3))
+
+# Workflow templates are compiled once at startup and selected per job by workflow_name
+WORKFLOW_REGISTRY_FILE = os.environ.get(
+    "WORKFLOW_REGISTRY_FILE", os.path.join(os.path.dirname(os.path.abspath(__file__)), "workflow_registry.json")
+)
+# Variants: parameter sets rendered from the same uploaded images and queued back to back
+MAX_VARIANTS = int(os.environ.get("MAX_VARIANTS", 8))
+# Memory profiles: VAE tiling and RIFE cache settings picked per job from the manifest's table by
+# frames x pixels and the GPU memory reported by /system_stats; block swap is picked once per worker
+MEMORY_PROFILES = os.environ.get("MEMORY_PROFILES", "true").lower() == "true"
+
+# Result cache: inline outputs of jobs with an explicit non-zero seed, reused by identical jobs
+RESULT_CACHE = os.environ.get("RESULT_CACHE", "false").lower() == "true"
+RESULT_CACHE_DIR = os.environ.get("RESULT_CACHE_DIR", "/tmp/comfy-result-cache")
+RESULT_CACHE_MAX_MB = int(os.environ.get("RESULT_CACHE_MAX_MB", 2048))
+RESULT_CACHE_TTL_S = float(os.environ.get("RESULT_CACHE_TTL_S", 86400))
+
+# Streaming: register a generator handler that yields frames in chunks
+STREAM_OUTPUT = os.environ.get("STREAM_OUTPUT", "false").lower() == "true"
+STREAM_CHUNK_SIZE = int(os.environ.get("STREAM_CHUNK_SIZE", 8))
+STREAM_CHUNK_SIZE_MAX = 64
+
+# Frame retrieval: parallel fetches from /view over a pooled keep-alive session
+FRAME_FETCH_WORKERS = int(os.environ.get("FRAME_FETCH_WORKERS", 8))
+FRAME_FETCH_RETRIES = int(os.environ.get("FRAME_FETCH_RETRIES", 2))
+FRAME_FETCH_BACKOFF_MS = int(os.environ.get("FRAME_FETCH_BACKOFF_MS", 200))
+
+# Co-located mode: read outputs straight from ComfyUI's directories instead of /view
+COMFY_DIRECT_READ = os.environ.get("COMFY_DIRECT_READ", "true").lower() == "true"
+COMFY_OUTPUT_PATH = os.environ.get("COMFY_OUTPUT_PATH", "/comfyui/output")
+COMFY_TEMP_PATH = os.environ.get("COMFY_TEMP_PATH", "/comfyui/temp")
+COMFY_INPUT_PATH = os.environ.get("COMFY_INPUT_PATH", "/comfyui/input")
+
+# Retention: delete a job's inputs, outputs and history once delivered, and sweep orphans of crashed jobs
+CLEANUP_JOB_FILES = os.environ.get("CLEANUP_JOB_FILES", "true").lower() == "true"
+RETENTION_MAX_MB = int(os.environ.get("RETENTION_MAX_MB", 10240))
+RETENTION_MAX_AGE_S = float(os.environ.get("RETENTION_MAX_AGE_S", 6 * 3600))
+RETENTION_SWEEP_INTERVAL_S = float(os.environ.get("RETENTION_SWEEP_INTERVAL_S", 300))
+
+# Input images: downsize to the target resolution before upload (requires Pillow)
+PRERESIZE_INPUTS = os.environ.get("PRERESIZE_INPUTS", "false").lower() == "true"
+BASE64_DECODE_CHUNK = 1 << 20  # base64 characters decoded per step
+
+# URL inputs: http(s) or s3://bucket/key downloads for start_image_url/end_image_url
+INPUT_MAX_BYTES = int(os.environ.get("INPUT_MAX_BYTES", 50 * 1024 * 1024))
+INPUT_DOWNLOAD_TIMEOUT_S = int(os.environ.get("INPUT_DOWNLOAD_TIMEOUT_S", 60))
+INPUT_DOWNLOAD_CHUNK_BYTES = int(os.environ.get("INPUT_DOWNLOAD_CHUNK_BYTES", 256 * 1024))
+# Hosts that input URLs may reach even though they resolve to private or loopback addresses
+INPUT_ALLOWED_HOSTS = tuple(host.strip().lower() for host in os.environ.get("INPUT_ALLOWED_HOSTS", "").split(",") if host.strip())
+INPUT_BUCKET_ENDPOINT_URL = os.environ.get("INPUT_BUCKET_ENDPOINT_URL", os.environ.get("BUCKET_ENDPOINT_URL"))
+INPUT_BUCKET_ACCESS_KEY_ID = os.environ.get("INPUT_BUCKET_ACCESS_KEY_ID", os.environ.get("BUCKET_ACCESS_KEY_ID"))
+INPUT_BUCKET_SECRET_ACCESS_KEY = os.environ.get("INPUT_BUCKET_SECRET_ACCESS_KEY", os.environ.get("BUCKET_SECRET_ACCESS_KEY"))
+
+# Output: "frames" returns base64 PNGs, any key of VIDEO_FORMATS returns one encoded video
+OUTPUT_FORMATS = ["frames"] + list(VIDEO_FORMATS)
+DEFAULT_VIDEO_FPS = 32  # Matches CreateVideo node 116
+
+# Output sink: "inline" returns base64 data, "s3" uploads to BUCKET_ENDPOINT_URL and
+# returns URLs, "auto" uploads only when the inline payload would exceed INLINE_MAX_BYTES
+OUTPUT_SINKS = ["inline", "s3", "auto"]
+OUTPUT_SINK = os.environ.get("OUTPUT_SINK", "inline").lower()
+INLINE_MAX_BYTES = int(os.environ.get("INLINE_MAX_BYTES", 10 * 1024 * 1024))
+OUTPUT_BUCKET_NAME = os.environ.get("OUTPUT_BUCKET_NAME")
+OUTPUT_UPLOAD_WORKERS = int(os.environ.get("OUTPUT_UPLOAD_WORKERS", 8))
+OUTPUT_MULTIPART_THRESHOLD_MB = int(os.environ.get("OUTPUT_MULTIPART_THRESHOLD_MB", 8))
+OUTPUT_URL_EXPIRY_S = int(os.environ.get("OUTPUT_URL_EXPIRY_S", 604800))
+
 
 # -----------------------------
 # Utility Functions
 # -----------------------------
 
-def check_server(url, retries=COMFY_API_AVAILABLE_MAX_RETRIES, delay=COMFY_API_AVAILABLE_INTERVAL_MS):
-    """Poll ComfyUI server until available."""
-    for _ in range(retries):
-        try:
-            response = requests.get(url, timeout=5)
-            if response.status_code == 200:
-                return True
-        except Exception:
-            pass
-        time.sleep(delay / 1000)
-    return False
-
-def upload_base64_image(base64_string, filename):
-    """Upload base64 image to ComfyUI."""
-    try:
-        if not base64_string:
-            return False
+# Content-addressed images known to exist in ComfyUI's input directory
+upload_index = UploadIndex(COMFY_INPUT_PATH)
+# Cold start phases: registry compilation at import, the rest in the background once the worker starts
+cold_start = PhaseTimer()
+with cold_start.phase("registry_load"):
+    workflow_registry = WorkflowRegistry.load(WORKFLOW_REGISTRY_FILE)
+readiness = Readiness(
+    lambda: probe_server(),  # defined below
+    max_delay=COMFY_API_AVAILABLE_INTERVAL_MS / 1000,
+    ttl=COMFY_READY_TTL_S,
+)
+result_cache = ResultCache(RESULT_CACHE_DIR, RESULT_CACHE_MAX_MB * 1024 * 1024, RESULT_CACHE_TTL_S)
+retention = RetentionManager(
+    {"input": COMFY_INPUT_PATH, "output": COMFY_OUTPUT_PATH, "temp": COMFY_TEMP_PATH},
+    lambda prompt_id: delete_history(prompt_id),  # defined below
+    CLEANUP_JOB_FILES,
+    RETENTION_MAX_MB * 1024 * 1024,
+    RETENTION_MAX_AGE_S,
+)
+residency = ResidencyManager(
+    lambda: get_system_stats(),  # defined below
+    lambda: get_queue(),
+    lambda request: free_comfy_memory(request),
+    RESIDENCY_MIN_FREE_VRAM_FRACTION,
+    RESIDENCY_MIN_FREE_RAM_FRACTION,
+    RESIDENCY_SETTLE_S,
+)
+
+# One websocket per worker; events are routed to jobs by prompt_id
+websocket.enableTrace(WEBSOCKET_TRACE)
+comfy_events = ComfyEventClient(
+    COMFY_HOST, WEBSOCKET_RECONNECT_ATTEMPTS, WEBSOCKET_RECONNECT_DELAY_S, heartbeat=WEBSOCKET_HEARTBEAT_S
+)
+
+# Worker-wide metrics, aggregated over all jobs
+metrics = MetricsRegistry()
+JOBS_TOTAL = metrics.counter("comfy_worker_jobs_total", "Jobs finished, by status.")
+FAILURES_TOTAL = metrics.counter("comfy_worker_failures_total", "Failed jobs, by the phase or cause of failure.")
+PHASE_SECONDS = metrics.histogram("comfy_worker_phase_seconds", "Time spent per job phase.")
+NODE_SECONDS = metrics.histogram("comfy_worker_node_seconds", "ComfyUI execution time per workflow node.")
+INPUT_BYTES_TOTAL = metrics.counter("comfy_worker_input_bytes_total", "Input image bytes, by whether they were uploaded or already known.")
+UPLOAD_CACHE_TOTAL = metrics.counter("comfy_worker_upload_cache_total", "Input image uploads, by content-hash cache result.")
+OUTPUT_BYTES_TOTAL = metrics.counter("comfy_worker_output_bytes_total", "Output bytes returned inline or uploaded, by sink.")
+FRAMES_TOTAL = metrics.counter("comfy_worker_frames_total", "Frames delivered.")
+COLD_START_SECONDS = metrics.histogram("comfy_worker_cold_start_seconds", "Worker cold start time per phase.")
+COMFY_FREE_TOTAL = metrics.counter("comfy_worker_comfy_free_total", "Memory freed on ComfyUI between jobs, by request.")
+RESULT_CACHE_TOTAL = metrics.counter("comfy_worker_result_cache_total", "Result cache lookups of deterministic jobs, by result.")
+
+trace_writer = TraceWriter(TRACE_DIR, TRACE_MAX_MB * 1024 * 1024, TRACE_MAX_FILES)
+
+_session = None
+_session_lock = threading.Lock()
+# Total GPU memory of this worker, read from /system_stats by the first job that needs it
+_device_vram_gb = None
+# Per-worker memory settings of each workflow (e.g. block swap), picked by its first job and then kept
+_worker_memory = {}
+
+def get_session():
+    """Return the shared keep-alive session used for ComfyUI requests."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(WORKER_CONCURRENCY * FRAME_FETCH_WORKERS, 10))
+            _session.mount("http://", adapter)
+        return _session
 
-        base64_string = base64_string.strip()
-        if "," in base64_string:
-            base64_string = base64_string.split(",", 1)[1]
+def probe_server():
+    """One readiness request to ComfyUI over the pooled session."""
+    return get_session().get(f"http://{COMFY_HOST}/", timeout=5).status_code == 200
 
-        image_data = base64.b64decode(base64_string)
-        files = {"image": (filename, BytesIO(image_data), "image/png")}
+def check_server(timeout=COMFY_READY_TIMEOUT_S):
+    """Wait until ComfyUI is available. Readiness is shared by concurrent jobs and cached between them."""
+    return readiness.wait(timeout)
+
+def decode_base64_image(base64_string):
+    """
+    Decode a base64 image, stripping an optional data URI prefix.
+
+    The string is decoded in fixed-size chunks straight into one buffer, so
+    multi-MB inputs are not copied by strip()/split() first. Whitespace and
+    line breaks inside the payload are ignored.
+    """
+    output = bytearray()
+    carry = ""
+    for offset in range(base64_string.find(",") + 1, len(base64_string), BASE64_DECODE_CHUNK):
+        chunk = carry + "".join(base64_string[offset:offset + BASE64_DECODE_CHUNK].split())
+        usable = len(chunk) - len(chunk) % 4
+        output += binascii.a2b_base64(chunk[:usable])
+        carry = chunk[usable:]
+    if carry:
+        raise binascii.Error("Incorrect padding")
+    return output
+
+def upload_image_bytes(image_data, filename, mime_type="image/png"):
+    """Upload raw image bytes to ComfyUI's input directory."""
+    try:
+        files = {"image": (filename, BytesIO(image_data), mime_type)}
         data = {"overwrite": "true"}
 
-        response = requests.post(f"http://{COMFY_HOST}/upload/image", files=files, data=data, timeout=30)
+        response = get_session().post(f"http://{COMFY_HOST}/upload/image", files=files, data=data, timeout=30)
         response.raise_for_status()
         return True
     except Exception as e:
         print(f"Error uploading {filename}: {e}")
         return False
 
+def new_upload_stats():
+    """Per-job counters for content-addressed uploads."""
+    return {"hits": 0, "misses": 0, "bytes_uploaded": 0, "bytes_saved": 0}
+
+_input_bucket_client = None
+
+def get_input_bucket_client():
+    """Return a boto3 client for s3:// inputs, or None when no bucket is configured."""
+    global _input_bucket_client
+    if _input_bucket_client is None and INPUT_BUCKET_ENDPOINT_URL:
+        _input_bucket_client, _ = rp_upload.get_boto_client({
+            "endpointUrl": INPUT_BUCKET_ENDPOINT_URL,
+            "accessId": INPUT_BUCKET_ACCESS_KEY_ID,
+            "accessSecret": INPUT_BUCKET_SECRET_ACCESS_KEY,
+        })
+    return _input_bucket_client
+
+def download_input_image(url):
+    """Download an input image from an http(s) or s3:// URL in chunks, enforcing INPUT_MAX_BYTES."""
+    scheme = urllib.parse.urlparse(url).scheme.lower()
+    if scheme in ("http", "https"):
+        return fetch_http(url, get_session(), INPUT_MAX_BYTES, INPUT_DOWNLOAD_TIMEOUT_S, INPUT_DOWNLOAD_CHUNK_BYTES,
+                          INPUT_ALLOWED_HOSTS)
+    if scheme == "s3":
+        return fetch_s3(url, get_input_bucket_client(), INPUT_MAX_BYTES, INPUT_DOWNLOAD_CHUNK_BYTES)
+    raise InputFetchError(f"unsupported URL scheme '{scheme}', use http, https or s3")
+
+def read_input_image(source):
+    """Return the raw bytes of an input image given as a base64 string or {"url": ...}. Returns (data, error)."""
+    if isinstance(source, dict):
+        try:
+            return download_input_image(source["url"]), None
+        except InputFetchError as e:
+            print(f"Error downloading input image: {e}")
+            return None, str(e)
+
+    try:
+        if not source:
+            return None, "no image data"
+        return decode_base64_image(source), None
+    except Exception as e:
+        print(f"Error decoding input image: {e}")
+        return None, f"invalid base64 ({e})"
+
+_upload_stats_lock = threading.Lock()
+
+def upload_input_image(source, stats, target_size=None, files=None):
+    """
+    Upload an input image under a content-addressed filename.
+
+    ``source`` is a base64 string or ``{"url": ...}`` for http(s)/s3 inputs.
+
+    Images already present on the ComfyUI input side are not re-uploaded, and
+    because the LoadImage input stays identical ComfyUI can serve the load and
+    encode nodes from its cache. With ``target_size`` the image is verified and
+    downsized to cover that (width, height) before upload. The image is held
+    for the job of ``files`` (a retention JobFiles) so cleanup doesn't remove it.
+
+    Returns (filename, error); filename is None on failure.
+    """
+    image_data, error = read_input_image(source)
+    if error:
+        return None, error
+
+    original_size = len(image_data)
+    extension, mime_type = detect_image_type(image_data)
+    variant = ""
+    if target_size:
+        try:
+            resize = needs_resize(image_size(image_data), target_size)
+        except ImagePreprocessError as e:
+            return None, str(e)
+        if resize:
+            variant = "{}x{}".format(*target_size)
+            extension, mime_type = resized_type(extension)
+
+    filename = content_filename(image_data, extension, variant)
+    if files is not None:
+        retention.hold(files, filename)
+    if upload_index.contains(filename):
+        with _upload_stats_lock:
+            stats["hits"] += 1
+            stats["bytes_saved"] += original_size
+        return filename, None
+
+    if variant:
+        try:
+            image_data = preprocess_image(image_data, target_size, extension)
+        except ImagePreprocessError as e:
+            return None, str(e)
+        print(f"Downsized input image from {original_size} to {len(image_data)} bytes")
+
+    if not upload_image_bytes(image_data, filename, mime_type):
+        return None, "upload to ComfyUI failed"
+    upload_index.add(filename)
+    with _upload_stats_lock:
+        stats["misses"] += 1
+        stats["bytes_uploaded"] += len(image_data)
+        stats["bytes_saved"] += original_size - len(image_data)
+    return filename, None
+
+def upload_input_images(images, stats, target_size=None, files=None):
+    """Download/decode and upload several input images concurrently. Returns a list of (filename, error)."""
+    with ThreadPoolExecutor(max_workers=max(1, len(images)), thread_name_prefix="upload") as executor:
+        futures = [executor.submit(upload_input_image, image, stats, target_size, files) for image in images]
+        return [future.result() for future in futures]
+
+_output_bucket_client = None
+
+def get_output_bucket_client():
+    """Return a boto3 client for BUCKET_ENDPOINT_URL, or None when it is not configured."""
+    global _output_bucket_client
+    if _output_bucket_client is None:
+        _output_bucket_client, _ = rp_upload.get_boto_client()
+    return _output_bucket_client
+
+def create_output_sink(job_id):
+    """Create an S3 sink that stores outputs under the job ID, or None without a bucket."""
+    client = get_output_bucket_client()
+    if client is None:
+        return None
+    return S3OutputSink(
+        client,
+        OUTPUT_BUCKET_NAME or time.strftime("%m-%y"),  # Same default bucket as rp_upload
+        job_id,
+        workers=OUTPUT_UPLOAD_WORKERS,
+        multipart_threshold=OUTPUT_MULTIPART_THRESHOLD_MB * 1024 * 1024,
+        url_expiry=OUTPUT_URL_EXPIRY_S,
+    )
+
 def get_history(prompt_id):
     """Fetch workflow execution history."""
-    response = requests.get(f"http://{COMFY_HOST}/history/{prompt_id}", timeout=30)
+    response = get_session().get(f"http://{COMFY_HOST}/history/{prompt_id}", timeout=30)
     response.raise_for_status()
     return response.json()
 
+def delete_history(prompt_id):
+    """Remove a prompt's entry from ComfyUI's /history."""
+    response = get_session().post(f"http://{COMFY_HOST}/history", json={"delete": [prompt_id]}, timeout=10)
+    response.raise_for_status()
+
+def get_system_stats():
+    """ComfyUI's /system_stats: RAM of the host and memory of each device."""
+    response = get_session().get(f"http://{COMFY_HOST}/system_stats", timeout=5)
+    response.raise_for_status()
+    return response.json()
+
+def get_queue():
+    """ComfyUI's /queue: running and pending prompts."""
+    response = get_session().get(f"http://{COMFY_HOST}/queue", timeout=5)
+    response.raise_for_status()
+    return response.json()
+
+def free_comfy_memory(request):
+    """Ask ComfyUI to unload models and/or drop its node cache (``unload_models``/``free_memory``)."""
+    response = get_session().post(f"http://{COMFY_HOST}/free", json=request, timeout=10)
+    response.raise_for_status()
+    COMFY_FREE_TOTAL.inc(request="free_memory" if request.get("free_memory") else "unload_models")
+
 def get_image_data(filename, subfolder, image_type):
     """Fetch image/gif/video bytes from ComfyUI."""
     data = {"filename": filename, "subfolder": subfolder, "type": image_type}
     url_values = urllib.parse.urlencode(data)
     try:
-        response = requests.get(f"http://{COMFY_HOST}/view?{url_values}", timeout=60)
+        response = get_session().get(f"http://{COMFY_HOST}/view?{url_values}", timeout=60)
         response.raise_for_status()
         return response.content
     except Exception as e:
@@ -82,8 +452,9 @@ def queue_workflow(workflow, client_id):
     """Submit workflow to ComfyUI."""
     payload = {"prompt": workflow, "client_id": client_id}
     data = json.dumps(payload).encode("utf-8")
+    print(f"Sending workflow to ComfyUI ({len(data)} bytes)")
     headers = {"Content-Type": "application/json"}
-    response = requests.post(f"http://{COMFY_HOST}/prompt", data=data, headers=headers, timeout=30)
+    response = get_session().post(f"http://{COMFY_HOST}/prompt", data=data, headers=headers, timeout=30)
 
     # If error, capture the response body for debugging
     if response.status_code != 200:
@@ -97,254 +468,1085 @@ def queue_workflow(workflow, client_id):
 
     return response.json()
 
-def generate_random_filename(extension=".png"):
-    """Generate random filename for uploaded images."""
-    return "".join(random.choices(string.ascii_lowercase + string.digits, k=10)) + extension
+def truncate_prompt(prompt):
+    """Shorten prompts for the response metadata."""
+    return prompt[:100] + "..." if len(prompt) > 100 else prompt
+
+def parse_bool(value, default=False):
+    """Parse a boolean input given as bool, number or string."""
+    if value is None:
+        return default
+    if isinstance(value, str):
+        return value.strip().lower() in ("1", "true", "yes", "on")
+    return bool(value)
+
+def parse_int(value, default, minimum, maximum):
+    """Parse an integer input, falling back to the default and clamping to range."""
+    try:
+        parsed = int(value)
+    except (ValueError, TypeError):
+        parsed = default
+    return max(minimum, min(maximum, parsed))
 
 # -----------------------------
-# Handler Function
+# Job Pipeline
 # -----------------------------
 
-def handler(job):
-    # 1. Robust Health Check (Prevents deployment failures due to empty test jobs)
-    if not job or "input" not in job or not job.get("input"):
-        if check_server(f"http://{COMFY_HOST}/", COMFY_API_AVAILABLE_MAX_RETRIES, COMFY_API_AVAILABLE_INTERVAL_MS):
-            return {"status": "success", "message": "ComfyUI server is ready (test/health-check request)"}
+def parse_job_input(job_input):
+    """Normalize and validate job input. Returns (params, error)."""
+    normalized_input = {k.strip(): v for k, v in job_input.items()}
+
+    # Optional: Workflow template from the registry (default: Wan2.2 interpolation)
+    workflow, error = workflow_registry.get(normalized_input.get("workflow_name"))
+    if error:
+        return None, {"error": error}
+
+    # Workflow parameters (prompts, steps, resolution, seed, ...) are validated by its bindings
+    values, error = workflow.validate(normalized_input)
+    if error:
+        return None, {"error": error}
+
+    # Optional: Variants, each overriding some workflow parameters (seed, steps, prompts, ...)
+    variants = None
+    deterministic = [workflow.deterministic(normalized_input)]
+    if normalized_input.get("variants") is not None:
+        variants, error = parse_variants(workflow, normalized_input)
+        if error:
+            return None, {"error": error}
+        deterministic = [
+            workflow.deterministic(dict(normalized_input, **{k.strip(): v for k, v in overrides.items()}))
+            for overrides in normalized_input["variants"]
+        ]
+
+    # Optional: Reuse the cached output of an identical job (only when the seed is set explicitly)
+    use_cache = parse_bool(normalized_input.get("cache"), RESULT_CACHE)
+
+    # Optional: Frames per streamed chunk (only used by the streaming handler)
+    chunk_size = parse_int(normalized_input.get("chunk_size", STREAM_CHUNK_SIZE), STREAM_CHUNK_SIZE, 1, STREAM_CHUNK_SIZE_MAX)
+
+    # Optional: Downsize input images to the target resolution before upload
+    preresize = parse_bool(normalized_input.get("preresize"), PRERESIZE_INPUTS)
+
+    # Optional: Send low-resolution latent previews with progress updates while sampling
+    previews = parse_bool(normalized_input.get("previews"), PREVIEWS_ENABLED)
+
+    # Optional: Where outputs go ("inline", "s3" or "auto")
+    output_sink = str(normalized_input.get("output_sink", OUTPUT_SINK)).strip().lower()
+    if output_sink not in OUTPUT_SINKS:
+        return None, {"error": f"Unsupported output_sink '{output_sink}'. Available: {', '.join(OUTPUT_SINKS)}"}
+
+    # Optional: Output format ("frames", "mp4" or "webm") and video encoding settings
+    output_format = str(normalized_input.get("output_format", "frames")).strip().lower()
+    if output_format not in OUTPUT_FORMATS:
+        return None, {"error": f"Unsupported output_format '{output_format}'. Available: {', '.join(OUTPUT_FORMATS)}"}
+
+    codec = None
+    crf = None
+    fps = parse_int(normalized_input.get("fps", DEFAULT_VIDEO_FPS), DEFAULT_VIDEO_FPS, 1, 120)
+    if output_format in VIDEO_FORMATS:
+        video_format = VIDEO_FORMATS[output_format]
+        codec = str(normalized_input.get("codec") or video_format["default_codec"]).strip().lower()
+        if codec not in video_format["codecs"]:
+            return None, {"error": f"Unsupported codec '{codec}' for {output_format}. Available: {', '.join(video_format['codecs'])}"}
+        crf_default, crf_min, crf_max = video_format["crf"]
+        crf = parse_int(normalized_input.get("crf", crf_default), crf_default, crf_min, crf_max)
+
+    # Required: Input images (base64 encoded, or http(s)/s3 URLs)
+    image_names = workflow.image_params()
+    images = {}
+    for name in image_names:
+        image_url = normalized_input.get(f"{name}_url")
+        image_b64 = normalized_input.get(f"{name}_base64")
+        for key, value in ((f"{name}_url", image_url), (f"{name}_base64", image_b64)):
+            if value and not isinstance(value, str):
+                return None, {"error": f"{key} must be a string."}
+        if image_url or image_b64:
+            images[name] = {"url": image_url.strip()} if image_url else image_b64
+    if len(images) < len(image_names):
+        base64_names = " and ".join(f"{name}_base64" for name in image_names)
+        url_names = " and ".join(f"{name}_url" for name in image_names)
+        return None, {"error": f"{base64_names} (or {url_names}) are required."}
+
+    params = {
+        "workflow": workflow,
+        "values": values,
+        "variants": variants,
+        "cacheable": [use_cache and flag for flag in deterministic],
+        "images": images,
+        "chunk_size": chunk_size,
+        "preresize": preresize,
+        "previews": previews,
+        "output_sink": output_sink,
+        "output_format": output_format,
+        "codec": codec,
+        "crf": crf,
+        "fps": fps,
+    }
+    return params, None
+
+def parse_variants(workflow, normalized_input):
+    """
+    Validate the ``variants`` list. Returns (list of parameter values, error).
+
+    Each variant is an object overriding some of the job's workflow
+    parameters; everything it doesn't set is taken from the job input.
+    """
+    variants = normalized_input["variants"]
+    if not isinstance(variants, list) or not variants or not all(isinstance(v, dict) for v in variants):
+        return None, "variants must be a non-empty list of parameter objects."
+    if len(variants) > MAX_VARIANTS:
+        return None, f"Too many variants ({len(variants)}), the maximum is {MAX_VARIANTS}."
+
+    allowed = [name for name, binding in workflow.bindings.items() if binding.type != "image"]
+    variant_values = []
+    for idx, overrides in enumerate(variants):
+        overrides = {k.strip(): v for k, v in overrides.items()}
+        unknown = [name for name in overrides if name not in allowed]
+        if unknown:
+            return None, f"Variant {idx}: unsupported parameter(s) {', '.join(unknown)}. Available: {', '.join(allowed)}"
+        values, error = workflow.validate(dict(normalized_input, **overrides))
+        if error:
+            return None, f"Variant {idx}: {error}"
+        variant_values.append(values)
+    return variant_values, None
+
+def build_workflow(params, image_filenames, values=None):
+    """
+    Render the job's workflow from its compiled template with the uploaded image filenames.
+
+    The output node's ``filename_prefix`` gets a suffix unique to this prompt.
+    ComfyUI would otherwise serve an identical prompt's save node from its
+    cache and report the files of the earlier job, which deletes them when
+    it finishes; the rest of the graph is still served from the cache.
+    """
+    values = values or params["values"]
+    workflow = params["workflow"]
+    overrides = worker_memory_overrides(workflow)
+    if "memory_profile" in values:
+        overrides += workflow.memory_profiles.overrides(values["memory_profile"])
+    prefix = workflow.template[workflow.output_node].get("inputs", {}).get("filename_prefix")
+    if isinstance(prefix, str):
+        overrides.append((workflow.output_node, "filename_prefix", f"{prefix}_{uuid.uuid4().hex[:8]}"))
+    return workflow.render(dict(values, **image_filenames), overrides)
+
+def device_vram():
+    """GPU memory in GiB from ComfyUI's /system_stats, read once per worker. None while unknown."""
+    global _device_vram_gb
+    if _device_vram_gb is None:
+        try:
+            _device_vram_gb = device_vram_gb(get_system_stats())
+        except Exception as e:
+            print(f"Could not read GPU memory from /system_stats: {e}")
+    return _device_vram_gb
+
+def worker_memory_overrides(workflow):
+    """
+    Memory settings a workflow's ``memory_profiles`` picks once per worker from the GPU.
+
+    These feed the model loaders, so they are kept for the worker's lifetime:
+    changing them between jobs would make ComfyUI load the models again.
+    """
+    if not MEMORY_PROFILES or workflow.memory_profiles is None:
+        return []
+    if workflow.name not in _worker_memory:
+        _worker_memory[workflow.name] = workflow.memory_profiles.worker_overrides(device_vram())
+    return list(_worker_memory[workflow.name])
+
+def with_memory_profile(workflow, values):
+    """
+    Add the memory profile for a job's size and the GPU to its values as ``memory_profile``.
+
+    The name ends up in the metadata and the result cache key; ``build_workflow``
+    writes the profile's settings into the prompt.
+    """
+    dimensions = job_dimensions(values)
+    if not MEMORY_PROFILES or workflow.memory_profiles is None or dimensions is None:
+        return values
+    profile = workflow.memory_profiles.select(megapixel_frames(dimensions, values.get("frame_length", 1)), device_vram())
+    if profile is None:
+        return values
+    return dict(values, memory_profile=profile["name"])
+
+def poll_history(prompt_id):
+    """Check /history for a finished prompt. Returns (done, outputs, error)."""
+    try:
+        prompt_history = get_history(prompt_id).get(prompt_id)
+    except Exception as e:
+        print(f"History poll failed for prompt {prompt_id}: {e}")
+        return False, None, None
+    if not prompt_history:
+        return False, None, None
+    status = prompt_history.get("status", {})
+    if status.get("status_str") == "error":
+        return True, None, {"error": f"Workflow execution error: {status.get('messages', [])}"}
+    return True, prompt_history.get("outputs", {}), None
+
+def prompt_running(prompt_id):
+    """Whether ComfyUI's /queue lists the prompt as running (False if the queue can't be read)."""
+    try:
+        return queue_position(get_queue(), prompt_id) == "running"
+    except Exception as e:
+        print(f"Queue check failed for prompt {prompt_id}: {e}")
+        return False
+
+def job_dimensions(values):
+    """Output (width, height) of a job's workflow parameters, or None if the workflow doesn't set them."""
+    if "resolution" in values:
+        return resolution_to_dimensions(values["resolution"])
+    if "width" in values and "height" in values:
+        return values["width"], values["height"]
+    return None
+
+def job_deadline(values):
+    """Execution deadline in seconds for a job's workflow parameters."""
+    return execution_deadline(
+        values, job_dimensions(values), EXECUTION_TIMEOUT_BASE_S, EXECUTION_TIMEOUT_PER_UNIT_S,
+        EXECUTION_TIMEOUT_MIN_S, EXECUTION_TIMEOUT_MAX_S, EXECUTION_TIMEOUT_S,
+    )
+
+def stop_prompt(prompt_id):
+    """Interrupt or dequeue a prompt the job is no longer waiting for."""
+    try:
+        action = cancel_prompt(get_session(), COMFY_HOST, prompt_id)
+        if action:
+            print(f"Prompt {prompt_id} {action} on ComfyUI")
+    except Exception as e:
+        print(f"Failed to stop prompt {prompt_id}: {e}")
+
+def create_progress_tracker(job, workflow, previews=False, variant=None):
+    """
+    Progress reporter for a RunPod job, or None when updates are disabled or there is no job id.
+
+    Updates of variant jobs carry the ``variant`` index they belong to.
+    """
+    if not PROGRESS_UPDATES or not job.get("id"):
+        return None
+    preview_encoder = PreviewEncoder(PREVIEW_MAX_SIZE, PREVIEW_QUALITY, PREVIEW_INTERVAL_S) if previews else None
+    if variant is None:
+        report = lambda progress: runpod.serverless.progress_update(job, progress)
+    else:
+        report = lambda progress: runpod.serverless.progress_update(job, dict(progress, variant=variant))
+    return ProgressTracker(
+        workflow.stages,
+        report,
+        PROGRESS_UPDATE_INTERVAL_S,
+        previews=preview_encoder,
+    )
+
+def submit_workflow(workflow, previews=False, timer=None, files=None, cancelled=None):
+    """
+    Queue a workflow and register for its websocket events. Returns (prompt_id, waiter).
+
+    The prompt is only queued once ``prompt_gate`` lets it through (backpressure
+    on ComfyUI's queue and RAM); the wait is recorded as the ``backpressure``
+    phase, and PromptCancelled is raised if ``cancelled`` is set meanwhile.
+    The prompt is recorded on ``files`` so its history entry is removed
+    after the job.
+    """
+    timer = timer or PhaseTimer()
+    comfy_events.ensure_connected()
+    gate_started = timer.clock()
+    with prompt_gate.admit(cancelled):
+        timer.record("backpressure", gate_started, timer.clock())
+        with timer.phase("queue"):
+            queue_resp = queue_workflow(workflow, comfy_events.client_id)
+    prompt_id = queue_resp["prompt_id"]
+    if files is not None:
+        files.add_prompt(prompt_id)
+    waiter = comfy_events.register(prompt_id, previews=previews)
+    print(f"Workflow queued successfully. Prompt ID: {prompt_id}")
+    return prompt_id, waiter
+
+def release_prompt(prompt_id):
+    """Stop listening for a prompt's events and remove it from ComfyUI."""
+    comfy_events.unregister(prompt_id)
+    stop_prompt(prompt_id)
+
+def execution_failed(e):
+    """
+    Error for an unexpected failure while running a workflow. When ComfyUI
+    can't be reached (it may have crashed and be restarting), the cached
+    readiness is dropped so the next job waits for it again.
+    """
+    if isinstance(e, (ConnectionError, requests.ConnectionError)):
+        readiness.invalidate()
+    return {"error": f"Execution failed: {e}", "traceback": traceback.format_exc()}
+
+def execute_workflow(workflow, timeout_seconds=EXECUTION_TIMEOUT_S, cancelled=None, progress=None, timer=None,
+                     submitted=None, files=None):
+    """
+    Queue the workflow and wait for completion. Returns (outputs, error).
+
+    ``submitted`` is the ``(prompt_id, waiter)`` of a workflow already queued
+    with ``submit_workflow``; only the wait happens here then. Otherwise the
+    prompt is recorded on ``files`` (a retention JobFiles) when queued.
+
+    Completion is signalled over the worker's shared websocket; while it is
+    disconnected the job polls ``/history`` instead. If the deadline passes,
+    ``cancelled`` (a threading.Event) is set or waiting fails, the prompt is
+    interrupted or removed from ComfyUI's queue so it doesn't hold the GPU.
+    The ``timeout_seconds`` deadline starts when the prompt starts running
+    (its first ``executing``/``execution_cached`` event, or ``/queue`` listing
+    it as running while polling); until then it may wait in ComfyUI's queue
+    for up to ``QUEUE_TIMEOUT_S``.
+    Node and step events are passed to ``progress`` (a ProgressTracker).
+    Queue, wait-in-queue, execution, per-node and history fetch times are
+    recorded on ``timer`` (a PhaseTimer).
+    """
+    timer = timer or PhaseTimer()
+    prompt_id = None
+    finished = False
+    try:
+        if submitted:
+            prompt_id, waiter = submitted
         else:
-            return {"error": "ComfyUI server failed to start within the timeout period."}
+            prompt_id, waiter = submit_workflow(
+                workflow, progress is not None and progress.previews is not None, timer, files, cancelled
+            )
+        if progress:
+            progress.queued()
 
-    job_input = job.get("input")
+        # Wait for completion with timeout
+        poll_interval = COMFY_API_AVAILABLE_INTERVAL_MS / 1000
+        timer.current = "execution"
+        queued_at = timer.clock()
+        node, node_started, execution_started = None, None, None
+        class_types = {node_id: node_data.get("class_type") for node_id, node_data in workflow.items()}
 
-    # 2. Parse and Validate Inputs
-    normalized_input = {k.strip(): v for k, v in job_input.items()}
+        while True:
+            # Check timeout and cancellation
+            if execution_started is None:
+                if timer.clock() - queued_at > QUEUE_TIMEOUT_S:
+                    return None, {"error": f"Workflow execution timeout: waited in ComfyUI's queue for more than {QUEUE_TIMEOUT_S:.0f}s"}
+            elif timer.clock() - execution_started > timeout_seconds:
+                return None, {"error": f"Workflow execution timeout after {timeout_seconds:.0f}s"}
+            if cancelled is not None and cancelled.is_set():
+                return None, {"error": "Workflow execution cancelled"}
+
+            msg = waiter.get(timeout=poll_interval)
+            if msg is None:
+                if not comfy_events.connected:
+                    # Socket is down: reconnect if possible, otherwise poll history
+                    if not comfy_events.ensure_connected():
+                        done, outputs, error = poll_history(prompt_id)
+                        if done:
+                            finished = True
+                            return outputs, error
+                        if execution_started is None and prompt_running(prompt_id):
+                            execution_started = timer.clock()
+                            timer.record("queue_wait", queued_at, execution_started)
+                continue
 
-    # Required: Start and end images (base64 encoded)
-    start_image_b64 = normalized_input.get("start_image_base64")
-    end_image_b64 = normalized_input.get("end_image_base64")
+            if msg["type"] == "preview":
+                if progress:
+                    progress.preview(msg["data"]["image"])
+                continue
+            if progress:
+                progress.update(msg)
+            now = timer.clock()
+            if execution_started is None and msg["type"] in ("executing", "execution_cached"):
+                execution_started = now
+                timer.record("queue_wait", queued_at, now)
 
-    # Optional: Prompts for AI-guided video generation
-    positive_prompt = normalized_input.get("positive_prompt", "")
-    negative_prompt = normalized_input.get("negative_prompt",
-        "low quality, lowres, bad hands, extra limbs, missing fingers, poorly drawn face, bad anatomy, blurred, jpeg artifacts, deformed, ugly, bad proportions, disfigured, watermark, text, logo, signature")
+            if msg["type"] == "executing":
+                if node is not None:
+                    timer.node(node, node_started, now, class_types.get(node))
+                node, node_started = msg["data"]["node"], now
+                if msg["data"]["node"] is None:
+                    timer.record("execution", execution_started, now)
+                    print(f"Workflow execution completed for prompt {prompt_id}")
+                    finished = True
+                    break  # Done
+            elif msg["type"] == "executed":
+                # Output nodes report completion directly; close the span here instead of at the next node
+                if msg["data"].get("node") == node:
+                    timer.node(node, node_started, now, class_types.get(node))
+                    node = None
+            elif msg["type"] == "execution_cached":
+                timer.cached_nodes([str(node_id) for node_id in msg["data"].get("nodes", [])], now, class_types)
+            elif msg["type"] == "execution_error":
+                finished = True
+                return None, {"error": f"Workflow execution error: {msg.get('data', {})}"}
+            elif msg["type"] == "execution_interrupted":
+                finished = True
+                return None, {"error": "Workflow execution interrupted"}
+            elif msg["type"] in ("disconnected", "reconnected"):
+                # Completion may have been missed while the socket was down
+                done, outputs, error = poll_history(prompt_id)
+                if done:
+                    finished = True
+                    return outputs, error
+
+        print(f"Fetching results for prompt {prompt_id}...")
+        with timer.phase("history_fetch"):
+            history = get_history(prompt_id)
+        prompt_history = history.get(prompt_id, {})
+        return prompt_history.get("outputs", {}), None
 
-    # Optional: Steps (default 8, range 4-20)
+    except PromptCancelled as e:
+        return None, {"error": str(e)}
+    except Exception as e:
+        return None, execution_failed(e)
+    finally:
+        if prompt_id:
+            comfy_events.unregister(prompt_id)
+            if not finished:
+                stop_prompt(prompt_id)
+
+def get_frame_items(outputs, output_node="117"):
+    """List the image entries written by the workflow's output node (SaveImage 117 by default)."""
+    node_output = outputs.get(output_node, {})
+    return node_output.get("images", [])
+
+def read_local_image(filename, subfolder, image_type):
+    """Memory-map an output file from ComfyUI's directories when it is visible locally."""
+    roots = {"output": COMFY_OUTPUT_PATH, "temp": COMFY_TEMP_PATH, "input": COMFY_INPUT_PATH}
+    path = resolve_output_path(filename, subfolder, image_type, roots)
+    if path is None:
+        return None
+    return read_mapped(path)
+
+def fetch_frame(item):
+    """Fetch a single frame described by a history image entry, preferring the local filesystem."""
+    fname = item.get("filename", "")
+    subfolder = item.get("subfolder", "")
+    ftype = item.get("type", "output")
+
+    if COMFY_DIRECT_READ:
+        content = read_local_image(fname, subfolder, ftype)
+        if content is not None:
+            return content
+    return get_image_data(fname, subfolder, ftype)
+
+def encode_frame(content):
+    """Base64 encode frame bytes (or a mapped file) for the JSON response."""
     try:
-        steps = int(normalized_input.get("steps", 8))
-    except (ValueError, TypeError):
-        steps = 8
-    steps = max(4, min(20, steps))
+        return base64.b64encode(content).decode("utf-8")
+    finally:
+        release(content)
+
+def iter_frames(items, transform=None):
+    """
+    Fetch frames in parallel, yielding (index, result) in output order.
 
-    # Optional: Resolution (default 640)
+    Frames that still fail after retries are skipped with a warning. When
+    ``transform`` is given it is applied in the fetch threads.
+    """
+    fetcher = FrameFetcher(
+        fetch_frame,
+        workers=FRAME_FETCH_WORKERS,
+        retries=FRAME_FETCH_RETRIES,
+        backoff_ms=FRAME_FETCH_BACKOFF_MS,
+        transform=transform,
+    )
+    yield from fetcher.fetch(items)
+
+def encode_video(items, params, timer=None):
+    """
+    Encode frames into a single video while they are being fetched.
+
+    Returns (video_bytes, frame_count, error).
+    """
+    timer = timer or PhaseTimer()
+    encoder = VideoEncoder(params["output_format"], params["codec"], params["crf"], params["fps"])
+    write_frame = timer.timed("encode", encoder.write_frame)
     try:
-        resolution = int(normalized_input.get("resolution", 640))
-    except (ValueError, TypeError):
-        resolution = 640
-    resolution = max(480, min(1080, resolution))
+        with encoder:
+            for _, content in iter_frames(items):
+                try:
+                    write_frame(content)
+                finally:
+                    release(content)
+            if not encoder.frame_count:
+                return None, 0, None
+            video = timer.timed("encode", encoder.finish)()
+    except VideoEncoderError as e:
+        return None, 0, {"error": f"Video encoding failed: {e}"}
+    return video, encoder.frame_count, None
 
-    # Optional: Frame length (default 65, range 17-129)
+def stream_video_output(items, params, sink, timer=None, name="output"):
+    """Encode the video, then return it inline or upload it (as ``<name>.<format>``) when the sink calls for it."""
+    video, frame_count, error = encode_video(items, params, timer)
+    if error:
+        yield error
+        return
+    if not frame_count:
+        return
+
+    print(f"Encoded {frame_count} frames into {len(video)} byte {params['output_format']} video")
+    if sink and (params["output_sink"] == "s3" or len(video) > INLINE_MAX_BYTES):
+        try:
+            video_file = sink.upload(f"{name}.{params['output_format']}", video, f"video/{params['output_format']}")
+        except OutputSinkError as e:
+            yield {"error": f"Output upload failed: {e}"}
+            return
+        yield {"video_file": video_file}
+        yield {"status": "completed", "frame_count": frame_count, "output_sink": "s3"}
+        return
+
+    yield {"video": base64.b64encode(video).decode("utf-8"), "size_bytes": len(video)}
+    yield {"status": "completed", "frame_count": frame_count, "output_sink": "inline"}
+
+def stream_frame_output(items, params, sink, timer=None):
+    """
+    Yield frames in chunks, inline as base64 or as uploaded files.
+
+    In "auto" mode the first fetched frame decides: when its size times the
+    frame count would push the inline response over INLINE_MAX_BYTES, every
+    frame is uploaded instead.
+    """
+    upload = sink is not None and params["output_sink"] == "s3"
+    decide = sink is not None and params["output_sink"] == "auto"
+    encode = (timer or PhaseTimer()).timed("encode", encode_frame)
+    # Inline frames are base64 encoded in the fetch threads unless the mode is still undecided
+    frames = iter_frames(items, transform=None if upload or decide else encode)
+
+    sent = 0
+    chunk = []
+    key = "frame_files" if upload else "frames"
+    for idx, content in frames:
+        if decide:
+            decide = False
+            estimate = len(content) * 4 // 3 * len(items)
+            upload = estimate > INLINE_MAX_BYTES
+            key = "frame_files" if upload else "frames"
+            print(f"Estimated inline output {estimate} bytes, {'uploading' if upload else 'returning'} frames")
+
+        if upload:
+            frame_format = params["workflow"].frame_format
+            sink.submit(items[idx].get("filename", f"frame_{idx:05d}.{frame_format}"), content, f"image/{frame_format}")
+            chunk.extend(sink.completed())
+        else:
+            chunk.append(content if isinstance(content, str) else encode(content))
+
+        while len(chunk) >= params["chunk_size"]:
+            yield {key: chunk[:params["chunk_size"]], "index": sent}
+            sent += params["chunk_size"]
+            chunk = chunk[params["chunk_size"]:]
+
+    if upload:
+        chunk.extend(sink.completed(wait=True))
+    while chunk:
+        batch, chunk = chunk[:params["chunk_size"]], chunk[params["chunk_size"]:]
+        yield {key: batch, "index": sent}
+        sent += len(batch)
+
+    if sent:
+        print(f"Successfully generated {sent} frames")
+        yield {"status": "completed", "frame_count": sent, "output_sink": "s3" if upload else "inline"}
+
+def build_metadata(params, frame_count, uploads=None, values=None):
+    """Describe the generated output for the response."""
+    workflow = params["workflow"]
+    metadata = {
+        "workflow": workflow.name,
+        "format": workflow.frame_format if params["output_format"] == "frames" else params["output_format"],
+        "frame_count": frame_count,
+    }
+    for name, value in (values or params["values"]).items():
+        metadata[name] = truncate_prompt(value) if isinstance(value, str) else value
+    if uploads is not None:
+        metadata["uploads"] = uploads
+    if params["output_format"] in VIDEO_FORMATS:
+        metadata.update({"codec": params["codec"], "crf": params["crf"], "fps": params["fps"]})
+    return metadata
+
+def result_key(params, values, image_filenames):
+    """Result cache key of one workflow run: template version, input image hashes, parameters and output encoding."""
+    workflow = params["workflow"]
+    return cache_key({
+        "workflow": workflow.name,
+        "version": workflow.version,
+        "images": image_filenames,
+        "values": values,
+        "output": [params["output_format"], params["codec"], params["crf"], params["fps"], params["chunk_size"]],
+    })
+
+def lookup_result(key):
+    """Open the cached items of a deterministic run, or None on a miss (or when the run isn't cacheable)."""
+    if key is None:
+        return None
+    entry = result_cache.get(key)
+    RESULT_CACHE_TOTAL.inc(result="miss" if entry is None else "hit")
+    return entry
+
+def replay_result(entry, upload_stats, timer, variant=None):
+    """Yield the cached items of a run as if it had just executed."""
+    for item in entry:
+        if "metadata" in item:
+            item["metadata"].update(uploads=upload_stats, cache="hit")
+        if item.get("status") == "completed":
+            item["timings"] = timer.as_dict()
+            print(f"Served cached result ({item['frame_count']} frames), cache stats: {result_cache.stats()}")
+        if variant is not None:
+            item["variant"] = variant
+        yield item
+
+def write_result(writer, item):
+    """Add an item to a pending cache entry. Returns the writer, or None once the entry was dropped."""
+    if "frame_files" in item or "video_file" in item or "error" in item:
+        # Uploaded outputs are URLs that expire; only inline results are reused
+        writer.abort()
+        return None
     try:
-        frame_length = int(normalized_input.get("frame_length", 65))
-    except (ValueError, TypeError):
-        frame_length = 65
-    frame_length = max(17, min(129, frame_length))
+        writer.write(item)
+        return writer
+    except (OSError, TypeError, ValueError) as e:
+        print(f"Result cache write failed: {e}")
+        writer.abort()
+        return None
 
-    # Optional: Random seed (0 = random)
+def commit_result(writer):
     try:
-        seed = int(normalized_input.get("seed", 0))
-    except (ValueError, TypeError):
-        seed = 0
-    if seed == 0:
-        seed = random.randint(0, 2**32 - 1)
+        writer.commit()
+    except OSError as e:
+        print(f"Result cache write failed: {e}")
+        writer.abort()
+
+def execute_job(job, timer, cancelled=None, files=None):
+    """
+    Run a job end to end, yielding its output incrementally.
+
+    Yields a single ``{"metadata": ...}`` item once the workflow has finished,
+    followed by ``{"frames": [...], "index": n}`` chunks of base64 PNGs as they
+    are fetched (or a single ``{"video": ..., "size_bytes": n}`` item for video
+    output formats), and a closing ``{"status": "completed", "frame_count": n}``.
+    When outputs are sent to object storage the chunks carry ``frame_files``
+    (or a single ``video_file``) with URLs, sizes and checksums instead.
+    Any failure is yielded as an ``{"error": ...}`` item and ends the stream.
+    Jobs with ``variants`` queue all their workflows first and then yield
+    this sequence once per variant, each item tagged with its ``variant``.
+    Phase timings are recorded on ``timer`` (a PhaseTimer). Setting
+    ``cancelled`` (a threading.Event) stops the job and its ComfyUI prompt.
+    Input images, prompts and outputs are recorded on ``files`` (a retention
+    JobFiles) for cleanup once the job is done.
+    """
+    # 1. Robust Health Check (Prevents deployment failures due to empty test jobs)
+    if not job or "input" not in job or not job.get("input"):
+        if check_server():
+            yield {
+                "status": "success",
+                "message": "ComfyUI server is ready (test/health-check request)",
+                "cold_start": startup.timings(),
+                "last_free": residency.last,
+            }
+        else:
+            yield {"error": "ComfyUI server failed to start within the timeout period."}
+        return
+
+    # 2. Parse and Validate Inputs
+    params, error = parse_job_input(job.get("input"))
+    if error:
+        yield error
+        return
 
-    # Validate required inputs
-    if not start_image_b64 or not end_image_b64:
-        return {"error": "start_image_base64 and end_image_base64 are required."}
+    output_sink = None
+    if params["output_sink"] != "inline":
+        output_sink = create_output_sink(job.get("id", "local"))
+        if output_sink is None and params["output_sink"] == "s3":
+            yield {"error": "output_sink 's3' requires BUCKET_ENDPOINT_URL, BUCKET_ACCESS_KEY_ID and BUCKET_SECRET_ACCESS_KEY to be set."}
+            return
 
     # 3. Check Server
-    if not check_server(f"http://{COMFY_HOST}/", COMFY_API_AVAILABLE_MAX_RETRIES, COMFY_API_AVAILABLE_INTERVAL_MS):
-        return {"error": "ComfyUI server unreachable."}
+    with timer.phase("server_check"):
+        server_ready = check_server()
+    if not server_ready:
+        yield {"error": "ComfyUI server unreachable."}
+        return
 
     # 4. Upload Images
-    start_filename = generate_random_filename()
-    end_filename = generate_random_filename()
+    target_size = None
+    if params["preresize"]:
+        if preprocess_available():
+            resolution = params["values"].get("resolution")
+            target_size = resolution_to_dimensions(resolution) if resolution else None
+        else:
+            print("Warning: preresize requested but Pillow is not installed, uploading original images")
+
+    upload_stats = new_upload_stats()
+    image_names = list(params["images"])
+    with timer.phase("upload"):
+        results = upload_input_images([params["images"][name] for name in image_names], upload_stats, target_size, files)
+    record_upload_metrics(upload_stats)
+    image_filenames = {}
+    for name, (filename, upload_error) in zip(image_names, results):
+        if not filename:
+            yield {"error": f"Failed to upload {name.replace('_', ' ')}: {upload_error}"}
+            return
+        image_filenames[name] = filename
 
-    if not upload_base64_image(start_image_b64, start_filename):
-        return {"error": "Failed to upload start image"}
-    if not upload_base64_image(end_image_b64, end_filename):
-        return {"error": "Failed to upload end image"}
+    # 5-6. Render the compiled workflow template with the job parameters (once per variant)
+    with timer.phase("workflow_patch"):
+        variants = [with_memory_profile(params["workflow"], values) for values in params["variants"] or [params["values"]]]
+        workflows = [build_workflow(params, image_filenames, values) for values in variants]
 
-    # 5. Load Workflow
+    # Deterministic runs that were already done are served from the result cache
+    with timer.phase("cache_lookup"):
+        keys = [
+            result_key(params, values, image_filenames) if cacheable else None
+            for values, cacheable in zip(variants, params["cacheable"])
+        ]
+        cached = [lookup_result(key) for key in keys]
+
+    # 7-8. Execute each workflow and stream its results
+    submitted = [None] * len(workflows)
     try:
-        with open(WORKFLOW_FILE, 'r') as f:
-            workflow = json.load(f)
-    except Exception as e:
-        return {"error": f"Failed to load workflow file: {e}"}
-
-    # 6. Modify Workflow Nodes (with validation)
-
-    # Validate workflow structure
-    if not isinstance(workflow, dict):
-        return {"error": "Invalid workflow structure - must be a dictionary"}
-
-    # Node 148: Start Image
-    if "148" not in workflow:
-        return {"error": "Node 148 (Start Image) not found in workflow"}
-    workflow["148"]["inputs"]["image"] = start_filename
-
-    # Node 149: End Image
-    if "149" not in workflow:
-        return {"error": "Node 149 (End Image) not found in workflow"}
-    workflow["149"]["inputs"]["image"] = end_filename
-
-    # Node 134: Positive Prompt
-    if "134" not in workflow:
-        return {"error": "Node 134 (Positive Prompt) not found in workflow"}
-    workflow["134"]["inputs"]["text"] = positive_prompt
-
-    # Node 137: Negative Prompt
-    if "137" not in workflow:
-        return {"error": "Node 137 (Negative Prompt) not found in workflow"}
-    workflow["137"]["inputs"]["text"] = negative_prompt
-
-    # Node 150: Steps
-    if "150" not in workflow:
-        return {"error": "Node 150 (Steps) not found in workflow"}
-    workflow["150"]["inputs"]["value"] = steps
-
-    # Node 151: Split Step (half of total steps)
-    split_step = steps // 2
-    if "151" not in workflow:
-        return {"error": "Node 151 (Split Step) not found in workflow"}
-    workflow["151"]["inputs"]["value"] = split_step
-
-    # Node 147: Resolution
-    if "147" not in workflow:
-        return {"error": "Node 147 (Resolution) not found in workflow"}
-    workflow["147"]["inputs"]["value"] = resolution
-
-    # Node 156: WanVideoImageToVideoEncode (dimensions and frame length)
-    if "156" not in workflow:
-        return {"error": "Node 156 (WanVideoImageToVideoEncode) not found in workflow"}
-
-    # Calculate width/height based on resolution (using 16:9 aspect ratio)
-    if resolution <= 480:
-        width, height = 854, 480
-    elif resolution <= 640:
-        width, height = 1138, 640
-    elif resolution <= 720:
-        width, height = 1280, 720
-    else:  # 1080
-        width, height = 1920, 1080
-
-    workflow["156"]["inputs"]["width"] = width
-    workflow["156"]["inputs"]["height"] = height
-    workflow["156"]["inputs"]["num_frames"] = frame_length
-    workflow["156"]["inputs"]["length"] = frame_length
-
-    # Node 139: WanVideoSampler HIGH (seed, end_step)
-    # Note: steps is connected via node 150, not set directly
-    if "139" not in workflow:
-        return {"error": "Node 139 (WanVideoSampler HIGH) not found in workflow"}
-    workflow["139"]["inputs"]["seed"] = seed
-    workflow["139"]["inputs"]["end_step"] = split_step
-
-    # Node 140: WanVideoSampler LOW (seed, start_step)
-    # Note: steps is connected via node 150, not set directly
-    if "140" not in workflow:
-        return {"error": "Node 140 (WanVideoSampler LOW) not found in workflow"}
-    workflow["140"]["inputs"]["seed"] = seed
-    workflow["140"]["inputs"]["start_step"] = split_step
+        if params["variants"]:
+            # Queue every variant up front so ComfyUI runs them back to back, reusing
+            # cached loader and text encode outputs that are identical between them
+            try:
+                for idx, workflow in enumerate(workflows):
+                    if cached[idx] is None:
+                        submitted[idx] = submit_workflow(workflow, params["previews"], timer, files, cancelled)
+            except PromptCancelled as e:
+                yield {"error": str(e)}
+                return
+            except Exception as e:
+                yield execution_failed(e)
+                return
+
+        for idx, (workflow, values) in enumerate(zip(workflows, variants)):
+            prompt, submitted[idx] = submitted[idx], None
+            variant = idx if params["variants"] else None
+            if cached[idx] is not None:
+                entry, cached[idx] = cached[idx], None
+                yield from replay_result(entry, upload_stats, timer, variant)
+                continue
+            completed = yield from execute_variant(
+                job, params, workflow, values, prompt, upload_stats, output_sink, timer, cancelled, variant, keys[idx],
+                files,
+            )
+            if not completed:
+                return
+    finally:
+        # Prompts of variants that never ran (failure or cancellation) are removed from ComfyUI
+        for prompt in submitted:
+            if prompt:
+                release_prompt(prompt[0])
+        for entry in cached:
+            if entry is not None:
+                entry.close()
+        if output_sink:
+            output_sink.close()
+
+def execute_variant(job, params, workflow, values, submitted, upload_stats, output_sink, timer, cancelled=None,
+                    variant=None, cache_key=None, files=None):
+    """
+    Wait for one workflow and stream its output (see ``execute_job``). Returns True once completed.
+
+    Items of variant jobs are tagged with their ``variant`` index. With a
+    ``cache_key`` the items are also written to the result cache, which
+    keeps them only if the job completes with inline output. The prompt and
+    its output files are recorded on ``files`` for cleanup.
+    """
+    writer = result_cache.writer(cache_key) if cache_key else None
+
+    def tagged(item):
+        nonlocal writer
+        if writer is not None:
+            writer = write_result(writer, item)
+        if variant is not None:
+            item["variant"] = variant
+        return item
 
     # 7. Execute Workflow
-    client_id = str(uuid.uuid4())
-    ws = None
+    progress = create_progress_tracker(job, params["workflow"], params["previews"], variant)
+    with timer.span("execute_workflow"):
+        outputs, error = execute_workflow(
+            workflow, job_deadline(values), cancelled=cancelled, progress=progress, timer=timer, submitted=submitted,
+            files=files,
+        )
+    if outputs and files is not None:
+        retention.hold_outputs(files, outputs)
+    if error:
+        yield tagged(error)
+        return False
+    if progress:
+        progress.finish()
+
+    # 8. Fetch Results - Stream interpolated frames from the workflow's output node (SaveImage 117)
+    items = get_frame_items(outputs, params["workflow"].output_node)
+    if not items:
+        yield tagged({"error": "No interpolated frames generated", "details": str(outputs), "node_outputs": list(outputs.keys())})
+        return False
+
+    print(f"Found {len(items)} frames to process")
+    metadata = build_metadata(params, len(items), uploads=upload_stats, values=values)
+    if cache_key:
+        metadata["cache"] = "miss"
+    yield tagged({"metadata": metadata})
+
+    if params["output_format"] in VIDEO_FORMATS:
+        output = stream_video_output(items, params, output_sink, timer, "output" if variant is None else f"output_{variant}")
+    else:
+        output = stream_frame_output(items, params, output_sink, timer)
+
+    completed = False
+    timer.current = "frame_fetch"
+    output_started = timer.clock()
     try:
-        ws_url = f"ws://{COMFY_HOST}/ws?clientId={client_id}"
-        ws = websocket.WebSocket()
-        ws.connect(ws_url, timeout=10)
+        while True:
+            # Only time spent producing output counts, not time the consumer holds the generator
+            start = timer.clock()
+            item = next(output, None)
+            timer.add("frame_fetch", timer.clock() - start)
+            if item is None:
+                break
+            if cancelled is not None and cancelled.is_set():
+                yield tagged({"error": "Job cancelled"})
+                return False
+            completed = item.get("status") == "completed"
+            item = tagged(item)
+            if completed:
+                if writer is not None:
+                    commit_result(writer)
+                    writer = None
+                item["timings"] = timer.as_dict()
+            yield item
+            if "error" in item:
+                return False
+    except OutputSinkError as e:
+        yield tagged({"error": f"Output upload failed: {e}"})
+        return False
+    except Exception as e:
+        yield tagged({"error": f"Execution failed: {e}", "traceback": traceback.format_exc()})
+        return False
+    finally:
+        if writer is not None:
+            writer.abort()
+        if timer.trace:
+            timer.trace.add_span("output", output_started, timer.clock())
 
-        # Debug: Log workflow structure (first 500 chars)
-        workflow_str = json.dumps(workflow)
-        print(f"Sending workflow to ComfyUI ({len(workflow_str)} chars): {workflow_str[:500]}...")
+    if not completed:
+        yield tagged({"error": "No interpolated frames generated", "details": str(outputs), "node_outputs": list(outputs.keys())})
+    return completed
 
-        queue_resp = queue_workflow(workflow, client_id)
-        prompt_id = queue_resp["prompt_id"]
+def record_upload_metrics(stats):
+    INPUT_BYTES_TOTAL.inc(stats["bytes_uploaded"], result="uploaded")
+    INPUT_BYTES_TOTAL.inc(stats["bytes_saved"], result="skipped")
+    UPLOAD_CACHE_TOTAL.inc(stats["hits"], result="hit")
+    UPLOAD_CACHE_TOTAL.inc(stats["misses"], result="miss")
 
-        print(f"Workflow queued successfully. Prompt ID: {prompt_id}")
+def record_output_metrics(item):
+    """Count frames and bytes of one output item."""
+    if "frames" in item:
+        OUTPUT_BYTES_TOTAL.inc(sum(len(frame) for frame in item["frames"]), sink="inline")
+    elif "frame_files" in item:
+        OUTPUT_BYTES_TOTAL.inc(sum(frame["size_bytes"] for frame in item["frame_files"]), sink="s3")
+    elif "video" in item:
+        OUTPUT_BYTES_TOTAL.inc(len(item["video"]), sink="inline")
+    elif "video_file" in item:
+        OUTPUT_BYTES_TOTAL.inc(item["video_file"]["size_bytes"], sink="s3")
+    elif item.get("status") == "completed":
+        FRAMES_TOTAL.inc(item["frame_count"])
 
-        # Poll for completion with timeout
-        start_time = time.time()
-        timeout_seconds = 1200  # 20 minutes max
+def failure_cause(error, timer):
+    """Label for a failed job: the phase it failed in, or timeout/invalid_input."""
+    if str(error.get("error", "")).startswith("Workflow execution timeout"):
+        return "timeout"
+    return timer.current or "invalid_input"
 
-        while True:
-            # Check timeout
-            if time.time() - start_time > timeout_seconds:
-                return {"error": f"Workflow execution timeout after {timeout_seconds}s"}
+def record_job_metrics(timer, status):
+    JOBS_TOTAL.inc(status=status)
+    for name, seconds in list(timer.phases.items()):
+        PHASE_SECONDS.observe(seconds, phase=name)
+    for node_id, seconds in list(timer.nodes.items()):
+        NODE_SECONDS.observe(seconds, node=node_id)
 
-            try:
-                out = ws.recv()
-                if isinstance(out, str):
-                    msg = json.loads(out)
-                    if msg["type"] == "executing":
-                        data = msg["data"]
-                        if data["node"] is None and data["prompt_id"] == prompt_id:
-                            print(f"Workflow execution completed for prompt {prompt_id}")
-                            break  # Done
-                    elif msg["type"] == "execution_error":
-                        return {"error": f"Workflow execution error: {msg.get('data', {})}"}
-            except Exception as e:
-                print(f"WebSocket receive error: {e}")
-                continue
-        # 8. Fetch Results - Extract all interpolated frames
-        print(f"Fetching results for prompt {prompt_id}...")
-        history = get_history(prompt_id)
-        prompt_history = history.get(prompt_id, {})
-        outputs = prompt_history.get("outputs", {})
-
-        # Extract frames from SaveImage node 117
-        frames = []
-        node_output = outputs.get("117", {})
-
-        if "images" in node_output:
-            print(f"Found {len(node_output['images'])} frames to process")
-            for idx, item in enumerate(node_output["images"]):
-                fname = item.get("filename", "")
-                ftype = item.get("type", "output")
-                subfolder = item.get("subfolder", "")
-
-                content = get_image_data(fname, subfolder, ftype)
-                if content:
-                    frames.append(base64.b64encode(content).decode("utf-8"))
-                else:
-                    print(f"Warning: Failed to fetch frame {idx+1}/{len(node_output['images'])}: {fname}")
-
-        if not frames:
-            return {"error": "No interpolated frames generated", "details": str(outputs), "node_outputs": list(outputs.keys())}
-
-        print(f"Successfully generated {len(frames)} frames")
-        return {
-            "frames": frames,
-            "metadata": {
-                "format": "png",
-                "frame_count": len(frames),
-                "steps": steps,
-                "resolution": resolution,
-                "frame_length": frame_length,
-                "seed": seed,
-                "positive_prompt": positive_prompt[:100] + "..." if len(positive_prompt) > 100 else positive_prompt,
-                "negative_prompt": negative_prompt[:100] + "..." if len(negative_prompt) > 100 else negative_prompt
-            }
-        }
+def trace_requested(job):
+    job_input = (job or {}).get("input") or {}
+    return parse_bool(job_input.get("trace"), TRACE_JOBS) if isinstance(job_input, dict) else TRACE_JOBS
 
+def write_trace(trace):
+    try:
+        path = trace_writer.write(trace)
+        print(f"Wrote job trace to {path}")
     except Exception as e:
-        return {"error": f"Execution failed: {e}", "traceback": traceback.format_exc()}
+        print(f"Failed to write job trace: {e}")
+
+def run_job(job, timer=None, cancelled=None):
+    """
+    Run a job (see ``execute_job``), recording its timings and outcome in the worker metrics.
+
+    The closing ``{"status": "completed"}`` item carries a ``timings`` block in
+    milliseconds per phase (and per workflow node under ``nodes``). Traced jobs
+    are written to TRACE_DIR as Chrome trace_event JSON. Once the job is done
+    its files and history entries are cleaned up (see ``RetentionManager``) and
+    ComfyUI's memory is checked in the background (see ``ResidencyManager``).
+    """
+    timer = timer or PhaseTimer()
+    if timer.trace is None and trace_requested(job):
+        timer.trace = JobTrace((job or {}).get("id", "local"))
+    job_started = timer.clock()
+    status = "failed"
+    files = retention.begin()
+    try:
+        for item in execute_job(job, timer, cancelled, files):
+            if "error" in item:
+                FAILURES_TOTAL.inc(cause=failure_cause(item, timer))
+            elif item.get("status") in ("completed", "success"):
+                status = item["status"]
+            record_output_metrics(item)
+            yield item
     finally:
-        if ws:
-            ws.close()
+        with timer.phase("cleanup"):
+            retention.finish(files)
+        # Only jobs that ran a prompt can have changed ComfyUI's memory
+        if RESIDENCY_MANAGER and files.prompt_ids:
+            residency.after_job()
+        record_job_metrics(timer, status)
+        if timer.trace:
+            timer.trace.add_span("job", job_started, timer.clock(), args={"status": status})
+            write_trace(timer.trace)
+
+# -----------------------------
+# Handler Function
+# -----------------------------
+
+def handler(job, cancelled=None):
+    """
+    Run a job and return all frames (or the encoded video) in a single response.
+
+    Jobs with ``variants`` return ``{"variants": [...]}`` with one such result per variant.
+    """
+    results = {}
+    timer = PhaseTimer()
+    response_build = 0.0
+    for item in run_job(job, timer, cancelled):
+        build_start = timer.clock()
+        if "error" in item or "message" in item:
+            return item
+        result = results.setdefault(item.get("variant"), {"frames": [], "frame_files": []})
+        if "metadata" in item:
+            result["metadata"] = item["metadata"]
+        elif "frames" in item:
+            result["frames"].extend(item["frames"])
+        elif "frame_files" in item:
+            result["frame_files"].extend(item["frame_files"])
+        elif "video" in item:
+            result["video"] = item["video"]
+            result["metadata"]["size_bytes"] = item["size_bytes"]
+        elif "video_file" in item:
+            result["video_file"] = item["video_file"]
+            result["metadata"]["size_bytes"] = item["video_file"]["size_bytes"]
+        elif item.get("status") == "completed":
+            result["metadata"]["frame_count"] = item["frame_count"]
+            result["metadata"]["output_sink"] = item["output_sink"]
+        response_build += timer.clock() - build_start
+
+    build_start = timer.clock()
+    for result in results.values():
+        if "video" in result or "video_file" in result or result["frame_files"]:
+            del result["frames"]
+        if "frames" in result or "video" in result or "video_file" in result:
+            del result["frame_files"]
+    # Recorded after run_job has reported the job's other phases
+    response_build += timer.clock() - build_start
+    timer.add("response_build", response_build)
+    PHASE_SECONDS.observe(response_build, phase="response_build")
+    timings = timer.as_dict()
+    for result in results.values():
+        result["metadata"]["timings"] = timings
+    if None in results:
+        return results[None]
+    return {"variants": [results[idx] for idx in sorted(results)]}
+
+def stream_handler(job):
+    """Generator handler: yields metadata first, then frames in chunks as they are fetched."""
+    yield from run_job(job)
+
+async def async_handler(job):
+    """
+    Async wrapper around ``handler`` for concurrent jobs.
+
+    The job runs in a worker thread so several jobs can upload, wait on
+    ComfyUI's queue and fetch results at the same time. Cancelling the task
+    interrupts the job's prompt on ComfyUI.
+    """
+    cancelled = threading.Event()
+    try:
+        return await asyncio.to_thread(handler, job, cancelled)
+    except asyncio.CancelledError:
+        cancelled.set()
+        raise
+
+async def async_stream_handler(job):
+    """
+    Async generator version of ``stream_handler``; each item is produced in a worker thread.
+
+    The items come from one thread per job, so when the consumer stops early
+    the job's generator is closed there once the item in progress is done,
+    which runs its cleanup (retention, residency) right away.
+    """
+    cancelled = threading.Event()
+    items = run_job(job, cancelled=cancelled)
+    thread = ThreadPoolExecutor(max_workers=1, thread_name_prefix="stream")
+    loop = asyncio.get_running_loop()
+    try:
+        while True:
+            item = await loop.run_in_executor(thread, next, items, None)
+            if item is None:
+                break
+            yield item
+    except (asyncio.CancelledError, GeneratorExit):
+        cancelled.set()
+        raise
+    finally:
+        await loop.run_in_executor(thread, items.close)
+        thread.shutdown(wait=False)
+
+def probe_backpressure():
+    """Running and pending prompts in ComfyUI's queue and the free RAM fraction, for the prompt gate."""
+    queue_state = get_queue()
+    return len(queue_state.get("queue_running", [])), pending_prompts(queue_state), free_ram_fraction(get_system_stats())
+
+def wait_for_comfy():
+    if not check_server():
+        print("ComfyUI not ready after the startup timeout, jobs will keep checking")
+
+def record_cold_start():
+    for name, seconds in list(cold_start.phases.items()):
+        COLD_START_SECONDS.observe(seconds, phase=name)
+
+# Runs while ComfyUI boots, so the first job finds the session, readiness and websocket in place
+startup = StartupPipeline([
+    ("session_open", get_session),
+    ("comfy_boot", wait_for_comfy),
+    ("websocket_connect", comfy_events.ensure_connected),
+], cold_start, on_done=record_cold_start)
+
+prompt_gate = PromptGate(probe_backpressure, MAX_PENDING_PROMPTS, MIN_FREE_RAM_FRACTION, BACKPRESSURE_PROBE_INTERVAL_S)
+
+def concurrency_modifier(current_concurrency):
+    """
+    Constant job concurrency for RunPod.
+
+    Backpressure is applied by ``prompt_gate`` inside the job instead: each
+    change of RunPod's target waits for every running job to finish, which
+    would leave the GPU idle between batches.
+    """
+    return WORKER_CONCURRENCY
 
 # -----------------------------
 # Entrypoint
 # -----------------------------
 
 if __name__ == "__main__":
-    runpod.serverless.start({"handler": handler})
+    if SERVE_API_LOCALLY:
+        metrics.serve(METRICS_PORT)
+    if RETENTION_SWEEP_INTERVAL_S > 0:
+        retention.start_sweeper(RETENTION_SWEEP_INTERVAL_S)
+    startup.start()
+    if WORKER_CONCURRENCY > 1:
+        if STREAM_OUTPUT:
+            runpod.serverless.start({
+                "handler": async_stream_handler,
+                "return_aggregate_stream": True,
+                "concurrency_modifier": concurrency_modifier,
+            })
+        else:
+            runpod.serverless.start({"handler": async_handler, "concurrency_modifier": concurrency_modifier})
+    elif STREAM_OUTPUT:
+        runpod.serverless.start({"handler": stream_handler, "return_aggregate_stream": True})
+    else:
+        runpod.serverless.start({"handler": handler})
@@ -0,0 +1,244 @@
+import json
+import queue
+import threading
+import time
+import uuid
+
+import websocket
+
+from src.previews import parse_preview_frame
+
+# Message types routed to the waiter of the prompt they belong to
+PROMPT_EVENTS = ("executing", "progress", "executed", "execution_cached", "execution_error", "execution_interrupted")
+
+# Events that arrive before their prompt is registered (fast cached runs) are kept briefly
+EARLY_EVENT_LIMIT = 256
+
+
+class PromptWaiter:
+    """Events of one prompt, delivered by the reader thread. Preview frames only when ``previews`` is set."""
+
+    def __init__(self, prompt_id, previews=False):
+        self.prompt_id = prompt_id
+        self.previews = previews
+        self.events = queue.Queue()
+
+    def put(self, event):
+        self.events.put(event)
+
+    def get(self, timeout):
+        """Next event, or None when nothing arrived within ``timeout`` seconds."""
+        try:
+            return self.events.get(timeout=timeout)
+        except queue.Empty:
+            return None
+
+
+class ComfyEventClient:
+    """
+    One long-lived websocket to ComfyUI's ``/ws`` shared by all jobs of a worker.
+
+    A background reader thread parses messages and routes them by ``prompt_id``
+    to the waiter registered for that prompt, so jobs no longer open their own
+    connection. When the socket drops, waiters get a ``{"type": "disconnected"}``
+    event and the reader reconnects up to ``reconnect_attempts`` times, starting
+    ``reconnect_delay`` seconds apart and doubling up to ``max_reconnect_delay``.
+    While disconnected, ``connected`` is False and callers are expected to fall
+    back to polling ``/history``.
+
+    A socket that stays silent for ``heartbeat`` seconds is pinged; after
+    ``missed_heartbeats`` unanswered pings it is treated as dead, so a half-open
+    connection is noticed within ``heartbeat * (missed_heartbeats + 1)`` seconds.
+    """
+
+    def __init__(self, host, reconnect_attempts=5, reconnect_delay=3, connect_timeout=10, heartbeat=30,
+                 missed_heartbeats=2, max_reconnect_delay=30, ws_factory=websocket.WebSocket):
+        self.host = host
+        self.client_id = str(uuid.uuid4())
+        self.reconnect_attempts = reconnect_attempts
+        self.reconnect_delay = reconnect_delay
+        self.connect_timeout = connect_timeout
+        self.heartbeat = heartbeat
+        self.missed_heartbeats = missed_heartbeats
+        self.max_reconnect_delay = max_reconnect_delay
+        self.ws_factory = ws_factory
+        self._ws = None
+        self._waiters = {}
+        self._early = {}
+        self._executing = None
+        self._lock = threading.Lock()
+        self._connect_lock = threading.Lock()
+        self._reader = None
+        self._closed = False
+        self.connected = False
+
+    @property
+    def url(self):
+        return f"ws://{self.host}/ws?clientId={self.client_id}"
+
+    def _connect(self):
+        ws = self.ws_factory()
+        ws.connect(self.url, timeout=self.connect_timeout)
+        # recv() times out after a silent heartbeat interval so the reader can ping
+        ws.settimeout(self.heartbeat)
+        self._ws = ws
+        self.connected = True
+
+    def ensure_connected(self):
+        """
+        Connect and start the reader thread if needed. Returns True when the socket is up.
+
+        While the reader thread is alive it owns the socket, including
+        reconnecting after a drop, so this only reports whether it is connected.
+        A new socket is opened only once the reader has given up and exited.
+        """
+        with self._connect_lock:
+            if self._reader and self._reader.is_alive():
+                return self.connected
+            try:
+                self._connect()
+            except Exception as e:
+                print(f"WebSocket connection to {self.url} failed: {e}")
+                self.connected = False
+                return False
+            self._reader = threading.Thread(target=self._read_loop, name="comfy-events", daemon=True)
+            self._reader.start()
+            return True
+
+    def register(self, prompt_id, previews=False):
+        """Create the waiter for a prompt, replaying any events that arrived first."""
+        waiter = PromptWaiter(prompt_id, previews)
+        with self._lock:
+            self._waiters[prompt_id] = waiter
+            for event in self._early.pop(prompt_id, []):
+                waiter.put(event)
+        return waiter
+
+    def unregister(self, prompt_id):
+        with self._lock:
+            self._waiters.pop(prompt_id, None)
+            self._early.pop(prompt_id, None)
+
+    def dispatch(self, message):
+        """Route one parsed websocket message to its prompt's waiter."""
+        if message.get("type") not in PROMPT_EVENTS:
+            return
+        data = message.get("data") or {}
+        prompt_id = data.get("prompt_id")
+        if not prompt_id:
+            return
+        if message["type"] == "executing":
+            # Binary preview frames carry no prompt_id; they belong to the prompt currently executing
+            if data.get("node") is None:
+                if self._executing == prompt_id:
+                    self._executing = None
+            else:
+                self._executing = prompt_id
+        with self._lock:
+            waiter = self._waiters.get(prompt_id)
+            if waiter is None:
+                early = self._early.setdefault(prompt_id, [])
+                if len(early) < EARLY_EVENT_LIMIT:
+                    early.append(message)
+                if len(self._early) > EARLY_EVENT_LIMIT:
+                    self._early.pop(next(iter(self._early)))
+                return
+        waiter.put(message)
+
+    def dispatch_binary(self, data):
+        """Route a binary preview frame to the executing prompt, if its waiter asked for previews."""
+        preview = parse_preview_frame(data)
+        if preview is None:
+            return
+        image, metadata = preview
+        prompt_id = metadata.get("prompt_id") or self._executing
+        with self._lock:
+            waiter = self._waiters.get(prompt_id)
+        if waiter is not None and waiter.previews:
+            waiter.put({"type": "preview", "data": {"prompt_id": prompt_id, "node": metadata.get("node_id"), "image": image}})
+
+    def _broadcast(self, event):
+        with self._lock:
+            waiters = list(self._waiters.values())
+        for waiter in waiters:
+            waiter.put(event)
+
+    def _reconnect(self):
+        for attempt in range(1, self.reconnect_attempts + 1):
+            if self._closed:
+                return False
+            time.sleep(min(self.reconnect_delay * 2 ** (attempt - 1), self.max_reconnect_delay))
+            try:
+                self._connect()
+                print(f"WebSocket reconnected (attempt {attempt}/{self.reconnect_attempts})")
+                self._broadcast({"type": "reconnected"})
+                return True
+            except Exception as e:
+                print(f"WebSocket reconnect attempt {attempt}/{self.reconnect_attempts} failed: {e}")
+        return False
+
+    def _disconnected(self, reason):
+        """Handle a lost connection. Returns True when the reader should keep going."""
+        self.connected = False
+        if self._closed:
+            return False
+        print(f"WebSocket disconnected: {reason}")
+        try:
+            self._ws.close()
+        except Exception:
+            pass
+        self._broadcast({"type": "disconnected"})
+        if not self._reconnect():
+            print("WebSocket reconnect attempts exhausted, jobs fall back to history polling")
+            return False
+        return True
+
+    def _read_loop(self):
+        missed = 0
+        while not self._closed:
+            try:
+                opcode, data = self._ws.recv_data(control_frame=True)
+            except websocket.WebSocketTimeoutException:
+                missed += 1
+                if missed > self.missed_heartbeats:
+                    silent = self.heartbeat * missed
+                    missed = 0
+                    if not self._disconnected(f"no response for {silent}s"):
+                        return
+                    continue
+                try:
+                    self._ws.ping()
+                except Exception as e:
+                    if not self._disconnected(e):
+                        return
+                continue
+            except Exception as e:
+                missed = 0
+                if not self._disconnected(e):
+                    return
+                continue
+
+            missed = 0
+            if opcode == websocket.ABNF.OPCODE_CLOSE:
+                if not self._disconnected("closed by server"):
+                    return
+                continue
+            if opcode == websocket.ABNF.OPCODE_BINARY:
+                self.dispatch_binary(data)
+                continue
+            if opcode != websocket.ABNF.OPCODE_TEXT:
+                continue
+            try:
+                message = json.loads(data)
+            except ValueError:
+                continue
+            self.dispatch(message)
+
+    def close(self):
+        self._closed = True
+        self.connected = False
+        if self._ws:
+            try:
+                self._ws.close()
+            except Exception:
+                pass
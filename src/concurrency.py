@@ -0,0 +1,88 @@
+import threading
+import time
+from contextlib import contextmanager
+
+
+def pending_prompts(queue_state):
+    """Number of prompts waiting in ComfyUI's queue (not counting the one running)."""
+    return len(queue_state.get("queue_pending", []))
+
+
+def free_ram_fraction(system_stats):
+    """Free system RAM as a fraction of total from ComfyUI's /system_stats, or None if unknown."""
+    system = system_stats.get("system", {})
+    total = system.get("ram_total")
+    if not total:
+        return None
+    return system.get("ram_free", 0) / total
+
+
+def gpu_device(system_stats):
+    """The first GPU in ComfyUI's /system_stats ``devices``, or None if there is none."""
+    for device in system_stats.get("devices", []):
+        if device.get("type") != "cpu" and device.get("vram_total"):
+            return device
+    return None
+
+
+class PromptCancelled(Exception):
+    """The job was cancelled while waiting to queue its prompt."""
+
+
+class PromptGate:
+    """
+    Backpressure on prompts queued to ComfyUI.
+
+    The worker takes a constant number of jobs so one job's uploads and frame
+    fetching overlap another's GPU execution; ComfyUI's queue still runs
+    prompts one at a time. Before a job queues its prompt it passes ``admit``,
+    which waits while ComfyUI already has ``max_pending`` prompts waiting, or
+    free RAM is below ``min_free_ram`` while ComfyUI is busy (an idle ComfyUI
+    frees nothing by waiting). ``probe()`` returns ``(running, pending,
+    free_ram)`` and is called every ``probe_interval`` seconds while waiting;
+    if it fails, the prompt is let through. Jobs are admitted one at a time
+    and hold the gate until their prompt is queued, so the next job's probe
+    already counts it.
+    """
+
+    def __init__(self, probe, max_pending=1, min_free_ram=0.15, probe_interval=2.0, sleep=time.sleep):
+        self.probe = probe
+        self.max_pending = max_pending
+        self.min_free_ram = min_free_ram
+        self.probe_interval = probe_interval
+        self.sleep = sleep
+        self._lock = threading.Lock()
+
+    def under_pressure(self, running, pending, free_ram):
+        if pending >= self.max_pending:
+            return True
+        return bool(running or pending) and free_ram is not None and free_ram < self.min_free_ram
+
+    def wait(self, cancelled=None):
+        """Block until ComfyUI can take another prompt. Returns False if ``cancelled`` (a threading.Event) was set."""
+        waiting = False
+        while True:
+            if cancelled is not None and cancelled.is_set():
+                return False
+            try:
+                running, pending, free_ram = self.probe()
+            except Exception as e:
+                print(f"Backpressure probe failed, queueing anyway: {e}")
+                return True
+            if not self.under_pressure(running, pending, free_ram):
+                return True
+            if not waiting:
+                print(f"Waiting to queue prompt (pending prompts: {pending}, free RAM: {free_ram})")
+                waiting = True
+            if cancelled is not None:
+                cancelled.wait(self.probe_interval)
+            else:
+                self.sleep(self.probe_interval)
+
+    @contextmanager
+    def admit(self, cancelled=None):
+        """Hold the gate while a prompt is queued. Raises PromptCancelled if the job is cancelled while waiting."""
+        with self._lock:
+            if not self.wait(cancelled):
+                raise PromptCancelled("Workflow execution cancelled")
+            yield
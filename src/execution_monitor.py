@@ -0,0 +1,54 @@
+import json
+
+# Reference workload for the deadline estimate: one step of one 1280x720 frame
+REFERENCE_PIXELS = 1280 * 720
+
+
+def execution_deadline(values, dimensions, base_s, per_unit_s, minimum_s, maximum_s, default_s):
+    """
+    Seconds a prompt may run before it is interrupted.
+
+    The estimate scales with steps x frames x pixels (relative to a 720p
+    frame); workflows without those parameters get ``default_s``. The result
+    is clamped to ``[minimum_s, maximum_s]``.
+    """
+    steps = values.get("steps")
+    frames = values.get("frame_length", 1)
+    if not steps or dimensions is None:
+        return default_s
+    width, height = dimensions
+    units = steps * frames * (width * height) / REFERENCE_PIXELS
+    return max(minimum_s, min(maximum_s, base_s + units * per_unit_s))
+
+
+def queue_position(queue_state, prompt_id):
+    """Where a prompt sits in ComfyUI's /queue response: "running", "pending" or None."""
+    for state, key in (("running", "queue_running"), ("pending", "queue_pending")):
+        for entry in queue_state.get(key, []):
+            # Entries are [number, prompt_id, prompt, extra_data, outputs_to_execute]
+            if len(entry) > 1 and entry[1] == prompt_id:
+                return state
+    return None
+
+
+def cancel_prompt(session, host, prompt_id, timeout=10):
+    """
+    Stop a prompt on ComfyUI so it doesn't keep the GPU busy after the job gave up.
+
+    A pending prompt is deleted from the queue; a running one is interrupted
+    (targeted by prompt_id, which ComfyUI versions without targeted interrupts
+    ignore and apply to the running prompt). Returns what was done.
+    """
+    base_url = f"http://{host}"
+    headers = {"Content-Type": "application/json"}
+    response = session.get(f"{base_url}/queue", timeout=timeout)
+    response.raise_for_status()
+    position = queue_position(response.json(), prompt_id)
+
+    if position == "pending":
+        session.post(f"{base_url}/queue", data=json.dumps({"delete": [prompt_id]}), headers=headers, timeout=timeout).raise_for_status()
+        return "deleted"
+    if position == "running":
+        session.post(f"{base_url}/interrupt", data=json.dumps({"prompt_id": prompt_id}), headers=headers, timeout=timeout).raise_for_status()
+        return "interrupted"
+    return None
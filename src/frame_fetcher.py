@@ -0,0 +1,63 @@
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+
+class FrameFetcher:
+    """
+    Fetch output frames concurrently while preserving their order.
+
+    ``fetch_fn(item)`` returns the frame bytes or ``None`` (or raises) on failure. Failed
+    frames are retried individually with a linear backoff. An optional
+    ``transform`` (e.g. base64 encoding) runs in the worker thread right after
+    the download, so encoding overlaps with the remaining fetches. At most
+    ``workers * 2`` frames are in flight, which bounds memory use.
+    """
+
+    def __init__(self, fetch_fn, workers=8, retries=2, backoff_ms=200, transform=None):
+        self.fetch_fn = fetch_fn
+        self.workers = max(1, workers)
+        self.retries = max(0, retries)
+        self.backoff_ms = backoff_ms
+        self.transform = transform
+
+    def _fetch_one(self, item):
+        for attempt in range(self.retries + 1):
+            try:
+                content = self.fetch_fn(item)
+            except Exception as e:
+                print(f"Error fetching {item.get('filename', '')} (attempt {attempt+1}): {e}")
+                content = None
+            if content:
+                return self.transform(content) if self.transform else content
+            if attempt < self.retries:
+                time.sleep(self.backoff_ms * (attempt + 1) / 1000)
+        return None
+
+    def fetch(self, items):
+        """Yield (index, result) in item order for every frame that could be fetched."""
+        window = self.workers * 2
+        with ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="frame-fetch") as executor:
+            pending = deque()
+            items_iter = iter(enumerate(items))
+
+            def submit_next():
+                for idx, item in items_iter:
+                    pending.append((idx, item, executor.submit(self._fetch_one, item)))
+                    return
+
+            for _ in range(window):
+                submit_next()
+
+            while pending:
+                idx, item, future = pending.popleft()
+                try:
+                    result = future.result()
+                except Exception as e:
+                    print(f"Error fetching frame {idx+1}: {e}")
+                    result = None
+                submit_next()
+                if result is None:
+                    print(f"Warning: Failed to fetch frame {idx+1}/{len(items)}: {item.get('filename', '')}")
+                    continue
+                yield idx, result
@@ -0,0 +1,69 @@
+from io import BytesIO
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Pillow ships with ComfyUI; without it pre-processing is skipped
+    Image = None
+    ImageOps = None
+
+
+class ImagePreprocessError(Exception):
+    """Raised when an input image cannot be decoded."""
+
+
+def preprocess_available():
+    return Image is not None
+
+
+def image_size(data):
+    """Return (width, height) from the image header without decoding pixels."""
+    try:
+        with Image.open(BytesIO(data)) as image:
+            return image.size
+    except Exception as e:
+        raise ImagePreprocessError(f"not a valid image ({e})")
+
+
+def needs_resize(size, target_size):
+    """True when the image is larger than needed to cover the target size."""
+    width, height = size
+    target_width, target_height = target_size
+    return width > target_width and height > target_height
+
+
+def fit_size(size, target_size):
+    """Scale (width, height) down so it still covers target_size, keeping aspect ratio."""
+    width, height = size
+    target_width, target_height = target_size
+    scale = max(target_width / width, target_height / height)
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def resized_type(extension):
+    """Extension and mime type a downsized image is re-encoded as."""
+    if extension == ".jpg":
+        return ".jpg", "image/jpeg"
+    return ".png", "image/png"
+
+
+def preprocess_image(data, target_size, extension):
+    """
+    Decode, verify and downsize an input image to cover ``target_size``.
+
+    ComfyUI resizes inputs to the target width/height anyway, so anything
+    beyond that only costs upload bytes and GPU-side resize time. EXIF
+    orientation is applied before resizing because re-encoding drops it.
+    JPEG inputs stay JPEG, everything else becomes PNG (see ``resized_type``).
+    """
+    try:
+        with Image.open(BytesIO(data)) as image:
+            image = ImageOps.exif_transpose(image)
+            image = image.resize(fit_size(image.size, target_size), Image.LANCZOS)
+            output = BytesIO()
+            if resized_type(extension)[0] == ".jpg":
+                image.convert("RGB").save(output, format="JPEG", quality=95)
+            else:
+                image.save(output, format="PNG", compress_level=1)
+            return output.getvalue()
+    except Exception as e:
+        raise ImagePreprocessError(f"could not decode image ({e})")
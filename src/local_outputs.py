@@ -0,0 +1,47 @@
+import mmap
+import os
+
+
+def resolve_output_path(filename, subfolder, image_type, roots):
+    """
+    Map a history image entry to a file in ComfyUI's output directories.
+
+    ``roots`` maps the entry ``type`` ("output", "temp", "input") to the local
+    directory ComfyUI writes it to. Returns the absolute path, or ``None`` if
+    the type is unknown, the path escapes its root or the file isn't visible.
+    """
+    root = roots.get(image_type or "output")
+    if not root or not filename:
+        return None
+
+    root = os.path.realpath(root)
+    path = os.path.realpath(os.path.join(root, subfolder or "", filename))
+    if os.path.commonpath([root, path]) != root:
+        return None
+    if not os.path.isfile(path):
+        return None
+    return path
+
+
+def read_mapped(path):
+    """
+    Memory-map a file read-only.
+
+    The returned mmap supports the buffer protocol, so it can be base64 encoded
+    or written to a pipe without copying it into a bytes object first. Returns
+    ``None`` for empty or unreadable files.
+    """
+    try:
+        with open(path, "rb") as f:
+            if os.fstat(f.fileno()).st_size == 0:
+                return None
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError) as e:
+        print(f"Could not map {path}: {e}")
+        return None
+
+
+def release(content):
+    """Close a mapped frame once it has been consumed; no-op for bytes."""
+    if isinstance(content, mmap.mmap):
+        content.close()
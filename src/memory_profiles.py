@@ -0,0 +1,98 @@
+from src.concurrency import gpu_device
+
+GIB = 1024**3
+
+
+def device_vram_gb(system_stats):
+    """Total memory of the first GPU in ComfyUI's /system_stats, in GiB, or None if unknown."""
+    device = gpu_device(system_stats)
+    return None if device is None else device["vram_total"] / GIB
+
+
+def megapixel_frames(dimensions, frames):
+    """Job size as width x height x frames, in millions of pixels."""
+    width, height = dimensions
+    return width * height * frames / 1e6
+
+
+class MemoryProfiles:
+    """
+    Memory settings for a workflow, chosen per job from its size and the GPU.
+
+    ``inputs`` maps setting names to the ``[node_id, input_name]`` pairs they
+    are written to (e.g. ``vae_tiling`` to the VAE decode node). Each profile
+    sets some of those settings and matches jobs up to
+    ``max_megapixel_frames`` on GPUs with at least ``min_vram_gb``; a limit
+    that is left out always matches. Profiles are tried in order and the first
+    match wins, so the table lists the fastest profiles first and ends with a
+    catch-all for the largest jobs and unknown GPUs.
+
+    Settings that feed the model loaders (e.g. ``blocks_to_swap``) would make
+    ComfyUI load the models again whenever the profile changes. They go into
+    the ``worker`` list instead, whose first entry with a fitting
+    ``min_vram_gb`` is picked once per worker; profiles can't set them.
+    """
+
+    LIMITS = ("name", "max_megapixel_frames", "min_vram_gb")
+
+    def __init__(self, spec):
+        self.inputs = {name: [tuple(target) for target in targets] for name, targets in spec.get("inputs", {}).items()}
+        self.profiles = list(spec.get("profiles", []))
+        self.worker = list(spec.get("worker", []))
+        worker_settings = set()
+        for entry in self.worker:
+            unknown = set(entry) - {"min_vram_gb"} - set(self.inputs)
+            if unknown:
+                raise ValueError(f"Worker memory settings set unknown input(s): {', '.join(sorted(unknown))}")
+            worker_settings.update(set(entry) - {"min_vram_gb"})
+        for profile in self.profiles:
+            if "name" not in profile:
+                raise ValueError("Memory profile without a name")
+            unknown = set(profile) - set(self.LIMITS) - set(self.inputs)
+            if unknown:
+                raise ValueError(f"Memory profile '{profile['name']}' sets unknown input(s): {', '.join(sorted(unknown))}")
+            per_worker = set(profile) & worker_settings
+            if per_worker:
+                raise ValueError(f"Memory profile '{profile['name']}' sets per-worker input(s): {', '.join(sorted(per_worker))}")
+
+    def all_targets(self):
+        for targets in self.inputs.values():
+            yield from targets
+
+    def select(self, size, vram_gb):
+        """First profile matching a job of ``size`` megapixel-frames on a GPU with ``vram_gb`` (None if unknown)."""
+        for profile in self.profiles:
+            if "max_megapixel_frames" in profile and size > profile["max_megapixel_frames"]:
+                continue
+            if "min_vram_gb" in profile and (vram_gb is None or vram_gb < profile["min_vram_gb"]):
+                continue
+            return profile
+        return None
+
+    def get(self, name):
+        for profile in self.profiles:
+            if profile["name"] == name:
+                return profile
+        return None
+
+    def overrides(self, name):
+        """``(node_id, input_name, value)`` writes for a profile name; none for an unknown name."""
+        profile = self.get(name)
+        if profile is None:
+            return []
+        return self._writes(profile)
+
+    def worker_overrides(self, vram_gb):
+        """Writes of the first ``worker`` entry for a GPU with ``vram_gb`` (None if unknown)."""
+        for entry in self.worker:
+            if "min_vram_gb" in entry and (vram_gb is None or vram_gb < entry["min_vram_gb"]):
+                continue
+            return self._writes(entry)
+        return []
+
+    def _writes(self, settings):
+        return [
+            (node_id, input_name, settings[setting])
+            for setting, targets in self.inputs.items() if setting in settings
+            for node_id, input_name in targets
+        ]
@@ -0,0 +1,208 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Histogram buckets in seconds, from sub-second I/O up to the longest renders
+DEFAULT_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 600, 1200, 3600)
+
+
+class PhaseTimer:
+    """
+    Monotonic per-job timings.
+
+    ``phase(name)`` times a block and records it as the job's current phase
+    (used to attribute failures); ``add``/``timed`` accumulate durations from
+    any thread without changing the current phase, e.g. per-frame encoding.
+    Durations of repeated phases add up.
+
+    With a ``trace`` (src.tracing.JobTrace) phases, ``span`` blocks and
+    nodes are also recorded as individual spans.
+    """
+
+    def __init__(self, clock=time.perf_counter, trace=None):
+        self.clock = clock
+        self.trace = trace
+        self.phases = {}
+        self.nodes = {}
+        self.current = None
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def phase(self, name):
+        self.current = name
+        start = self.clock()
+        try:
+            yield
+        finally:
+            end = self.clock()
+            self.add(name, end - start)
+            if self.trace:
+                self.trace.add_span(name, start, end)
+
+    @contextmanager
+    def span(self, name):
+        """Trace-only span grouping nested phases; not counted in the timings."""
+        start = self.clock()
+        try:
+            yield
+        finally:
+            if self.trace:
+                self.trace.add_span(name, start, self.clock())
+
+    def node(self, node_id, start, end, class_type=None):
+        """Record one executed ComfyUI node."""
+        self.add_node(node_id, end - start)
+        if self.trace:
+            self.trace.add_node(node_id, class_type, start, end)
+
+    def cached_nodes(self, node_ids, at, class_types=None):
+        """Record nodes ComfyUI served from its cache (trace only)."""
+        if self.trace:
+            for node_id in node_ids:
+                self.trace.add_node(node_id, (class_types or {}).get(node_id), at, at, cached=True)
+
+    def record(self, name, start, end):
+        """Record a phase measured outside a ``phase`` block."""
+        self.add(name, end - start)
+        if self.trace:
+            self.trace.add_span(name, start, end)
+
+    def add(self, name, seconds):
+        with self._lock:
+            self.phases[name] = self.phases.get(name, 0.0) + seconds
+
+    def add_node(self, node_id, seconds):
+        with self._lock:
+            self.nodes[node_id] = self.nodes.get(node_id, 0.0) + seconds
+
+    def timed(self, name, fn):
+        """Wrap ``fn`` so each call's duration is added to ``name``."""
+        def wrapper(*args, **kwargs):
+            start = self.clock()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                self.add(name, self.clock() - start)
+        return wrapper
+
+    def as_dict(self):
+        """Timings in milliseconds, with per-node execution times under ``nodes``."""
+        with self._lock:
+            timings = {name: round(seconds * 1000, 1) for name, seconds in self.phases.items()}
+            if self.nodes:
+                timings["nodes"] = {node_id: round(seconds * 1000, 1) for node_id, seconds in self.nodes.items()}
+        return timings
+
+
+def format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{value}"' for name, value in labels) + "}"
+
+
+class Counter:
+    def __init__(self, name, help_text):
+        self.name = name
+        self.help = help_text
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount=1, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels):
+        return self._values.get(tuple(sorted(labels.items())), 0)
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{format_labels(key)} {value}")
+        return lines
+
+
+class Histogram:
+    def __init__(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help_text
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._series.setdefault(key, {"buckets": [0] * len(self.buckets), "sum": 0.0, "count": 0})
+            index = bisect.bisect_left(self.buckets, value)
+            if index < len(self.buckets):
+                series["buckets"][index] += 1
+            series["sum"] += value
+            series["count"] += 1
+
+    def count(self, **labels):
+        series = self._series.get(tuple(sorted(labels.items())))
+        return series["count"] if series else 0
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, series["buckets"]):
+                    cumulative += count
+                    lines.append(f"{self.name}_bucket{format_labels(key + (('le', bound),))} {cumulative}")
+                lines.append(f"{self.name}_bucket{format_labels(key + (('le', '+Inf'),))} {series['count']}")
+                lines.append(f"{self.name}_sum{format_labels(key)} {series['sum']}")
+                lines.append(f"{self.name}_count{format_labels(key)} {series['count']}")
+        return lines
+
+
+class MetricsRegistry:
+    """Counters and histograms rendered in the Prometheus text exposition format."""
+
+    def __init__(self):
+        self._metrics = []
+
+    def counter(self, name, help_text):
+        metric = Counter(name, help_text)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help_text, buckets=DEFAULT_BUCKETS):
+        metric = Histogram(name, help_text, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def render(self):
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port, host="0.0.0.0"):
+        """Expose ``/metrics`` on a background HTTP server. Returns the server."""
+        registry = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                body = registry.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), MetricsHandler)
+        threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+        print(f"Serving metrics on http://{host}:{port}/metrics")
+        return server
@@ -0,0 +1,88 @@
+import hashlib
+import mmap
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from src.local_outputs import release
+
+
+class OutputSinkError(Exception):
+    """Raised when an output cannot be uploaded to object storage."""
+
+
+class S3OutputSink:
+    """
+    Upload job outputs to an S3-compatible bucket in parallel.
+
+    ``submit`` queues an upload on a thread pool and returns immediately, so
+    frames are uploaded while the remaining ones are still being fetched.
+    Objects above ``multipart_threshold`` use boto3's multipart transfer with
+    ``workers`` parts in flight. Every upload returns its presigned URL, size
+    and SHA-256 so clients can verify what they download.
+    """
+
+    def __init__(self, client, bucket, prefix, workers=8, multipart_threshold=8 * 1024 * 1024, url_expiry=604800):
+        from boto3.s3.transfer import TransferConfig
+
+        self.client = client
+        self.bucket = bucket
+        self.prefix = prefix.strip("/")
+        self.url_expiry = url_expiry
+        self.transfer_config = TransferConfig(
+            multipart_threshold=multipart_threshold,
+            multipart_chunksize=multipart_threshold,
+            max_concurrency=workers,
+            use_threads=True,
+        )
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="output-upload")
+        self._pending = deque()
+
+    def key_for(self, filename):
+        return f"{self.prefix}/{filename}" if self.prefix else filename
+
+    def upload(self, filename, content, content_type):
+        """Upload one object synchronously and describe it. Mapped frames are closed afterwards."""
+        key = self.key_for(filename)
+        try:
+            size = len(content)
+            sha256 = hashlib.sha256(content).hexdigest()
+            if isinstance(content, mmap.mmap):
+                content.seek(0)
+                fileobj = content
+            else:
+                fileobj = BytesIO(content)
+            self.client.upload_fileobj(
+                fileobj,
+                self.bucket,
+                key,
+                ExtraArgs={"ContentType": content_type},
+                Config=self.transfer_config,
+            )
+            url = self.client.generate_presigned_url(
+                "get_object",
+                Params={"Bucket": self.bucket, "Key": key},
+                ExpiresIn=self.url_expiry,
+            )
+        except Exception as e:
+            raise OutputSinkError(f"upload of {key} failed ({e})")
+        finally:
+            release(content)
+        return {"filename": filename, "url": url, "size_bytes": size, "sha256": sha256}
+
+    def submit(self, filename, content, content_type):
+        """Queue an upload; results are collected in submission order."""
+        self._pending.append((self._executor.submit(self.upload, filename, content, content_type), content))
+
+    def completed(self, wait=False):
+        """Yield finished uploads in submission order; with ``wait`` drain all of them."""
+        while self._pending and (wait or self._pending[0][0].done()):
+            yield self._pending.popleft()[0].result()
+
+    def close(self):
+        # Cancelled uploads never run, so their mapped frames are released here
+        for future, content in self._pending:
+            if future.cancel():
+                release(content)
+        self._pending.clear()
+        self._executor.shutdown(wait=True)
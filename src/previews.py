@@ -0,0 +1,85 @@
+import base64
+import json
+import struct
+import time
+from io import BytesIO
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow ships with ComfyUI; without it only JPEG previews pass through unresized
+    Image = None
+
+# Binary websocket event types sent by ComfyUI (server.BinaryEventTypes)
+PREVIEW_IMAGE = 1
+PREVIEW_IMAGE_WITH_METADATA = 4
+
+JPEG_MAGIC = b"\xff\xd8\xff"
+
+
+def preview_available():
+    return Image is not None
+
+
+def parse_preview_frame(data):
+    """
+    Split a binary websocket frame into (image_bytes, metadata).
+
+    ``PREVIEW_IMAGE`` frames are ``event type | image format | image``;
+    ``PREVIEW_IMAGE_WITH_METADATA`` frames carry a JSON header (with
+    ``prompt_id`` and ``node_id``) instead of the format. Returns None for
+    other binary events.
+    """
+    if len(data) < 8:
+        return None
+    event_type = struct.unpack(">I", data[:4])[0]
+    if event_type == PREVIEW_IMAGE:
+        return bytes(data[8:]), {}
+    if event_type == PREVIEW_IMAGE_WITH_METADATA:
+        metadata_length = struct.unpack(">I", data[4:8])[0]
+        try:
+            metadata = json.loads(data[8:8 + metadata_length])
+        except ValueError:
+            metadata = {}
+        return bytes(data[8 + metadata_length:]), metadata
+    return None
+
+
+class PreviewEncoder:
+    """
+    Throttle latent previews and re-encode them as small base64 JPEGs.
+
+    Frames offered within ``min_interval`` seconds of the last accepted one
+    are dropped before decoding, so a sampler sending a preview per step
+    costs nothing beyond the websocket read.
+    """
+
+    def __init__(self, max_size=256, quality=70, min_interval=2.0, clock=time.monotonic):
+        self.max_size = max_size
+        self.quality = quality
+        self.min_interval = min_interval
+        self.clock = clock
+        self._last = None
+
+    def offer(self, image_bytes):
+        """Return a base64 JPEG for the frame, or None when throttled or undecodable."""
+        now = self.clock()
+        if self._last is not None and now - self._last < self.min_interval:
+            return None
+        preview = self.encode(image_bytes)
+        if preview is None:
+            return None
+        self._last = now
+        return base64.b64encode(preview).decode("utf-8")
+
+    def encode(self, image_bytes):
+        if Image is None:
+            return image_bytes if image_bytes.startswith(JPEG_MAGIC) else None
+        try:
+            with Image.open(BytesIO(image_bytes)) as image:
+                image.thumbnail((self.max_size, self.max_size))
+                output = BytesIO()
+                image.convert("RGB").save(output, format="JPEG", quality=self.quality)
+                return output.getvalue()
+        except Exception as e:
+            print(f"Skipping undecodable preview frame: {e}")
+            return None
@@ -0,0 +1,119 @@
+import time
+
+
+class ProgressTracker:
+    """
+    Turn ComfyUI ``executing``/``progress`` events into overall job progress.
+
+    ``stages`` is an ordered list of ``{"name", "nodes", "weight"}`` dicts
+    (from the workflow registry). Overall percent is the weight of the stages
+    before the current one plus the current stage's step fraction, and never
+    moves backwards, so out-of-order node execution can't make it jump back.
+    ETA is extrapolated from elapsed execution time once a little progress has
+    been made.
+
+    Updates go to ``report(payload)`` at most every ``min_interval`` seconds;
+    stage changes and the final update are always sent. With a ``previews``
+    encoder (src.previews.PreviewEncoder), accepted latent previews are sent
+    right away as a base64 JPEG in the payload's ``preview`` field.
+    """
+
+    def __init__(self, stages, report, min_interval=2.0, clock=time.monotonic, previews=None):
+        self.stages = stages or [{"name": "execute", "nodes": [], "weight": 1}]
+        self.report = report
+        self.min_interval = min_interval
+        self.clock = clock
+        self.previews = previews
+        self._preview = None
+        total = sum(stage["weight"] for stage in self.stages) or 1
+        self._offsets = {}
+        self._weights = {}
+        self._stage_of_node = {}
+        offset = 0.0
+        for stage in self.stages:
+            self._offsets[stage["name"]] = offset / total
+            self._weights[stage["name"]] = stage["weight"] / total
+            offset += stage["weight"]
+            for node_id in stage["nodes"]:
+                self._stage_of_node[str(node_id)] = stage["name"]
+        self.stage = "queued"
+        self.percent = 0.0
+        self.step = None
+        self._started = None
+        self._last_sent = None
+
+    def queued(self):
+        self._send(force=True)
+
+    def update(self, message):
+        """Feed one websocket message for this prompt."""
+        data = message.get("data") or {}
+        if message.get("type") == "executing" and data.get("node") is not None:
+            self._enter(self._stage_for(data["node"]))
+        elif message.get("type") == "progress" and data.get("max"):
+            stage = self._stage_for(data.get("node"))
+            self._enter(stage)
+            self.step = (data["value"], data["max"])
+            self._advance(self._offsets[stage] + self._weights[stage] * data["value"] / data["max"])
+            self._send()
+
+    def _stage_for(self, node_id):
+        """Stage a node belongs to; unmapped nodes (loaders, constants) stay in the current stage."""
+        stage = self._stage_of_node.get(str(node_id))
+        if stage:
+            return stage
+        return self.stage if self.stage in self._offsets else self.stages[0]["name"]
+
+    def _enter(self, stage):
+        if self._started is None:
+            self._started = self.clock()
+        if stage != self.stage:
+            self.stage = stage
+            self.step = None
+            self._advance(self._offsets[stage])
+            self._send(force=True)
+
+    def preview(self, image_bytes):
+        """Offer a latent preview frame; sent when the preview throttle accepts it."""
+        if self.previews is None:
+            return
+        encoded = self.previews.offer(image_bytes)
+        if encoded:
+            self._preview = encoded
+            self._send(force=True)
+
+    def finish(self):
+        self.stage = "completed"
+        self.step = None
+        self.percent = 1.0
+        self._send(force=True)
+
+    def _advance(self, fraction):
+        self.percent = max(self.percent, min(fraction, 1.0))
+
+    def eta_seconds(self):
+        if self._started is None or self.percent < 0.02:
+            return None
+        elapsed = self.clock() - self._started
+        return round(elapsed * (1 - self.percent) / self.percent)
+
+    def payload(self):
+        payload = {"stage": self.stage, "percent": round(self.percent * 100, 1), "eta_s": self.eta_seconds()}
+        if self.step:
+            payload["step"], payload["steps"] = self.step
+        if self._preview:
+            payload["preview"] = self._preview
+        return payload
+
+    def _send(self, force=False):
+        now = self.clock()
+        if not force and self._last_sent is not None and now - self._last_sent < self.min_interval:
+            return
+        self._last_sent = now
+        payload = self.payload()
+        # Each preview is sent once; later updates only carry progress
+        self._preview = None
+        try:
+            self.report(payload)
+        except Exception as e:
+            print(f"Progress update failed: {e}")
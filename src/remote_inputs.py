@@ -0,0 +1,101 @@
+import ipaddress
+import socket
+import urllib.parse
+
+
+class InputFetchError(Exception):
+    """Raised when a remote input image cannot be downloaded."""
+
+
+def read_limited(chunks, max_bytes, name):
+    """Collect an iterator of byte chunks into one buffer, enforcing a size limit."""
+    buffer = bytearray()
+    for chunk in chunks:
+        if not chunk:
+            continue
+        buffer += chunk
+        if len(buffer) > max_bytes:
+            raise InputFetchError(f"{name} exceeds the {max_bytes} byte input limit")
+    if not buffer:
+        raise InputFetchError(f"{name} is empty")
+    return buffer
+
+
+def check_length(length, max_bytes, name):
+    """Reject a download up front when its announced size is over the limit."""
+    if length is not None and int(length) > max_bytes:
+        raise InputFetchError(f"{name} is {length} bytes, exceeding the {max_bytes} byte input limit")
+
+
+def check_host(url, allowed_hosts=(), resolve=socket.getaddrinfo):
+    """
+    Reject a URL whose host resolves to a loopback, private, link-local or
+    otherwise non-public address, so job inputs can't reach ComfyUI, the
+    cloud metadata service or other internal endpoints. Hosts listed in
+    ``allowed_hosts`` skip the check.
+    """
+    parsed = urllib.parse.urlparse(url)
+    if parsed.scheme not in ("http", "https"):
+        raise InputFetchError(f"unsupported URL scheme '{parsed.scheme}' in {url}")
+    host = parsed.hostname
+    if not host:
+        raise InputFetchError(f"invalid URL {url}")
+    if host in allowed_hosts:
+        return
+    try:
+        infos = resolve(host, parsed.port or (443 if parsed.scheme == "https" else 80), type=socket.SOCK_STREAM)
+    except (OSError, ValueError) as e:
+        raise InputFetchError(f"could not resolve {host} ({e})")
+    for info in infos:
+        address = ipaddress.ip_address(info[4][0].split("%")[0])
+        if address.version == 6 and address.ipv4_mapped:
+            address = address.ipv4_mapped
+        if not address.is_global:
+            raise InputFetchError(f"{url} resolves to non-public address {address}; add {host} to INPUT_ALLOWED_HOSTS to allow it")
+
+
+def fetch_http(url, session, max_bytes, timeout=60, chunk_size=256 * 1024, allowed_hosts=(), max_redirects=5):
+    """
+    Stream an http(s) URL (including presigned object URLs) into memory in chunks.
+
+    Redirects are followed here rather than by requests, so that the host of
+    every hop passes ``check_host``.
+    """
+    target = url
+    try:
+        for _ in range(max_redirects + 1):
+            check_host(target, allowed_hosts)
+            with session.get(target, stream=True, timeout=timeout, allow_redirects=False) as response:
+                if response.is_redirect:
+                    target = urllib.parse.urljoin(target, response.headers["Location"])
+                    continue
+                response.raise_for_status()
+                check_length(response.headers.get("Content-Length"), max_bytes, url)
+                return read_limited(response.iter_content(chunk_size), max_bytes, url)
+    except InputFetchError:
+        raise
+    except Exception as e:
+        raise InputFetchError(f"download of {url} failed ({e})")
+    raise InputFetchError(f"download of {url} failed (more than {max_redirects} redirects)")
+
+
+def fetch_s3(url, client, max_bytes, chunk_size=256 * 1024):
+    """Stream an s3://bucket/key object from an S3-compatible endpoint into memory in chunks."""
+    if client is None:
+        raise InputFetchError("s3:// inputs require INPUT_BUCKET_ENDPOINT_URL or BUCKET_ENDPOINT_URL with credentials")
+    parsed = urllib.parse.urlparse(url)
+    bucket, key = parsed.netloc, parsed.path.lstrip("/")
+    if not bucket or not key:
+        raise InputFetchError(f"invalid S3 URL {url}, expected s3://bucket/key")
+    try:
+        response = client.get_object(Bucket=bucket, Key=key)
+        check_length(response.get("ContentLength"), max_bytes, url)
+        body = response["Body"]
+        try:
+            return read_limited(body.iter_chunks(chunk_size), max_bytes, url)
+        finally:
+            body.close()
+    except InputFetchError:
+        raise
+    except Exception as e:
+        raise InputFetchError(f"download of {url} failed ({e})")
@@ -0,0 +1,115 @@
+import threading
+import time
+
+from src.concurrency import free_ram_fraction, gpu_device, pending_prompts
+
+GB = 1024**3
+
+# /free requests, from least to most disruptive. ComfyUI has no per-model request: unload_models
+# moves every model it manages off the GPU, free_memory also drops the whole node cache.
+FREE_REQUESTS = {
+    "unload_models": {"unload_models": True},
+    "free_memory": {"unload_models": True, "free_memory": True},
+}
+
+
+def free_vram_fraction(system_stats):
+    """Free memory of the first GPU as a fraction of its total from ComfyUI's /system_stats, or None if unknown."""
+    device = gpu_device(system_stats)
+    if device is None:
+        return None
+    return device.get("vram_free", 0) / device["vram_total"]
+
+
+def describe_memory(system_stats):
+    """One-line summary of free VRAM and RAM for the logs."""
+    parts = []
+    device = gpu_device(system_stats)
+    if device is not None:
+        parts.append(f"VRAM {device.get('vram_free', 0) / GB:.1f}/{device['vram_total'] / GB:.1f} GB free")
+    system = system_stats.get("system", {})
+    if system.get("ram_total"):
+        parts.append(f"RAM {system.get('ram_free', 0) / GB:.1f}/{system['ram_total'] / GB:.1f} GB free")
+    return ", ".join(parts) or "no memory stats"
+
+
+class ResidencyManager:
+    """
+    Frees ComfyUI memory between jobs only when it runs low.
+
+    ComfyUI keeps the outputs of loader nodes (the diffusion models, text
+    encoder and VAE) cached between prompts, so the next job skips loading
+    them. After each job that ran a prompt ``check`` reads ``/system_stats``
+    and:
+
+    - keeps everything resident while free VRAM is at least ``min_free_vram``
+      and free RAM at least ``min_free_ram`` (fractions of the totals);
+    - with low VRAM, posts ``/free`` with ``unload_models``. This can't be
+      narrowed to some models: ComfyUI moves every model it manages off the
+      GPU and empties the CUDA cache. It keeps its node cache, so the next job
+      doesn't run the loader nodes again, but it copies the weights back to
+      the GPU from RAM (and models ComfyUI doesn't manage are not freed);
+    - with low RAM, also sets ``free_memory``, which drops the node cache; the
+      loaders run again and read the models from disk, which beats being
+      OOM-killed.
+
+    It only acts when ComfyUI's queue is empty, as freeing between another
+    job's prompts would force that job to reload its models. ComfyUI applies
+    ``/free`` between prompts, so the stats are read again after ``settle_s``
+    and both readings are logged.
+    """
+
+    def __init__(self, get_stats, get_queue, free, min_free_vram=0.1, min_free_ram=0.1, settle_s=2.0, sleep=time.sleep):
+        self.get_stats = get_stats
+        self.get_queue = get_queue
+        self.free = free
+        self.min_free_vram = min_free_vram
+        self.min_free_ram = min_free_ram
+        self.settle_s = settle_s
+        self.sleep = sleep
+        self.last = None
+        self._lock = threading.Lock()
+
+    def decide(self, system_stats):
+        """The /free request a memory state calls for ("unload_models" or "free_memory"), or None."""
+        free_ram = free_ram_fraction(system_stats)
+        if free_ram is not None and free_ram < self.min_free_ram:
+            return "free_memory"
+        free_vram = free_vram_fraction(system_stats)
+        if free_vram is not None and free_vram < self.min_free_vram:
+            return "unload_models"
+        return None
+
+    def check(self):
+        """Free memory if it runs low and ComfyUI is idle. Returns the request made, or None."""
+        queue_state = self.get_queue()
+        if queue_state.get("queue_running") or pending_prompts(queue_state):
+            return None
+        before = self.get_stats()
+        action = self.decide(before)
+        if action is None:
+            print(f"Memory after job: {describe_memory(before)}, models kept resident")
+            return None
+
+        print(f"Memory low after job ({describe_memory(before)}), requesting /free {action}")
+        self.free(FREE_REQUESTS[action])
+        self.sleep(self.settle_s)
+        after = self.get_stats()
+        print(f"Memory after /free {action}: {describe_memory(after)}")
+        self.last = {"action": action, "before": describe_memory(before), "after": describe_memory(after)}
+        return action
+
+    def after_job(self):
+        """Run ``check`` on a background thread unless one is still running. Returns True if started."""
+        if not self._lock.acquire(blocking=False):
+            return False
+        threading.Thread(target=self._run, name="residency", daemon=True).start()
+        return True
+
+    def _run(self):
+        try:
+            self.check()
+        except Exception as e:
+            print(f"Residency check failed: {e}")
+        finally:
+            self._lock.release()
@@ -0,0 +1,144 @@
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+
+
+def cache_key(parts):
+    """SHA-256 of the canonical JSON encoding of a job's deterministic inputs."""
+    canonical = json.dumps(parts, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()
+
+
+class CacheWriter:
+    """Stream one result into the cache; it only becomes visible on ``commit``."""
+
+    def __init__(self, cache, key):
+        self.cache = cache
+        self.key = key
+        self.tmp_path = os.path.join(cache.directory, f".{key}.{uuid.uuid4().hex}.tmp")
+        self._file = None
+
+    def write(self, item):
+        if self._file is None:
+            os.makedirs(self.cache.directory, exist_ok=True)
+            self._file = open(self.tmp_path, "w", encoding="utf-8")
+        self._file.write(json.dumps(item, separators=(",", ":")))
+        self._file.write("\n")
+
+    def commit(self):
+        if self._file is None:
+            return
+        self._file.close()
+        self._file = None
+        self.cache._commit(self.key, self.tmp_path)
+
+    def abort(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        try:
+            os.remove(self.tmp_path)
+        except OSError:
+            pass
+
+
+class ResultCache:
+    """
+    Disk cache of finished job outputs, keyed by ``cache_key``.
+
+    Each entry is a file of JSON lines holding the items the job yielded. An
+    entry's mtime is when it was written (for ``ttl_seconds``) and its atime
+    when it was last served; the least recently served entries are evicted
+    once the directory grows past ``max_bytes``. The directory can live on a
+    network volume so workers share results.
+    """
+
+    SUFFIX = ".jsonl"
+
+    def __init__(self, directory, max_bytes=2 * 1024**3, ttl_seconds=86400, clock=time.time):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.clock = clock
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}{self.SUFFIX}")
+
+    def get(self, key):
+        """
+        Open a fresh entry for reading. Returns an iterator of items, or None on a miss.
+
+        The file is opened here, so the entry can be evicted by another job
+        while its items are still being replayed.
+        """
+        path = self._path(key)
+        try:
+            stat = os.stat(path)
+            now = self.clock()
+            if now - stat.st_mtime > self.ttl_seconds:
+                os.remove(path)
+                raise FileNotFoundError(path)
+            entry = open(path, encoding="utf-8")
+            os.utime(path, (now, stat.st_mtime))
+        except OSError:
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return self._read(entry)
+
+    @staticmethod
+    def _read(entry):
+        with entry:
+            for line in entry:
+                yield json.loads(line)
+
+    def writer(self, key):
+        return CacheWriter(self, key)
+
+    def _commit(self, key, tmp_path):
+        now = self.clock()
+        os.utime(tmp_path, (now, now))
+        os.replace(tmp_path, self._path(key))
+        with self._lock:
+            self.stores += 1
+            self.evict()
+
+    def evict(self):
+        """Remove expired entries, then the least recently used ones until under ``max_bytes``."""
+        now = self.clock()
+        entries = []
+        for entry in os.scandir(self.directory):
+            if not entry.is_file() or not entry.name.endswith(self.SUFFIX):
+                continue
+            stat = entry.stat()
+            if now - stat.st_mtime > self.ttl_seconds:
+                self._remove(entry.path)
+            else:
+                entries.append((stat.st_atime, stat.st_size, entry.path))
+        entries.sort()
+        total = sum(size for _, size, _ in entries)
+        while entries and total > self.max_bytes:
+            _, size, path = entries.pop(0)
+            self._remove(path)
+            total -= size
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+            self.evictions += 1
+        except OSError:
+            pass
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "stores": self.stores, "evictions": self.evictions}
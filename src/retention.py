@@ -0,0 +1,194 @@
+import os
+import re
+import threading
+import time
+
+from src.local_outputs import resolve_output_path
+
+# Inputs the worker uploads are named after their content hash (see upload_index.content_filename)
+CONTENT_FILENAME = re.compile(r"^[0-9a-f]{32}(_[0-9A-Za-z]+)?\.[0-9A-Za-z]+$")
+
+
+class JobFiles:
+    """What one job leaves in ComfyUI: held input images, output files and prompt history entries."""
+
+    def __init__(self, started):
+        self.started = started
+        self.inputs = []
+        self.outputs = []
+        self.prompt_ids = []
+
+    def add_prompt(self, prompt_id):
+        if prompt_id not in self.prompt_ids:
+            self.prompt_ids.append(prompt_id)
+
+    def add_outputs(self, outputs):
+        """Record every file entry (``{"filename", "subfolder", "type"}``) of a prompt's history outputs. Returns them."""
+        added = []
+        for node_output in outputs.values():
+            for entries in node_output.values():
+                if isinstance(entries, list):
+                    added.extend(entry for entry in entries if isinstance(entry, dict) and entry.get("filename"))
+        self.outputs.extend(added)
+        return added
+
+
+def output_key(entry):
+    return entry.get("type", "output"), entry.get("subfolder", ""), entry["filename"]
+
+
+class RetentionManager:
+    """
+    Delete what jobs leave behind in ComfyUI's input, output and temp directories.
+
+    ``roots`` maps ComfyUI's directory types ("input", "output", "temp") to
+    local paths. A finished job removes its output files and history entries
+    (through ``delete_history``) and releases its input images. Output files
+    are refcounted too: a prompt ComfyUI serves from its cache reports the
+    files an earlier identical prompt wrote, so they are only deleted once no
+    running job holds them. Inputs are
+    content-addressed and reused by later jobs with the same images (see
+    upload_index), so they are left to ``sweep``; a refcount keeps it from
+    removing the ones running jobs hold.
+
+    ``sweep`` removes orphans left by crashed or killed jobs: files older than
+    ``max_age`` seconds, then the oldest files while the directories hold more
+    than ``max_bytes``. Files written since the oldest running job started and
+    inputs and outputs held by a job are never swept.
+    """
+
+    def __init__(self, roots, delete_history=None, cleanup_jobs=True, max_bytes=10 * 1024**3, max_age=6 * 3600,
+                 clock=time.time):
+        self.roots = roots
+        self.delete_history = delete_history
+        self.cleanup_jobs = cleanup_jobs
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.clock = clock
+        self._refs = {}
+        self._output_refs = {}
+        self._active = []
+        self._lock = threading.Lock()
+        self._sweeper = None
+
+    def begin(self):
+        files = JobFiles(self.clock())
+        with self._lock:
+            self._active.append(files)
+        return files
+
+    def hold(self, files, filename):
+        """Keep an input image from being swept while ``files``' job runs."""
+        with self._lock:
+            self._refs[filename] = self._refs.get(filename, 0) + 1
+        files.inputs.append(filename)
+
+    def hold_outputs(self, files, outputs):
+        """Record a prompt's history outputs on ``files`` and keep them until every job holding them is done."""
+        added = files.add_outputs(outputs)
+        with self._lock:
+            for entry in added:
+                key = output_key(entry)
+                self._output_refs[key] = self._output_refs.get(key, 0) + 1
+
+    def finish(self, files):
+        """Clean up after a job whose results have been delivered. Returns the number of files deleted."""
+        deleted = 0
+        with self._lock:
+            if files in self._active:
+                self._active.remove(files)
+            for entry in files.outputs:
+                key = output_key(entry)
+                self._output_refs[key] = self._output_refs.get(key, 1) - 1
+                if self._output_refs[key] > 0:
+                    continue
+                del self._output_refs[key]
+                # Deleted under the lock so a job can't pick up the file meanwhile
+                if self.cleanup_jobs and key[0] != "input":
+                    path = self._output_path(key)
+                    if path and self._remove(path):
+                        deleted += 1
+        files.outputs = []
+        if self.cleanup_jobs:
+            if self.delete_history:
+                for prompt_id in files.prompt_ids:
+                    try:
+                        self.delete_history(prompt_id)
+                    except Exception as e:
+                        print(f"Failed to delete history of prompt {prompt_id}: {e}")
+        with self._lock:
+            for filename in files.inputs:
+                self._refs[filename] -= 1
+                if self._refs[filename] == 0:
+                    del self._refs[filename]
+        files.inputs = []
+        return deleted
+
+    def _output_path(self, key):
+        entry_type, subfolder, filename = key
+        return resolve_output_path(filename, subfolder, entry_type, self.roots)
+
+    @staticmethod
+    def _remove(path):
+        try:
+            os.remove(path)
+            return True
+        except OSError:
+            return False
+
+    def _scan(self):
+        """List (mtime, size, path, input filename or None) of the files under the managed roots."""
+        found = []
+        for root_type, root in self.roots.items():
+            if not root or not os.path.isdir(root):
+                continue
+            for dirpath, _, filenames in os.walk(root):
+                for name in filenames:
+                    if root_type == "input" and (dirpath != root or not CONTENT_FILENAME.match(name)):
+                        continue
+                    path = os.path.join(dirpath, name)
+                    try:
+                        stat = os.stat(path)
+                    except OSError:
+                        continue
+                    found.append((stat.st_mtime, stat.st_size, path, name if root_type == "input" else None))
+        return found
+
+    def sweep(self):
+        """Remove expired and excess orphaned files, oldest first. Returns (files removed, bytes freed)."""
+        now = self.clock()
+        with self._lock:
+            cutoff = min([files.started for files in self._active], default=now)
+            held = {self._output_path(key) for key in self._output_refs}
+        found = sorted(self._scan())
+        total = sum(size for _, size, _, _ in found)
+        removed, freed = 0, 0
+        for mtime, size, path, input_name in found:
+            if mtime >= cutoff or os.path.realpath(path) in held or (now - mtime <= self.max_age and total <= self.max_bytes):
+                continue
+            if input_name is None:
+                ok = self._remove(path)
+            else:
+                with self._lock:
+                    ok = input_name not in self._refs and self._remove(path)
+            if ok:
+                removed += 1
+                freed += size
+                total -= size
+        return removed, freed
+
+    def start_sweeper(self, interval):
+        """Sweep every ``interval`` seconds on a daemon thread."""
+        def run():
+            while True:
+                time.sleep(interval)
+                try:
+                    removed, freed = self.sweep()
+                    if removed:
+                        print(f"Retention sweep removed {removed} files ({freed} bytes)")
+                except Exception as e:
+                    print(f"Retention sweep failed: {e}")
+
+        self._sweeper = threading.Thread(target=run, name="retention-sweeper", daemon=True)
+        self._sweeper.start()
+        return self._sweeper
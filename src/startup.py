@@ -0,0 +1,101 @@
+import threading
+import time
+
+from src.metrics import PhaseTimer
+
+
+class Readiness:
+    """
+    Wait for ComfyUI to come up, once per worker rather than once per job.
+
+    ``probe()`` returns True when the server answers. While it doesn't, it is
+    retried with exponential backoff from ``initial_delay`` to ``max_delay``
+    seconds, so a server that is almost up is seen quickly and a long boot
+    isn't hammered. Concurrent waiters share one poller. A positive result is
+    trusted for ``ttl`` seconds before the next wait probes again.
+    """
+
+    def __init__(self, probe, initial_delay=0.05, max_delay=1.0, backoff=1.5, ttl=30.0, clock=time.monotonic,
+                 sleep=time.sleep):
+        self.probe = probe
+        self.initial_delay = initial_delay
+        self.max_delay = max(initial_delay, max_delay)
+        self.backoff = backoff
+        self.ttl = ttl
+        self.clock = clock
+        self.sleep = sleep
+        self.probes = 0
+        self._ready_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def ready(self):
+        return self._ready_at is not None and self.clock() - self._ready_at < self.ttl
+
+    def invalidate(self):
+        self._ready_at = None
+
+    def _probe(self):
+        self.probes += 1
+        try:
+            return bool(self.probe())
+        except Exception:
+            return False
+
+    def wait(self, timeout):
+        """Block until the server is ready or ``timeout`` seconds pass. Returns whether it is ready."""
+        if self.ready:
+            return True
+        deadline = self.clock() + timeout
+        with self._lock:
+            delay = self.initial_delay
+            while not self.ready:
+                if self._probe():
+                    self._ready_at = self.clock()
+                    break
+                remaining = deadline - self.clock()
+                if remaining <= 0:
+                    return False
+                self.sleep(min(delay, remaining))
+                delay = min(delay * self.backoff, self.max_delay)
+        return True
+
+
+class StartupPipeline:
+    """
+    Run the worker's warm-up steps on a background thread, timing each one.
+
+    ``steps`` is a list of ``(name, fn)``; a step that fails is logged and the
+    pipeline continues, since jobs still check readiness themselves. Timings
+    are kept on ``timer`` (a PhaseTimer) so cold starts of different images
+    can be compared; ``on_done()`` is called once all steps ran.
+    """
+
+    def __init__(self, steps, timer=None, on_done=None):
+        self.steps = steps
+        self.timer = timer or PhaseTimer()
+        self.on_done = on_done
+        self.done = threading.Event()
+        self._thread = None
+
+    def run(self):
+        try:
+            for name, step in self.steps:
+                try:
+                    with self.timer.phase(name):
+                        step()
+                except Exception as e:
+                    print(f"Startup step {name} failed: {e}")
+        finally:
+            self.done.set()
+        print(f"Cold start timings (ms): {self.timer.as_dict()}")
+        if self.on_done:
+            self.on_done()
+
+    def start(self):
+        self._thread = threading.Thread(target=self.run, name="startup", daemon=True)
+        self._thread.start()
+        return self._thread
+
+    def timings(self):
+        return self.timer.as_dict()
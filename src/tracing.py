@@ -0,0 +1,103 @@
+import json
+import os
+import threading
+
+# Chrome trace "threads": handler phases and ComfyUI node execution get separate rows
+HANDLER_TID = 1
+COMFY_TID = 2
+
+
+class JobTrace:
+    """
+    Spans of one job in Chrome ``trace_event`` format (open in chrome://tracing or Perfetto).
+
+    Times are ``clock()`` seconds, the same clock as the job's PhaseTimer, and
+    are written as microseconds. Handler phases go on one row and ComfyUI
+    nodes on another; nodes served from ComfyUI's cache are zero-length spans
+    in the ``cached`` category.
+    """
+
+    def __init__(self, job_id):
+        self.job_id = job_id
+        self.events = [
+            {"ph": "M", "name": "process_name", "pid": 1, "args": {"name": f"job {job_id}"}},
+            {"ph": "M", "name": "thread_name", "pid": 1, "tid": HANDLER_TID, "args": {"name": "handler"}},
+            {"ph": "M", "name": "thread_name", "pid": 1, "tid": COMFY_TID, "args": {"name": "comfyui"}},
+        ]
+        self._lock = threading.Lock()
+
+    def add_span(self, name, start, end, category="phase", tid=HANDLER_TID, args=None):
+        event = {
+            "ph": "X",
+            "name": name,
+            "cat": category,
+            "ts": round(start * 1e6, 1),
+            "dur": round(max(end - start, 0) * 1e6, 1),
+            "pid": 1,
+            "tid": tid,
+        }
+        if args:
+            event["args"] = args
+        with self._lock:
+            self.events.append(event)
+
+    def add_node(self, node_id, class_type, start, end, cached=False):
+        self.add_span(
+            f"{class_type or 'node'} #{node_id}",
+            start,
+            start if cached else end,
+            category="cached" if cached else "node",
+            tid=COMFY_TID,
+            args={"node": node_id, "class_type": class_type, "cached": cached},
+        )
+
+    def to_json(self):
+        with self._lock:
+            return json.dumps({"traceEvents": self.events, "displayTimeUnit": "ms"})
+
+
+class TraceWriter:
+    """
+    Write job traces to a directory, keeping it under ``max_bytes`` and ``max_files``.
+
+    After each write the oldest traces are removed until both limits hold,
+    so tracing can stay on for long-running workers.
+    """
+
+    SUFFIX = ".trace.json"
+
+    def __init__(self, directory, max_bytes=100 * 1024 * 1024, max_files=200):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.max_files = max_files
+        self._lock = threading.Lock()
+
+    def write(self, trace):
+        """Write one trace and rotate. Returns the file path."""
+        safe_id = "".join(c if c.isalnum() or c in "-_" else "_" for c in str(trace.job_id))
+        path = os.path.join(self.directory, f"{safe_id}{self.SUFFIX}")
+        with self._lock:
+            os.makedirs(self.directory, exist_ok=True)
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, "w") as f:
+                f.write(trace.to_json())
+            os.replace(tmp_path, path)
+            self.rotate()
+        return path
+
+    def rotate(self):
+        traces = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and entry.name.endswith(self.SUFFIX):
+                stat = entry.stat()
+                traces.append((stat.st_mtime, stat.st_size, entry.path))
+        traces.sort()
+        total = sum(size for _, size, _ in traces)
+        # The newest trace (just written) is always kept
+        while len(traces) > 1 and (total > self.max_bytes or len(traces) > self.max_files):
+            _, size, path = traces.pop(0)
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            total -= size
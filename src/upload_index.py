@@ -0,0 +1,73 @@
+import hashlib
+import os
+import threading
+
+# Magic bytes -> (extension, mime type) for the image formats LoadImage accepts
+IMAGE_SIGNATURES = [
+    (b"\x89PNG\r\n\x1a\n", ".png", "image/png"),
+    (b"\xff\xd8\xff", ".jpg", "image/jpeg"),
+    (b"GIF8", ".gif", "image/gif"),
+    (b"BM", ".bmp", "image/bmp"),
+]
+
+
+def detect_image_type(data):
+    """Return (extension, mime type) for image bytes, defaulting to PNG."""
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return ".webp", "image/webp"
+    for signature, extension, mime in IMAGE_SIGNATURES:
+        if data[:len(signature)] == signature:
+            return extension, mime
+    return ".png", "image/png"
+
+
+def content_filename(data, extension=".png", variant=""):
+    """Name an upload after the SHA-256 of its content, plus an optional variant tag (e.g. a resize target)."""
+    digest = hashlib.sha256(data).hexdigest()[:32]
+    if variant:
+        return f"{digest}_{variant}{extension}"
+    return f"{digest}{extension}"
+
+
+class UploadIndex:
+    """
+    Track which content-addressed images already exist on the ComfyUI input side.
+
+    Entries are kept in memory for the lifetime of the worker. When ComfyUI's
+    input directory is visible locally, entries are verified against it (and
+    files written by a previous handler process are picked up), so a cleared
+    input folder never produces a stale hit.
+    """
+
+    def __init__(self, input_dir=None):
+        self.input_dir = input_dir
+        self._known = set()
+        self._lock = threading.Lock()
+
+    def _on_disk(self, filename):
+        if not self.input_dir or not os.path.isdir(self.input_dir):
+            return None
+        return os.path.isfile(os.path.join(self.input_dir, filename))
+
+    def contains(self, filename):
+        on_disk = self._on_disk(filename)
+        with self._lock:
+            if on_disk is None:
+                return filename in self._known
+            if on_disk:
+                self._known.add(filename)
+            else:
+                self._known.discard(filename)
+            return on_disk
+
+    def add(self, filename):
+        with self._lock:
+            self._known.add(filename)
+
+    def discard(self, filename):
+        with self._lock:
+            self._known.discard(filename)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._known)
@@ -0,0 +1,117 @@
+import os
+import subprocess
+import tempfile
+
+# Supported containers, their codecs (input name -> ffmpeg encoder) and CRF (default, min, max)
+VIDEO_FORMATS = {
+    "mp4": {
+        "codecs": {"h264": "libx264", "h265": "libx265"},
+        "default_codec": "h264",
+        "crf": (23, 0, 51),
+    },
+    "webm": {
+        "codecs": {"vp9": "libvpx-vp9"},
+        "default_codec": "vp9",
+        "crf": (32, 0, 63),
+    },
+}
+
+FFMPEG_BINARY = os.environ.get("FFMPEG_PATH", "ffmpeg")
+
+
+class VideoEncoderError(Exception):
+    """Raised when ffmpeg fails to start or exits with an error."""
+
+
+class VideoEncoder:
+    """
+    Encode PNG frames into a video container with ffmpeg.
+
+    Frames are piped into ffmpeg's stdin as they arrive, so encoding runs in a
+    separate process concurrently with frame retrieval. The encoded file is
+    written to a temporary directory and returned by ``finish``.
+    """
+
+    def __init__(self, container, codec, crf, fps, ffmpeg=None):
+        self.container = container
+        self.codec = codec
+        self.encoder = VIDEO_FORMATS[container]["codecs"][codec]
+        self.crf = crf
+        self.fps = fps
+        self.ffmpeg = ffmpeg or FFMPEG_BINARY
+        self.frame_count = 0
+        self._process = None
+        self._tmpdir = None
+        self._output_path = None
+        self._stderr = None
+
+    def build_command(self, output_path):
+        """Build the ffmpeg command line for reading PNGs from stdin."""
+        cmd = [
+            self.ffmpeg, "-hide_banner", "-loglevel", "error", "-y",
+            "-f", "image2pipe", "-framerate", str(self.fps), "-c:v", "png", "-i", "-",
+            "-c:v", self.encoder, "-crf", str(self.crf), "-pix_fmt", "yuv420p",
+        ]
+        if self.container == "mp4":
+            cmd += ["-preset", "veryfast", "-movflags", "+faststart"]
+        else:
+            # Constant quality mode for VP9 requires a zero target bitrate
+            cmd += ["-b:v", "0", "-deadline", "good", "-cpu-used", "4", "-row-mt", "1"]
+        cmd.append(output_path)
+        return cmd
+
+    def start(self):
+        self._tmpdir = tempfile.TemporaryDirectory(prefix="video-")
+        self._output_path = os.path.join(self._tmpdir.name, f"output.{self.container}")
+        self._stderr = tempfile.TemporaryFile()
+        try:
+            self._process = subprocess.Popen(
+                self.build_command(self._output_path),
+                stdin=subprocess.PIPE,
+                stdout=subprocess.DEVNULL,
+                stderr=self._stderr,
+            )
+        except OSError as e:
+            self.close()
+            raise VideoEncoderError(f"Could not start ffmpeg ({self.ffmpeg}): {e}")
+        return self
+
+    def write_frame(self, data):
+        try:
+            self._process.stdin.write(data)
+        except BrokenPipeError:
+            raise VideoEncoderError(f"ffmpeg exited early: {self._read_stderr()}")
+        self.frame_count += 1
+
+    def finish(self):
+        """Close stdin, wait for ffmpeg and return the encoded video bytes."""
+        try:
+            self._process.stdin.close()
+        except BrokenPipeError:
+            pass
+        returncode = self._process.wait()
+        if returncode != 0:
+            raise VideoEncoderError(f"ffmpeg exited with code {returncode}: {self._read_stderr()}")
+        with open(self._output_path, "rb") as f:
+            return f.read()
+
+    def close(self):
+        if self._process and self._process.poll() is None:
+            self._process.kill()
+            self._process.wait()
+        if self._stderr:
+            self._stderr.close()
+            self._stderr = None
+        if self._tmpdir:
+            self._tmpdir.cleanup()
+            self._tmpdir = None
+
+    def _read_stderr(self):
+        self._stderr.seek(0)
+        return self._stderr.read().decode("utf-8", errors="replace").strip()[-1000:]
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
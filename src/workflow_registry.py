@@ -0,0 +1,251 @@
+import hashlib
+import json
+import os
+import random
+
+from src.memory_profiles import MemoryProfiles
+
+
+class WorkflowError(Exception):
+    """Raised when a workflow template or its bindings are invalid."""
+
+
+def resolution_to_dimensions(resolution):
+    """Map the resolution input to a 16:9 (width, height) pair."""
+    if resolution <= 480:
+        return 854, 480
+    elif resolution <= 640:
+        return 1138, 640
+    elif resolution <= 720:
+        return 1280, 720
+    else:  # 1080
+        return 1920, 1080
+
+
+# Named functions for derived values, referenced from the registry manifest
+DERIVATIONS = {
+    "half": lambda value: value // 2,
+    "width_16_9": lambda value: resolution_to_dimensions(value)[0],
+    "height_16_9": lambda value: resolution_to_dimensions(value)[1],
+}
+
+PARAM_TYPES = ("int", "float", "string", "seed", "image")
+
+
+class Binding:
+    """
+    One request parameter and the node inputs it is written to.
+
+    ``targets`` are ``[node_id, input_name]`` pairs. ``derived`` entries apply
+    a named function from DERIVATIONS to the value and write the result to
+    their own targets (e.g. split_step from steps, width/height from resolution).
+    """
+
+    def __init__(self, name, spec):
+        self.name = name
+        self.type = spec.get("type", "string")
+        if self.type not in PARAM_TYPES:
+            raise WorkflowError(f"Parameter '{name}' has unknown type '{self.type}'")
+        self.required = spec.get("required", False)
+        self.default = spec.get("default")
+        self.minimum = spec.get("min")
+        self.maximum = spec.get("max")
+        self.targets = [tuple(target) for target in spec.get("targets", [])]
+        self.derived = []
+        for derived in spec.get("derived", []):
+            if derived["fn"] not in DERIVATIONS:
+                raise WorkflowError(f"Parameter '{name}' uses unknown derivation '{derived['fn']}'")
+            self.derived.append((DERIVATIONS[derived["fn"]], [tuple(target) for target in derived["targets"]]))
+
+    def all_targets(self):
+        yield from self.targets
+        for _, targets in self.derived:
+            yield from targets
+
+    def parse(self, value):
+        """Convert and clamp a request value. Invalid numbers fall back to the default."""
+        if value is None:
+            value = self.default
+        if self.type in ("int", "seed"):
+            try:
+                value = int(value)
+            except (ValueError, TypeError):
+                value = int(self.default or 0)
+        elif self.type == "float":
+            try:
+                value = float(value)
+            except (ValueError, TypeError):
+                value = float(self.default or 0)
+        elif self.type == "string":
+            value = "" if value is None else str(value)
+
+        if self.type in ("int", "float"):
+            if self.minimum is not None:
+                value = max(self.minimum, value)
+            if self.maximum is not None:
+                value = min(self.maximum, value)
+        if self.type == "seed" and value == 0:
+            value = random.randint(0, 2**32 - 1)
+        return value
+
+
+class CompiledWorkflow:
+    """
+    A workflow template loaded once, with its bindings checked against its nodes.
+
+    ``render`` produces the prompt for a job by copying only the nodes that
+    bindings touch; all other nodes are shared with the template, so per-job
+    setup costs a handful of dict copies instead of a file read and JSON parse.
+    """
+
+    def __init__(self, name, template, spec, version):
+        self.name = name
+        self.template = template
+        self.version = version
+        self.output_node = str(spec.get("output_node", ""))
+        self.frame_format = spec.get("frame_format", "png")
+        self.bindings = {param: Binding(param, binding) for param, binding in spec.get("params", {}).items()}
+        # Ordered execution stages with relative weights, used for progress reporting
+        self.stages = [
+            {"name": stage["name"], "nodes": [str(node) for node in stage["nodes"]], "weight": stage.get("weight", 1)}
+            for stage in spec.get("stages", [])
+        ]
+        # Per-job memory settings (block swap, VAE tiling, ...), see MemoryProfiles
+        self.memory_profiles = None
+        if spec.get("memory_profiles"):
+            try:
+                self.memory_profiles = MemoryProfiles(spec["memory_profiles"])
+            except ValueError as e:
+                raise WorkflowError(f"Workflow '{name}': {e}")
+
+        if self.output_node not in template:
+            raise WorkflowError(f"Workflow '{name}': output node {self.output_node} not found")
+        for binding in self.bindings.values():
+            for node_id, _ in binding.all_targets():
+                if node_id not in template:
+                    raise WorkflowError(f"Workflow '{name}': node {node_id} for parameter '{binding.name}' not found")
+        for stage in self.stages:
+            for node_id in stage["nodes"]:
+                if node_id not in template:
+                    raise WorkflowError(f"Workflow '{name}': node {node_id} of stage '{stage['name']}' not found")
+        if self.memory_profiles:
+            for node_id, _ in self.memory_profiles.all_targets():
+                if node_id not in template:
+                    raise WorkflowError(f"Workflow '{name}': node {node_id} for memory profiles not found")
+
+    def image_params(self):
+        return [name for name, binding in self.bindings.items() if binding.type == "image"]
+
+    def deterministic(self, job_input):
+        """True when every seed parameter is set to a non-zero value, so the output is reproducible."""
+        for name, binding in self.bindings.items():
+            if binding.type != "seed":
+                continue
+            try:
+                if not int(job_input.get(name) or 0):
+                    return False
+            except (ValueError, TypeError):
+                return False
+        return True
+
+    def validate(self, job_input):
+        """
+        Validate request values against the bindings. Returns (values, error).
+
+        Image parameters are not read here; the handler resolves them from
+        ``<name>_base64``/``<name>_url`` inputs and passes uploaded filenames
+        to ``render``.
+        """
+        values = {}
+        for name, binding in self.bindings.items():
+            if binding.type == "image":
+                continue
+            raw = job_input.get(name)
+            if raw is None and binding.required:
+                return None, f"'{name}' is required for workflow '{self.name}'"
+            values[name] = binding.parse(raw)
+        return values, None
+
+    def render(self, values, overrides=()):
+        """
+        Return the prompt with all bound values written into a copy of the template.
+
+        ``overrides`` are extra ``(node_id, input_name, value)`` writes, applied
+        after the bindings (e.g. a memory profile's settings).
+        """
+        workflow = dict(self.template)
+        copied = set()
+
+        def write(node_id, input_name, value):
+            if node_id not in copied:
+                node = dict(workflow[node_id])
+                node["inputs"] = dict(node.get("inputs", {}))
+                workflow[node_id] = node
+                copied.add(node_id)
+            workflow[node_id]["inputs"][input_name] = value
+
+        for name, binding in self.bindings.items():
+            if name not in values:
+                continue
+            for node_id, input_name in binding.targets:
+                write(node_id, input_name, values[name])
+            for derive, targets in binding.derived:
+                derived_value = derive(values[name])
+                for node_id, input_name in targets:
+                    write(node_id, input_name, derived_value)
+        for node_id, input_name, value in overrides:
+            write(node_id, input_name, value)
+        return workflow
+
+
+def load_template(path):
+    """Load a workflow in API format, unwrapping {"input": {"workflow": ...}} request files."""
+    with open(path, "rb") as f:
+        raw = f.read()
+    template = json.loads(raw)
+    if isinstance(template, dict) and "input" in template:
+        template = template["input"].get("workflow")
+    if not isinstance(template, dict):
+        raise WorkflowError(f"{path}: invalid workflow structure - must be a dictionary")
+    return template, hashlib.sha256(raw).hexdigest()[:16]
+
+
+class WorkflowRegistry:
+    """Workflow templates compiled at startup, selected by name per request."""
+
+    def __init__(self, workflows, default=None, errors=None):
+        self.workflows = workflows
+        self.default = default
+        self.errors = errors or {}
+
+    @classmethod
+    def load(cls, manifest_path):
+        """
+        Load and compile every template listed in the manifest.
+
+        Template paths are relative to the manifest. A broken template is
+        recorded in ``errors`` instead of preventing the others from loading.
+        """
+        with open(manifest_path, "r") as f:
+            manifest = json.load(f)
+        base_dir = os.path.dirname(os.path.abspath(manifest_path))
+
+        workflows = {}
+        errors = {}
+        for name, spec in manifest.get("workflows", {}).items():
+            try:
+                template, version = load_template(os.path.join(base_dir, spec["file"]))
+                workflows[name] = CompiledWorkflow(name, template, spec, version)
+            except Exception as e:
+                errors[name] = str(e)
+                print(f"Failed to load workflow '{name}': {e}")
+        return cls(workflows, manifest.get("default"), errors)
+
+    def get(self, name=None):
+        """Return (workflow, error) for a name, or the default workflow."""
+        name = name or self.default
+        if name in self.workflows:
+            return self.workflows[name], None
+        if name in self.errors:
+            return None, f"Workflow '{name}' failed to load: {self.errors[name]}"
+        return None, f"Unknown workflow '{name}'. Available: {', '.join(sorted(self.workflows))}"
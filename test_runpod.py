@@ -1,72 +1,259 @@
-import requests
-import json
+#!/usr/bin/env python3
+"""
+Load generator for the worker endpoint.
+
+Sends ``--jobs`` copies of a payload to a RunPod endpoint (``.../run`` or
+``.../runsync``) or to the local ``--rp_serve_api`` server at a target arrival
+rate, with at most ``--concurrency`` jobs in flight. ``/run`` jobs are polled
+on ``/status/{id}`` until they finish. For every job it records the queue
+delay, execution time and end-to-end latency (RunPod's ``delayTime`` and
+``executionTime`` when the response has them, client-side measurements
+otherwise), the outcome and the response size, then prints p50/p95/p99,
+throughput and an error breakdown.
+
+Reports can be written as JSON (summary and per-job results) and CSV (one row
+per job), and a previous JSON report can be passed to ``--compare`` to see
+the difference.
+
+Usage:
+  python test_runpod.py API_KEY --url https://api.runpod.ai/v2/<endpoint>/run --jobs 20 --concurrency 5 --rate 0.5
+  python test_runpod.py --url http://localhost:8000/runsync --jobs 10 --concurrency 2 --json local.json
+"""
+
 import argparse
+import asyncio
+import csv
+import json
+import os
+import random
 import sys
 import time
 
-def test_endpoint(endpoint_url, api_key, payload_file):
-    headers = {
-        "Content-Type": "application/json",
-        "Authorization": f"Bearer {api_key}"
+import aiohttp
+
+FINAL_STATUSES = ("COMPLETED", "FAILED", "CANCELLED", "TIMED_OUT")
+CSV_FIELDS = ["index", "job_id", "status", "error", "queue_s", "execution_s", "e2e_s", "response_bytes"]
+
+
+def percentile(values, pct):
+    """Linear-interpolated percentile of a list of numbers, or None when empty."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = (len(ordered) - 1) * pct / 100
+    low = int(rank)
+    high = min(low + 1, len(ordered) - 1)
+    return ordered[low] + (ordered[high] - ordered[low]) * (rank - low)
+
+
+def classify_error(status_data):
+    """Error category of a finished job, or None for a successful one."""
+    status = status_data.get("status")
+    if status == "COMPLETED":
+        output = status_data.get("output")
+        if isinstance(output, dict) and "error" in output:
+            return "handler_error"
+        return None
+    if status == "FAILED":
+        return "job_failed"
+    if status in ("CANCELLED", "TIMED_OUT"):
+        return status.lower()
+    return f"status_{status or 'unknown'}".lower()
+
+
+def status_url(endpoint_url, job_id):
+    base = endpoint_url.rsplit("/", 1)[0]
+    return f"{base}/status/{job_id}"
+
+
+async def run_job(session, index, args, payload):
+    """Submit one job and wait for its outcome. Returns its result record."""
+    result = {"index": index, "job_id": None, "status": None, "error": None,
+              "queue_s": None, "execution_s": None, "e2e_s": None, "response_bytes": 0}
+    started = time.perf_counter()
+    in_progress_at = None
+    try:
+        async with session.post(args.url, json=payload) as response:
+            body = await response.read()
+            result["response_bytes"] = len(body)
+            if response.status != 200:
+                result["error"] = f"http_{response.status}"
+                return result
+            data = json.loads(body)
+        result["job_id"] = data.get("id")
+
+        while data.get("status") not in FINAL_STATUSES:
+            if not result["job_id"]:
+                break
+            if data.get("status") == "IN_PROGRESS" and in_progress_at is None:
+                in_progress_at = time.perf_counter()
+            if time.perf_counter() - started > args.timeout:
+                result["error"] = "timeout"
+                return result
+            await asyncio.sleep(args.poll_interval)
+            async with session.get(status_url(args.url, result["job_id"])) as response:
+                body = await response.read()
+                if response.status != 200:
+                    result["error"] = f"http_{response.status}"
+                    return result
+                result["response_bytes"] = len(body)
+                data = json.loads(body)
+
+        finished = time.perf_counter()
+        result["status"] = data.get("status")
+        result["error"] = classify_error(data)
+        result["e2e_s"] = finished - started
+        # RunPod reports both in milliseconds; the local test server doesn't
+        if "delayTime" in data:
+            result["queue_s"] = data["delayTime"] / 1000
+        elif in_progress_at is not None:
+            result["queue_s"] = in_progress_at - started
+        if "executionTime" in data:
+            result["execution_s"] = data["executionTime"] / 1000
+        elif in_progress_at is not None:
+            result["execution_s"] = finished - in_progress_at
+        return result
+    except asyncio.TimeoutError:
+        result["error"] = "timeout"
+    except aiohttp.ClientConnectionError:
+        result["error"] = "connection"
+    except aiohttp.ClientError as e:
+        result["error"] = f"client_{type(e).__name__}"
+    except ValueError:
+        result["error"] = "invalid_response"
+    result["e2e_s"] = time.perf_counter() - started
+    return result
+
+
+async def run_load(args, payload):
+    """Start jobs at the target arrival rate, at most ``args.concurrency`` at a time. Returns (results, wall seconds)."""
+    headers = {"Content-Type": "application/json"}
+    if args.api_key:
+        headers["Authorization"] = f"Bearer {args.api_key}"
+    limit = asyncio.Semaphore(args.concurrency)
+    timeout = aiohttp.ClientTimeout(total=args.timeout)
+
+    async def limited(index):
+        async with limit:
+            result = await run_job(session, index, args, payload)
+        if not args.quiet:
+            print(f"job {index}: {result['status'] or '-'} {result['error'] or 'ok'} "
+                  f"e2e={result['e2e_s'] or 0:.1f}s", flush=True)
+        return result
+
+    async with aiohttp.ClientSession(headers=headers, timeout=timeout) as session:
+        started = time.perf_counter()
+        tasks = []
+        for index in range(args.jobs):
+            tasks.append(asyncio.create_task(limited(index)))
+            if args.rate and index < args.jobs - 1:
+                await asyncio.sleep(random.expovariate(args.rate) if args.arrival == "poisson" else 1 / args.rate)
+        results = await asyncio.gather(*tasks)
+        return results, time.perf_counter() - started
+
+
+def summarize(results, wall_s):
+    succeeded = [r for r in results if r["error"] is None]
+    errors = {}
+    for r in results:
+        if r["error"] is not None:
+            errors[r["error"]] = errors.get(r["error"], 0) + 1
+
+    def stats(key):
+        values = [r[key] for r in succeeded if r[key] is not None]
+        return {f"p{pct}": percentile(values, pct) for pct in (50, 95, 99)}
+
+    sizes = [r["response_bytes"] for r in succeeded]
+    return {
+        "jobs": len(results),
+        "succeeded": len(succeeded),
+        "wall_s": wall_s,
+        "throughput_jobs_per_min": len(succeeded) / wall_s * 60 if wall_s else 0.0,
+        "queue_s": stats("queue_s"),
+        "execution_s": stats("execution_s"),
+        "e2e_s": stats("e2e_s"),
+        "response_bytes": {"mean": sum(sizes) / len(sizes) if sizes else 0, "max": max(sizes, default=0)},
+        "errors": errors,
     }
 
+
+def format_seconds(value):
+    return "-" if value is None else f"{value:.2f}"
+
+
+def print_summary(summary, baseline=None):
+    print(f"\n{summary['succeeded']}/{summary['jobs']} jobs succeeded in {summary['wall_s']:.1f}s "
+          f"({summary['throughput_jobs_per_min']:.2f} jobs/min)")
+    print(f"{'':>12} {'p50':>8} {'p95':>8} {'p99':>8}")
+    for key in ("queue_s", "execution_s", "e2e_s"):
+        row = " ".join(f"{format_seconds(summary[key][p]):>8}" for p in ("p50", "p95", "p99"))
+        if baseline:
+            deltas = []
+            for p in ("p50", "p95", "p99"):
+                old, new = baseline[key][p], summary[key][p]
+                deltas.append("-" if old is None or new is None else f"{new - old:+.2f}")
+            row += "   (vs baseline " + " ".join(deltas) + ")"
+        print(f"{key:>12} {row}")
+    if baseline:
+        print(f"throughput vs baseline: {summary['throughput_jobs_per_min'] - baseline['throughput_jobs_per_min']:+.2f} jobs/min")
+    print(f"response bytes: mean {summary['response_bytes']['mean']:.0f}, max {summary['response_bytes']['max']}")
+    if summary["errors"]:
+        print("errors: " + ", ".join(f"{name}={count}" for name, count in sorted(summary["errors"].items())))
+
+
+def write_reports(args, summary, results):
+    if args.json:
+        config = {key: getattr(args, key) for key in ("url", "payload", "jobs", "concurrency", "rate", "arrival", "label")}
+        with open(args.json, "w") as f:
+            json.dump({"config": config, "summary": summary, "results": results}, f, indent=2)
+    if args.csv:
+        with open(args.csv, "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=CSV_FIELDS)
+            writer.writeheader()
+            writer.writerows(results)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Concurrent load test for the worker endpoint")
+    parser.add_argument("api_key", nargs="?", default=os.environ.get("RUNPOD_API_KEY"),
+                        help="RunPod API key (default: RUNPOD_API_KEY; not needed for the local server)")
+    parser.add_argument("--url", default="https://api.runpod.ai/v2/mi9rxwoaz232lv/run",
+                        help="Endpoint URL ending in /run or /runsync (e.g. http://localhost:8000/run)")
+    parser.add_argument("--payload", default="postman_example.json", help="Path to payload JSON")
+    parser.add_argument("--jobs", type=int, default=1, help="Total jobs to send")
+    parser.add_argument("--concurrency", type=int, default=1, help="Maximum jobs in flight")
+    parser.add_argument("--rate", type=float, default=0.0, help="Target arrival rate in jobs/s (0 = all at once)")
+    parser.add_argument("--arrival", choices=["uniform", "poisson"], default="uniform", help="Arrival process")
+    parser.add_argument("--poll-interval", type=float, default=2.0, help="Seconds between /status polls")
+    parser.add_argument("--timeout", type=float, default=1800.0, help="Per-job timeout in seconds")
+    parser.add_argument("--label", help="Name of this run in the JSON report")
+    parser.add_argument("--json", help="Write the summary and per-job results to this JSON file")
+    parser.add_argument("--csv", help="Write per-job results to this CSV file")
+    parser.add_argument("--compare", help="JSON report of a previous run to compare against")
+    parser.add_argument("--quiet", action="store_true", help="Only print the summary")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
     try:
-        with open(payload_file, 'r') as f:
+        with open(args.payload) as f:
             payload = json.load(f)
     except Exception as e:
         print(f"Error loading payload file: {e}")
-        return
-
-    print(f"Sending request to {endpoint_url}...")
-    
-    # 1. Initiate Job (RunSync) or Async?
-    # The user provided ".../run", which usually returns a job ID (async).
-    # ".../runsync" waits.
-    # We will try runsync first if the URL ends with runsync, otherwise we handle async.
-    
-    if endpoint_url.endswith("/runsync"):
-         response = requests.post(endpoint_url, headers=headers, json=payload, timeout=600)
-         print(f"Status Code: {response.status_code}")
-         print("Response:")
-         print(json.dumps(response.json(), indent=2))
-    else:
-        # Async run
-        response = requests.post(endpoint_url, headers=headers, json=payload, timeout=30)
-        if response.status_code != 200:
-             print(f"Error ({response.status_code}): {response.text}")
-             return
-             
-        job_data = response.json()
-        job_id = job_data.get("id")
-        print(f"Job started with ID: {job_id}")
-        
-        # Poll for status
-        status_url = endpoint_url.replace("/run", f"/status/{job_id}")
-        
-        while True:
-            time.sleep(2)
-            status_resp = requests.get(status_url, headers=headers)
-            status_data = status_resp.json()
-            status = status_data.get("status")
-            print(f"Status: {status}")
-            
-            if status == "COMPLETED":
-                print("Job Completed!")
-                print("Output:")
-                print(json.dumps(status_data.get("output"), indent=2))
-                break
-            elif status == "FAILED":
-                print("Job Failed.")
-                print("Error:")
-                print(status_data.get("error"))
-                break
+        return 1
+
+    print(f"Sending {args.jobs} jobs to {args.url} (concurrency {args.concurrency}, rate {args.rate or 'unlimited'}/s)")
+    results, wall_s = asyncio.run(run_load(args, payload))
+    summary = summarize(results, wall_s)
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)["summary"]
+    print_summary(summary, baseline)
+    write_reports(args, summary, results)
+    return 0 if summary["succeeded"] == summary["jobs"] else 1
+
 
 if __name__ == "__main__":
-    parser = argparse.ArgumentParser(description="Test RunPod Endpoint")
-    parser.add_argument("api_key", help="Your RunPod API Key")
-    parser.add_argument("--url", default="https://api.runpod.ai/v2/mi9rxwoaz232lv/run", help="Endpoint URL")
-    parser.add_argument("--payload", default="postman_example.json", help="Path to payload JSON")
-    
-    args = parser.parse_args()
-    
-    test_endpoint(args.url, args.api_key, args.payload)
+    sys.exit(main())
@@ -0,0 +1,13 @@
+class FakeClock:
+    """Stand-in for time.monotonic that tests advance by hand; ``sleep`` advances it too."""
+
+    def __init__(self, now=0.0):
+        self.now = now
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(round(seconds, 4))
+        self.now += seconds
@@ -0,0 +1,173 @@
+import unittest
+from unittest.mock import patch
+import json
+import queue
+
+import websocket
+
+import handler
+from src.comfy_events import ComfyEventClient
+from src.concurrency import PromptGate
+from src.startup import Readiness
+
+
+class FakeWebSocket:
+    """Websocket stand-in fed from a queue; an Exception item simulates a dropped connection."""
+
+    def __init__(self):
+        self.messages = queue.Queue()
+        self.url = None
+        self.pings = 0
+
+    def connect(self, url, timeout=None):
+        self.url = url
+
+    def settimeout(self, timeout):
+        pass
+
+    def recv_data(self, control_frame=False):
+        item = self.messages.get(timeout=5)
+        if isinstance(item, Exception):
+            raise item
+        if isinstance(item, tuple):
+            return item
+        return websocket.ABNF.OPCODE_TEXT, item.encode()
+
+    def ping(self):
+        self.pings += 1
+
+    def close(self):
+        self.messages.put(ConnectionError("closed"))
+
+
+def event(event_type, prompt_id, **data):
+    return json.dumps({"type": event_type, "data": dict(data, prompt_id=prompt_id)})
+
+
+class TestComfyEventClient(unittest.TestCase):
+    def setUp(self):
+        self.client = ComfyEventClient("comfy:8188", reconnect_attempts=2, reconnect_delay=0, ws_factory=FakeWebSocket)
+        self.assertTrue(self.client.ensure_connected())
+        self.ws = self.client._ws
+
+    def tearDown(self):
+        self.client.close()
+
+    def test_single_connection_uses_worker_client_id(self):
+        self.assertTrue(self.client.ensure_connected())
+        self.assertIs(self.client._ws, self.ws)
+        self.assertIn(f"clientId={self.client.client_id}", self.ws.url)
+
+    def test_routes_events_by_prompt_id(self):
+        first = self.client.register("p1")
+        second = self.client.register("p2")
+        self.ws.messages.put(event("progress", "p2", value=1, max=8))
+        self.ws.messages.put(event("executing", "p1", node=None))
+        self.assertEqual(first.get(2)["type"], "executing")
+        self.assertEqual(second.get(2)["type"], "progress")
+        self.assertIsNone(first.get(0.05))
+
+    def test_replays_events_that_arrive_before_register(self):
+        self.ws.messages.put(event("executing", "early", node=None))
+        self.ws.messages.put(event("executing", "marker", node=None))
+        marker = self.client.register("marker")
+        marker.get(2)
+        self.assertEqual(self.client.register("early").get(0.5)["data"]["node"], None)
+
+    def test_reconnects_after_drop(self):
+        waiter = self.client.register("p1")
+        self.ws.messages.put(ConnectionError("reset"))
+        self.assertEqual(waiter.get(2)["type"], "disconnected")
+        self.assertEqual(waiter.get(2)["type"], "reconnected")
+        self.assertTrue(self.client.connected)
+        self.client._ws.messages.put(event("executing", "p1", node=None))
+        self.assertEqual(waiter.get(2)["type"], "executing")
+
+    def test_only_the_reader_reconnects(self):
+        sockets = []
+
+        def factory():
+            sockets.append(FakeWebSocket())
+            return sockets[-1]
+
+        client = ComfyEventClient("comfy:8188", reconnect_attempts=1, reconnect_delay=0.3, ws_factory=factory)
+        self.addCleanup(client.close)
+        self.assertTrue(client.ensure_connected())
+        reader = client._reader
+        waiter = client.register("p1")
+        sockets[0].messages.put(ConnectionError("reset"))
+        self.assertEqual(waiter.get(2)["type"], "disconnected")
+        # During the reconnect backoff callers are told the socket is down instead of opening their own
+        self.assertFalse(client.ensure_connected())
+        self.assertEqual(waiter.get(2)["type"], "reconnected")
+        self.assertTrue(client.ensure_connected())
+        self.assertEqual(len(sockets), 2)
+        self.assertIs(client._reader, reader)
+
+    def test_silent_socket_is_pinged_then_declared_dead(self):
+        waiter = self.client.register("p1")
+        for _ in range(3):
+            self.ws.messages.put(websocket.WebSocketTimeoutException("timed out"))
+        self.assertEqual(waiter.get(2)["type"], "disconnected")
+        self.assertEqual(self.ws.pings, 2)
+
+
+class TestExecuteWorkflow(unittest.TestCase):
+    def setUp(self):
+        self.client = ComfyEventClient("comfy:8188", reconnect_attempts=0, reconnect_delay=0, ws_factory=FakeWebSocket)
+        for name, value in (("comfy_events", self.client), ("prompt_gate", PromptGate(lambda: (0, 0, None)))):
+            patcher = patch(f"handler.{name}", value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.addCleanup(self.client.close)
+
+    def queue_and_finish(self, *messages):
+        def queue_workflow(workflow, client_id):
+            for message in messages:
+                self.client._ws.messages.put(message)
+            return {"prompt_id": "p1"}
+        return queue_workflow
+
+    @patch("handler.get_history", return_value={"p1": {"outputs": {"117": {"images": []}}}})
+    def test_completes_on_executing_none(self, _):
+        with patch("handler.queue_workflow", side_effect=self.queue_and_finish(event("executing", "p1", node=None))):
+            outputs, error = handler.execute_workflow({})
+        self.assertIsNone(error)
+        self.assertEqual(outputs, {"117": {"images": []}})
+
+    def test_execution_error(self):
+        with patch("handler.queue_workflow", side_effect=self.queue_and_finish(event("execution_error", "p1", node_id="3"))):
+            outputs, error = handler.execute_workflow({})
+        self.assertIsNone(outputs)
+        self.assertIn("Workflow execution error", error["error"])
+
+    @patch("handler.get_history", side_effect=[{}, {"p1": {"status": {"status_str": "success"}, "outputs": {"9": {}}}}])
+    def test_falls_back_to_history_polling_when_socket_drops(self, get_history):
+        with patch("handler.COMFY_API_AVAILABLE_INTERVAL_MS", 10), \
+                patch("handler.queue_workflow", side_effect=self.queue_and_finish(ConnectionError("reset"))), \
+                patch.object(FakeWebSocket, "connect", side_effect=[None, ConnectionError("refused"), ConnectionError("refused")]):
+            outputs, error = handler.execute_workflow({})
+        self.assertIsNone(error)
+        self.assertEqual(outputs, {"9": {}})
+        self.assertEqual(get_history.call_count, 2)
+
+    def test_lost_connection_resets_readiness(self):
+        readiness = Readiness(lambda: True)
+        readiness.wait(1)
+        with patch("handler.readiness", readiness), \
+                patch("handler.queue_workflow", side_effect=handler.requests.ConnectionError("refused")):
+            outputs, error = handler.execute_workflow({})
+        self.assertIn("Execution failed", error["error"])
+        self.assertFalse(readiness.ready)
+
+    def test_workflow_errors_keep_readiness(self):
+        readiness = Readiness(lambda: True)
+        readiness.wait(1)
+        with patch("handler.readiness", readiness), \
+                patch("handler.queue_workflow", side_effect=self.queue_and_finish(event("execution_error", "p1", node_id="3"))):
+            handler.execute_workflow({})
+        self.assertTrue(readiness.ready)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,168 @@
+import unittest
+from unittest.mock import patch
+import asyncio
+import threading
+import time
+
+import handler
+from src.concurrency import PromptGate, free_ram_fraction, pending_prompts
+
+JOB = {"id": "job-1", "input": {"start_image_base64": "c3RhcnQ=", "end_image_base64": "ZW5k", "chunk_size": 2}}
+OUTPUTS = {"117": {"images": [{"filename": f"frame_{i}.png", "subfolder": "", "type": "output"} for i in range(3)]}}
+
+
+class TestPromptGate(unittest.TestCase):
+    def setUp(self):
+        self.states = []
+        self.sleeps = []
+
+        def probe():
+            state = self.states.pop(0) if len(self.states) > 1 else self.states[0]
+            if isinstance(state, Exception):
+                raise state
+            return state
+
+        self.gate = PromptGate(probe, max_pending=1, min_free_ram=0.15, probe_interval=2, sleep=self.sleeps.append)
+
+    def test_no_wait_without_pressure(self):
+        self.states = [(1, 0, 0.5)]
+        self.assertTrue(self.gate.wait())
+        self.assertEqual(self.sleeps, [])
+
+    def test_pending_prompts_and_low_memory_apply_backpressure(self):
+        self.states = [(1, 1, 0.5), (1, 0, 0.1), (1, 0, 0.4)]
+        self.assertTrue(self.gate.wait())
+        self.assertEqual(self.sleeps, [2, 2])
+
+    def test_low_memory_does_not_hold_back_an_idle_comfyui(self):
+        # Nothing running would free the memory, so waiting would never end
+        self.states = [(0, 0, 0.05)]
+        self.assertTrue(self.gate.wait())
+        self.assertEqual(self.sleeps, [])
+
+    def test_probe_failure_lets_prompt_through(self):
+        self.states = [(1, 2, 0.5), ConnectionError("comfy down")]
+        self.assertTrue(self.gate.wait())
+        self.assertEqual(self.sleeps, [2])
+
+    def test_cancelled_while_waiting(self):
+        self.states = [(1, 2, 0.5)]
+        self.gate.probe_interval = 0.01
+        cancelled = threading.Event()
+        threading.Timer(0.05, cancelled.set).start()
+        self.assertFalse(self.gate.wait(cancelled))
+
+    def test_prompts_are_admitted_one_at_a_time(self):
+        self.states = [(0, 0, 0.5)]
+        holding, peak = [], []
+
+        def queue():
+            with self.gate.admit():
+                holding.append(1)
+                peak.append(len(holding))
+                time.sleep(0.02)
+                holding.pop()
+
+        threads = [threading.Thread(target=queue) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(peak, [1, 1, 1])
+
+    def test_concurrency_is_constant(self):
+        self.assertEqual({handler.concurrency_modifier(n) for n in (1, 2, 3)}, {handler.WORKER_CONCURRENCY})
+
+    def test_comfy_response_parsing(self):
+        self.assertEqual(pending_prompts({"queue_running": [[0, "a"]], "queue_pending": [[1, "b"], [2, "c"]]}), 2)
+        self.assertEqual(free_ram_fraction({"system": {"ram_total": 100, "ram_free": 25}}), 0.25)
+        self.assertIsNone(free_ram_fraction({}))
+
+
+class TestAsyncHandlers(unittest.TestCase):
+    def test_jobs_run_concurrently(self):
+        running = []
+        peak = []
+        lock = threading.Lock()
+
+        def slow_handler(job, cancelled=None):
+            with lock:
+                running.append(job["id"])
+                peak.append(len(running))
+            time.sleep(0.2)
+            with lock:
+                running.remove(job["id"])
+            return {"id": job["id"]}
+
+        async def run_all():
+            return await asyncio.gather(*(handler.async_handler({"id": f"job-{i}"}) for i in range(3)))
+
+        with patch("handler.handler", side_effect=slow_handler):
+            results = asyncio.run(run_all())
+        self.assertEqual([r["id"] for r in results], ["job-0", "job-1", "job-2"])
+        self.assertEqual(max(peak), 3)
+
+    def test_cancel_signals_running_job(self):
+        started = threading.Event()
+        seen = []
+
+        def blocking_handler(job, cancelled=None):
+            started.set()
+            seen.append(cancelled.wait(5))
+            return {}
+
+        async def cancel_job():
+            task = asyncio.create_task(handler.async_handler(JOB))
+            await asyncio.to_thread(started.wait, 5)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+
+        with patch("handler.handler", side_effect=blocking_handler):
+            asyncio.run(cancel_job())
+        self.assertEqual(seen, [True])
+
+    @patch("handler.execute_workflow", return_value=(OUTPUTS, None))
+    @patch("handler.upload_image_bytes", return_value=True)
+    @patch("handler.check_server", return_value=True)
+    @patch("handler.get_image_data", side_effect=lambda f, s, t: f.encode())
+    def test_async_stream_yields_same_items(self, *_):
+        async def collect():
+            return [item async for item in handler.async_stream_handler(JOB)]
+
+        items = asyncio.run(collect())
+        self.assertIn("metadata", items[0])
+        self.assertEqual([len(item["frames"]) for item in items if "frames" in item], [2, 1])
+        self.assertEqual(items[-1]["status"], "completed")
+
+    def test_async_stream_closes_job_when_cancelled(self):
+        started, closed = threading.Event(), []
+
+        def run_job(job, cancelled=None):
+            try:
+                yield {"metadata": {}}
+                started.set()
+                cancelled.wait(5)
+                time.sleep(0.2)  # Still producing an item when the task is cancelled
+                yield {"status": "completed"}
+            finally:
+                closed.append(cancelled.is_set())
+
+        async def cancel_stream():
+            async def consume():
+                return [item async for item in handler.async_stream_handler(JOB)]
+
+            task = asyncio.create_task(consume())
+            await asyncio.to_thread(started.wait, 5)
+            task.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await task
+            # Closed before the cancelled task finished, not whenever the generator is collected
+            self.assertEqual(closed, [True])
+
+        with patch("handler.run_job", side_effect=run_job):
+            asyncio.run(cancel_stream())
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,115 @@
+import unittest
+import base64
+import io
+import json
+import os
+
+import decode_output
+from decode_output import JsonStream, iter_outputs
+from tests.test_video import FakeFfmpegMixin
+
+FRAMES = [b"\x89PNG frame %d" % i for i in range(5)]
+ENCODED = [base64.b64encode(frame).decode() for frame in FRAMES]
+
+
+def flatten(value, path=()):
+    if isinstance(value, dict):
+        for key, item in value.items():
+            yield from flatten(item, path + (key,))
+    elif isinstance(value, list):
+        for index, item in enumerate(value):
+            yield from flatten(item, path + (index,))
+    else:
+        yield path, value
+
+
+class TestJsonStream(unittest.TestCase):
+    def test_matches_json_module_for_any_chunk_size(self):
+        document = {
+            "id": "job-1", "status": "COMPLETED", "delayTime": 1250, "ratio": -1.5e-3,
+            "output": {"frames": ENCODED, "metadata": {"format": "png", "nested": [[], {}, [True, False, None]]}},
+            "escaped": 'a "quoted" \\ path\\/ é',
+        }
+        text = json.dumps(document, indent=2)
+        for chunk_size in (1, 3, 7, 64, 1 << 20):
+            self.assertEqual(list(JsonStream(io.StringIO(text), chunk_size)), list(flatten(document)), chunk_size)
+
+    def test_reads_newline_delimited_values(self):
+        text = '{"metadata": {"frame_count": 2}}\n{"frames": ["a", "b"], "index": 0}\n'
+        events = list(JsonStream(io.StringIO(text), 4))
+        self.assertIn((("frames", 1), "b"), events)
+        self.assertIn((("index",), 0), events)
+
+    def test_invalid_json_raises(self):
+        for text in ('{"frames": ["abc"', '{"frames" ["abc"]}', '{"a": nope}', '"unterminated'):
+            with self.assertRaises(ValueError, msg=text):
+                list(JsonStream(io.StringIO(text), 4))
+
+
+class TestIterOutputs(unittest.TestCase):
+    def outputs(self, document):
+        return list(iter_outputs(flatten(document)))
+
+    def test_status_response(self):
+        outputs = self.outputs({"status": "COMPLETED", "output": {"frames": ENCODED[:2], "metadata": {"frame_count": 2}}})
+        self.assertEqual(outputs, [("frame", 0, ENCODED[0]), ("frame", 0, ENCODED[1])])
+
+    def test_variants_are_numbered_by_position(self):
+        outputs = self.outputs({"output": {"variants": [{"frames": ENCODED[:1]}, {"video": "dmlk"}]}})
+        self.assertEqual(outputs, [("frame", 0, ENCODED[0]), ("video", 1, "dmlk")])
+
+    def test_streamed_items_split_on_completed(self):
+        items = [
+            {"metadata": {"seed": 1}, "variant": 0},
+            {"frames": ENCODED[:2], "index": 0, "variant": 0},
+            {"status": "completed", "frame_count": 2, "variant": 0},
+            {"frames": ENCODED[2:3], "index": 0, "variant": 1},
+            {"status": "completed", "frame_count": 1, "variant": 1},
+        ]
+        outputs = self.outputs({"status": "COMPLETED", "stream": [{"output": item} for item in items]})
+        self.assertEqual([(kind, variant) for kind, variant, _ in outputs], [("frame", 0), ("frame", 0), ("frame", 1)])
+
+    def test_errors(self):
+        self.assertEqual(self.outputs({"output": {"error": "boom"}}), [("error", 0, "boom")])
+
+
+class TestDecodeOutput(FakeFfmpegMixin, unittest.TestCase):
+    def decode(self, document, **options):
+        return decode_output.decode_output(io.StringIO(json.dumps(document)), chunk_size=16, **options)
+
+    def test_writes_numbered_pngs_in_order(self):
+        frames_dir = os.path.join(self.tmpdir, "frames")
+        written, errors = self.decode({"output": {"frames": ENCODED}}, frames_dir=frames_dir, workers=2)
+        self.assertEqual(written, {0: {"path": frames_dir, "frames": 5}})
+        self.assertEqual(errors, [])
+        for index, frame in enumerate(FRAMES):
+            with open(os.path.join(frames_dir, f"frame_{index:05d}.png"), "rb") as f:
+                self.assertEqual(f.read(), frame)
+
+    def test_pipes_frames_into_ffmpeg_per_variant(self):
+        output = os.path.join(self.tmpdir, "out.mp4")
+        document = {"output": {"variants": [{"frames": ENCODED[:2]}, {"frames": ENCODED[2:]}]}}
+        written, _ = self.decode(document, output=output, ffmpeg=self.ffmpeg, workers=0)
+        self.assertEqual(written[1], {"path": os.path.join(self.tmpdir, "out_v1.mp4"), "frames": 3})
+        with open(output, "rb") as f:
+            self.assertEqual(f.read(), b"".join(FRAMES[:2]))
+        with open(written[1]["path"], "rb") as f:
+            self.assertEqual(f.read(), b"".join(FRAMES[2:]))
+
+    def test_writes_encoded_video(self):
+        output = os.path.join(self.tmpdir, "video.webm")
+        video = b"\x1a\x45\xdf\xa3webm"
+        written, _ = self.decode({"output": {"video": base64.b64encode(video).decode()}}, output=output, workers=0)
+        self.assertEqual(written, {0: {"path": output, "frames": None}})
+        with open(output, "rb") as f:
+            self.assertEqual(f.read(), video)
+
+    def test_main_reports_handler_error(self):
+        path = os.path.join(self.tmpdir, "response.json")
+        with open(path, "w") as f:
+            json.dump({"output": {"error": "ComfyUI server unreachable"}}, f)
+        self.assertEqual(decode_output.main([path, "--frames-dir", os.path.join(self.tmpdir, "frames")]), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
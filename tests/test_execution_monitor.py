@@ -0,0 +1,132 @@
+import unittest
+from unittest.mock import MagicMock, patch
+import json
+import threading
+
+import handler
+from src.comfy_events import ComfyEventClient
+from src.concurrency import PromptGate
+from src.execution_monitor import cancel_prompt, execution_deadline, queue_position
+
+QUEUE = {
+    "queue_running": [[0, "running-id", {}, {}, ["117"]]],
+    "queue_pending": [[1, "pending-id", {}, {}, ["117"]]],
+}
+
+
+class TestExecutionDeadline(unittest.TestCase):
+    def test_scales_with_steps_frames_and_pixels(self):
+        small = execution_deadline({"steps": 4, "frame_length": 17}, (854, 480), 0, 1, 0, 10**6, 1200)
+        large = execution_deadline({"steps": 8, "frame_length": 65}, (1920, 1080), 0, 1, 0, 10**6, 1200)
+        self.assertAlmostEqual(large / small, (8 * 65 * 1920 * 1080) / (4 * 17 * 854 * 480))
+
+    def test_clamped_to_range(self):
+        self.assertEqual(execution_deadline({"steps": 4}, (64, 64), 0, 0.5, 300, 3600, 1200), 300)
+        self.assertEqual(execution_deadline({"steps": 20, "frame_length": 129}, (1920, 1080), 120, 100, 300, 3600, 1200), 3600)
+
+    def test_default_without_steps(self):
+        self.assertEqual(execution_deadline({"positive_prompt": "x"}, None, 120, 0.5, 300, 3600, 1200), 1200)
+
+
+class TestCancelPrompt(unittest.TestCase):
+    def session(self):
+        session = MagicMock()
+        session.get.return_value.json.return_value = QUEUE
+        return session
+
+    def test_queue_position(self):
+        self.assertEqual(queue_position(QUEUE, "running-id"), "running")
+        self.assertEqual(queue_position(QUEUE, "pending-id"), "pending")
+        self.assertIsNone(queue_position(QUEUE, "done-id"))
+
+    def test_pending_prompt_is_deleted(self):
+        session = self.session()
+        self.assertEqual(cancel_prompt(session, "comfy:8188", "pending-id"), "deleted")
+        url = session.post.call_args[0][0]
+        self.assertEqual(url, "http://comfy:8188/queue")
+        self.assertEqual(json.loads(session.post.call_args[1]["data"]), {"delete": ["pending-id"]})
+
+    def test_running_prompt_is_interrupted(self):
+        session = self.session()
+        self.assertEqual(cancel_prompt(session, "comfy:8188", "running-id"), "interrupted")
+        self.assertEqual(session.post.call_args[0][0], "http://comfy:8188/interrupt")
+
+    def test_finished_prompt_is_left_alone(self):
+        session = self.session()
+        self.assertIsNone(cancel_prompt(session, "comfy:8188", "done-id"))
+        session.post.assert_not_called()
+
+
+@patch("handler.stop_prompt")
+@patch("handler.queue_workflow", return_value={"prompt_id": "p1"})
+class TestWatchdog(unittest.TestCase):
+    def setUp(self):
+        # No ComfyUI to connect to: the job waits via (empty) history polling
+        self.client = ComfyEventClient("127.0.0.1:9", reconnect_attempts=0, connect_timeout=0.1)
+        for name, value in (("comfy_events", self.client), ("prompt_gate", PromptGate(lambda: (0, 0, None)))):
+            patcher = patch(f"handler.{name}", value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    @patch("handler.get_queue", return_value={"queue_running": [[0, "p1", {}, {}, []]], "queue_pending": []})
+    @patch("handler.get_history", return_value={})
+    def test_timeout_interrupts_prompt(self, _, __, ___, stop_prompt):
+        with patch("handler.COMFY_API_AVAILABLE_INTERVAL_MS", 10):
+            outputs, error = handler.execute_workflow({}, timeout_seconds=0.05)
+        self.assertIsNone(outputs)
+        self.assertEqual(error["error"], "Workflow execution timeout after 0s")
+        stop_prompt.assert_called_once_with("p1")
+
+    @patch("handler.get_queue", return_value={"queue_running": [[0, "other", {}, {}, []]], "queue_pending": [[1, "p1", {}, {}, []]]})
+    def test_deadline_starts_when_prompt_runs(self, _, __, stop_prompt):
+        # Queued for longer than its deadline, then finished: not a timeout
+        history = [{}] * 10 + [{"p1": {"status": {"status_str": "success"}, "outputs": {"1": {}}}}]
+        with patch("handler.get_history", side_effect=history), patch("handler.COMFY_API_AVAILABLE_INTERVAL_MS", 10):
+            outputs, error = handler.execute_workflow({}, timeout_seconds=0.01)
+        self.assertIsNone(error)
+        self.assertEqual(outputs, {"1": {}})
+        stop_prompt.assert_not_called()
+
+    @patch("handler.get_queue", return_value={"queue_running": [[0, "other", {}, {}, []]], "queue_pending": [[1, "p1", {}, {}, []]]})
+    @patch("handler.get_history", return_value={})
+    def test_queue_wait_has_its_own_limit(self, _, __, ___, stop_prompt):
+        with patch("handler.COMFY_API_AVAILABLE_INTERVAL_MS", 10), patch("handler.QUEUE_TIMEOUT_S", 0.05):
+            outputs, error = handler.execute_workflow({}, timeout_seconds=60)
+        self.assertIn("waited in ComfyUI's queue", error["error"])
+        self.assertEqual(handler.failure_cause(error, handler.PhaseTimer()), "timeout")
+        stop_prompt.assert_called_once_with("p1")
+
+    @patch("handler.get_history", return_value={})
+    def test_cancel_interrupts_prompt(self, _, queue_workflow, stop_prompt):
+        cancelled = threading.Event()
+        queue_workflow.side_effect = lambda *args: cancelled.set() or {"prompt_id": "p1"}
+        outputs, error = handler.execute_workflow({}, timeout_seconds=60, cancelled=cancelled)
+        self.assertEqual(error["error"], "Workflow execution cancelled")
+        stop_prompt.assert_called_once_with("p1")
+
+    def test_cancel_while_waiting_to_queue(self, queue_workflow, stop_prompt):
+        cancelled = threading.Event()
+        threading.Timer(0.05, cancelled.set).start()
+        with patch("handler.prompt_gate", PromptGate(lambda: (1, 3, None), max_pending=1, probe_interval=0.01)):
+            outputs, error = handler.execute_workflow({}, timeout_seconds=60, cancelled=cancelled)
+        self.assertEqual(error["error"], "Workflow execution cancelled")
+        queue_workflow.assert_not_called()
+        stop_prompt.assert_not_called()
+
+    @patch("handler.get_history", return_value={"p1": {"status": {"status_str": "success"}, "outputs": {}}})
+    def test_finished_prompt_is_not_interrupted(self, _, __, stop_prompt):
+        with patch("handler.COMFY_API_AVAILABLE_INTERVAL_MS", 10):
+            outputs, error = handler.execute_workflow({}, timeout_seconds=5)
+        self.assertIsNone(error)
+        stop_prompt.assert_not_called()
+
+    def test_job_deadline_uses_workflow_values(self, *_):
+        with patch("handler.EXECUTION_TIMEOUT_MAX_S", 10**6), patch("handler.EXECUTION_TIMEOUT_MIN_S", 0):
+            short = handler.job_deadline({"steps": 4, "resolution": 480, "frame_length": 17})
+            long = handler.job_deadline({"steps": 20, "resolution": 1080, "frame_length": 129})
+        self.assertLess(short, long)
+        self.assertEqual(handler.job_deadline({"positive_prompt": "x"}), handler.EXECUTION_TIMEOUT_S)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,111 @@
+import unittest
+from unittest.mock import MagicMock, patch
+import base64
+import time
+
+import handler
+from src.comfy_events import ComfyEventClient
+from src.residency import ResidencyManager
+from src.startup import Readiness
+from src.upload_index import UploadIndex
+
+try:
+    from benchmarks.fake_comfyui import FakeComfyUI
+except ImportError:  # aiohttp ships with runpod, but keep the suite runnable without it
+    FakeComfyUI = None
+
+JOB = {"id": "job-1", "input": {"start_image_base64": "c3RhcnQ=", "end_image_base64": "ZW5k", "seed": 7, "steps": 4}}
+
+
+@unittest.skipUnless(FakeComfyUI, "aiohttp is not installed")
+class TestHandlerAgainstFakeComfyUI(unittest.TestCase):
+    def start(self, **options):
+        self.server = FakeComfyUI(latency_ms=50, frames=5, frame_bytes=1024, **options)
+        host = self.server.start()
+        self.addCleanup(self.server.stop)
+        client = ComfyEventClient(host, reconnect_attempts=3, reconnect_delay=0.05)
+        self.addCleanup(client.close)
+        for name, value in (
+            ("COMFY_HOST", host),
+            ("comfy_events", client),
+            ("readiness", Readiness(handler.probe_server)),
+            ("upload_index", UploadIndex()),
+            ("PROGRESS_UPDATES", False),
+            ("_device_vram_gb", None),
+            ("_worker_memory", {}),
+            ("residency", MagicMock()),
+        ):
+            patcher = patch(f"handler.{name}", value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_job_runs_end_to_end(self):
+        self.start()
+        result = handler.handler(JOB)
+        self.assertEqual(len(result["frames"]), 5)
+        self.assertTrue(base64.b64decode(result["frames"][0]).startswith(b"\x89PNG"))
+        self.assertEqual(result["metadata"]["frame_count"], 5)
+        self.assertIn("139", result["metadata"]["timings"]["nodes"])
+        self.assertEqual(result["metadata"]["memory_profile"], "standard")
+        self.assertEqual(self.server.prompts[0]["128"]["inputs"]["blocks_to_swap"], 20)
+        self.assertEqual(len(self.server.uploads), 2)
+        # Delivered jobs leave no history behind
+        self.assertEqual(self.server.history, {})
+
+    def run_after_free(self):
+        """Run a job, let the residency check free memory, then run the same job again. Returns the nodes each ran."""
+        residency = ResidencyManager(handler.get_system_stats, handler.get_queue, handler.free_comfy_memory, settle_s=0)
+        with patch("handler.residency", residency):
+            handler.handler(JOB)
+            # The check runs on a background thread once the job is done
+            for _ in range(100):
+                if residency.last:
+                    break
+                time.sleep(0.05)
+            self.assertEqual(len(handler.handler(JOB)["frames"]), 5)
+        self.last = residency.last
+        return list(self.server.executed.values())
+
+    def test_low_vram_unloads_models_after_the_job(self):
+        self.start()
+        self.server.vram_free = 2 * 1024**3
+        first, second = self.run_after_free()
+        self.assertEqual(self.server.frees[0], {"unload_models": True})
+        self.assertIn("VRAM 80.0/80.0 GB free", self.last["after"])
+        # The node cache survives unload_models: the next job doesn't run the 14B loaders again
+        self.assertTrue({"131", "132"} <= set(first))
+        self.assertFalse({"131", "132"} & set(second))
+        self.assertIn("117", second)
+
+    def test_low_ram_drops_the_node_cache(self):
+        self.start()
+        self.server.ram_free = 2 * 1024**3
+        # Low RAM doesn't hold back a prompt while ComfyUI is idle
+        _, second = self.run_after_free()
+        self.assertEqual(self.server.frees[0], {"unload_models": True, "free_memory": True})
+        self.assertTrue({"131", "132"} <= set(second))
+
+    def test_execution_failure(self):
+        self.start(failures=["execution"])
+        self.assertIn("injected failure", handler.handler(JOB)["error"])
+
+    def test_upload_failure(self):
+        self.start(failures=["upload"])
+        self.assertIn("Failed to upload start image", handler.handler(JOB)["error"])
+
+    def test_job_survives_websocket_drop(self):
+        self.start(failures=["websocket"])
+        result = handler.handler(JOB)
+        self.assertEqual(len(result["frames"]), 5)
+        self.assertGreaterEqual(self.server.requests["ws"], 2)
+
+    def test_variants_share_one_upload(self):
+        self.start()
+        result = handler.handler(dict(JOB, input=dict(JOB["input"], variants=[{"seed": 1}, {"seed": 2}])))
+        self.assertEqual([len(v["frames"]) for v in result["variants"]], [5, 5])
+        self.assertEqual(self.server.requests["upload"], 2)
+        self.assertEqual(self.server.requests["prompt"], 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
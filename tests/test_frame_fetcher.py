@@ -0,0 +1,70 @@
+import unittest
+import random
+import threading
+import time
+
+from src.frame_fetcher import FrameFetcher
+
+ITEMS = [{"filename": f"frame_{i}.png"} for i in range(20)]
+
+
+class TestFrameFetcher(unittest.TestCase):
+    def test_preserves_order_with_out_of_order_completion(self):
+        def fetch(item):
+            time.sleep(random.uniform(0, 0.01))
+            return item["filename"].encode()
+
+        results = list(FrameFetcher(fetch, workers=6).fetch(ITEMS))
+
+        self.assertEqual([idx for idx, _ in results], list(range(20)))
+        self.assertEqual(results[7][1], b"frame_7.png")
+
+    def test_retries_failed_frame_individually(self):
+        calls = {}
+        lock = threading.Lock()
+
+        def fetch(item):
+            with lock:
+                calls[item["filename"]] = calls.get(item["filename"], 0) + 1
+                attempt = calls[item["filename"]]
+            if item["filename"] == "frame_3.png" and attempt < 3:
+                return None
+            return b"ok"
+
+        results = list(FrameFetcher(fetch, workers=4, retries=2, backoff_ms=1).fetch(ITEMS))
+
+        self.assertEqual(len(results), 20)
+        self.assertEqual(calls["frame_3.png"], 3)
+        self.assertEqual(calls["frame_4.png"], 1)
+
+    def test_skips_frames_that_keep_failing(self):
+        attempts = []
+
+        def fetch(item):
+            if item["filename"] == "frame_5.png":
+                attempts.append(item)
+                raise IOError("connection reset")
+            return b"ok"
+
+        results = list(FrameFetcher(fetch, workers=4, retries=1, backoff_ms=1).fetch(ITEMS))
+
+        self.assertEqual(len(results), 19)
+        self.assertEqual(len(attempts), 2)
+        self.assertNotIn(5, [idx for idx, _ in results])
+
+    def test_transform_runs_in_worker_threads(self):
+        main_thread = threading.current_thread()
+        threads = set()
+
+        def transform(content):
+            threads.add(threading.current_thread())
+            return content.upper()
+
+        results = list(FrameFetcher(lambda item: b"abc", workers=2, transform=transform).fetch(ITEMS[:4]))
+
+        self.assertEqual(results[0], (0, b"ABC"))
+        self.assertNotIn(main_thread, threads)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -1,238 +1,99 @@
 import unittest
-from unittest.mock import patch, MagicMock, mock_open, Mock
-import sys
-import os
-import json
+from unittest.mock import patch
 import base64
 
-# Make sure that "src" is known and can be used to import handler.py
-sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "src")))
-from src import handler
+import handler
+from src.startup import Readiness
 
-# Local folder for test resources
-RUNPOD_WORKER_COMFY_TEST_RESOURCES_IMAGES = "./test_resources/images"
+try:
+    from benchmarks.fake_comfyui import FakeComfyUI
+except ImportError:  # aiohttp ships with runpod, but keep the suite runnable without it
+    FakeComfyUI = None
+
+IMAGES = {"start_image_base64": "c3RhcnQ=", "end_image_base64": "ZW5k"}
 
 
 class TestRunpodWorkerComfy(unittest.TestCase):
-    def test_valid_input_with_workflow_only(self):
-        input_data = {"workflow": {"key": "value"}}
-        validated_data, error = handler.validate_input(input_data)
+    def test_valid_input_with_images_only(self):
+        params, error = handler.parse_job_input(IMAGES)
         self.assertIsNone(error)
-        self.assertEqual(validated_data, {"workflow": {"key": "value"}, "images": None})
-
-    def test_valid_input_with_workflow_and_images(self):
-        input_data = {
-            "workflow": {"key": "value"},
-            "images": [{"name": "image1.png", "image": "base64string"}],
-        }
-        validated_data, error = handler.validate_input(input_data)
+        self.assertEqual(params["images"], {"start_image": "c3RhcnQ=", "end_image": "ZW5k"})
+        self.assertEqual(params["output_format"], "frames")
+        self.assertEqual(params["values"]["steps"], 8)
+
+    def test_input_keys_are_stripped(self):
+        params, error = handler.parse_job_input({" start_image_base64": "c3RhcnQ=", "end_image_base64 ": "ZW5k"})
         self.assertIsNone(error)
-        self.assertEqual(validated_data, input_data)
-
-    def test_input_missing_workflow(self):
-        input_data = {"images": [{"name": "image1.png", "image": "base64string"}]}
-        validated_data, error = handler.validate_input(input_data)
-        self.assertIsNotNone(error)
-        self.assertEqual(error, "Missing 'workflow' parameter")
-
-    def test_input_with_invalid_images_structure(self):
-        input_data = {
-            "workflow": {"key": "value"},
-            "images": [{"name": "image1.png"}],  # Missing 'image' key
-        }
-        validated_data, error = handler.validate_input(input_data)
-        self.assertIsNotNone(error)
+        self.assertEqual(params["images"]["start_image"], "c3RhcnQ=")
+
+    def test_input_missing_images(self):
+        params, error = handler.parse_job_input({"start_image_base64": "c3RhcnQ="})
+        self.assertIsNone(params)
         self.assertEqual(
-            error, "'images' must be a list of objects with 'name' and 'image' keys"
+            error["error"], "start_image_base64 and end_image_base64 (or start_image_url and end_image_url) are required."
         )
 
-    def test_invalid_json_string_input(self):
-        input_data = "invalid json"
-        validated_data, error = handler.validate_input(input_data)
-        self.assertIsNotNone(error)
-        self.assertEqual(error, "Invalid JSON format in input")
-
-    def test_valid_json_string_input(self):
-        input_data = '{"workflow": {"key": "value"}}'
-        validated_data, error = handler.validate_input(input_data)
-        self.assertIsNone(error)
-        self.assertEqual(validated_data, {"workflow": {"key": "value"}, "images": None})
+    def test_input_with_invalid_output_format(self):
+        params, error = handler.parse_job_input(dict(IMAGES, output_format="gif"))
+        self.assertIsNone(params)
+        self.assertEqual(error["error"], "Unsupported output_format 'gif'. Available: frames, mp4, webm")
 
-    def test_empty_input(self):
-        input_data = None
-        validated_data, error = handler.validate_input(input_data)
-        self.assertIsNotNone(error)
-        self.assertEqual(error, "Please provide input")
-
-    @patch("handler.requests.get")
-    def test_check_server_server_up(self, mock_requests):
-        mock_response = MagicMock()
-        mock_response.status_code = 200
-        mock_requests.return_value = mock_response
-
-        result = handler.check_server("http://127.0.0.1:8188", 1, 50)
-        self.assertTrue(result)
-
-    @patch("handler.requests.get")
-    def test_check_server_server_down(self, mock_requests):
-        mock_requests.get.side_effect = handler.requests.RequestException()
-        result = handler.check_server("http://127.0.0.1:8188", 1, 50)
-        self.assertFalse(result)
-
-    @patch("handler.urllib.request.urlopen")
-    def test_queue_prompt(self, mock_urlopen):
-        mock_response = MagicMock()
-        mock_response.read.return_value = json.dumps({"prompt_id": "123"}).encode()
-        mock_urlopen.return_value = mock_response
-        result = handler.queue_workflow({"prompt": "test"})
-        self.assertEqual(result, {"prompt_id": "123"})
-
-    @patch("handler.urllib.request.urlopen")
-    def test_get_history(self, mock_urlopen):
-        # Mock response data as a JSON string
-        mock_response_data = json.dumps({"key": "value"}).encode("utf-8")
-
-        # Define a mock response function for `read`
-        def mock_read():
-            return mock_response_data
-
-        # Create a mock response object
-        mock_response = Mock()
-        mock_response.read = mock_read
-
-        # Mock the __enter__ and __exit__ methods to support the context manager
-        mock_response.__enter__ = lambda s: s
-        mock_response.__exit__ = Mock()
-
-        # Set the return value of the urlopen mock
-        mock_urlopen.return_value = mock_response
-
-        # Call the function under test
-        result = handler.get_history("123")
-
-        # Assertions
-        self.assertEqual(result, {"key": "value"})
-        mock_urlopen.assert_called_with("http://127.0.0.1:8188/history/123")
-
-    @patch("builtins.open", new_callable=mock_open, read_data=b"test")
-    def test_base64_encode(self, mock_file):
-        test_data = base64.b64encode(b"test").decode("utf-8")
-
-        result = handler.base64_encode("dummy_path")
-
-        self.assertEqual(result, test_data)
-
-    @patch("handler.os.path.exists")
-    @patch("handler.rp_upload.upload_image")
-    @patch.dict(
-        os.environ, {"COMFY_OUTPUT_PATH": RUNPOD_WORKER_COMFY_TEST_RESOURCES_IMAGES}
-    )
-    def test_bucket_endpoint_not_configured(self, mock_upload_image, mock_exists):
-        mock_exists.return_value = True
-        mock_upload_image.return_value = "simulated_uploaded/image.png"
-
-        outputs = {
-            "node_id": {"images": [{"filename": "ComfyUI_00001_.png", "subfolder": ""}]}
-        }
-        job_id = "123"
-
-        result = handler.process_output_images(outputs, job_id)
+    def test_decode_base64_image(self):
+        self.assertEqual(handler.decode_base64_image("data:image/png;base64," + base64.b64encode(b"test").decode()), b"test")
 
-        self.assertEqual(result["status"], "success")
 
-    @patch("handler.os.path.exists")
-    @patch("handler.rp_upload.upload_image")
-    @patch.dict(
-        os.environ,
-        {
-            "COMFY_OUTPUT_PATH": RUNPOD_WORKER_COMFY_TEST_RESOURCES_IMAGES,
-            "BUCKET_ENDPOINT_URL": "http://example.com",
-        },
-    )
-    def test_bucket_endpoint_configured(self, mock_upload_image, mock_exists):
-        # Mock the os.path.exists to return True, simulating that the image exists
-        mock_exists.return_value = True
-
-        # Mock the rp_upload.upload_image to return a simulated URL
-        mock_upload_image.return_value = "http://example.com/uploaded/image.png"
-
-        # Define the outputs and job_id for the test
-        outputs = {
-            "node_id": {
-                "images": [{"filename": "ComfyUI_00001_.png", "subfolder": "test"}]
-            }
-        }
-        job_id = "123"
-
-        # Call the function under test
-        result = handler.process_output_images(outputs, job_id)
-
-        # Assertions
-        self.assertEqual(result["status"], "success")
-        self.assertEqual(result["message"], "http://example.com/uploaded/image.png")
-        mock_upload_image.assert_called_once_with(
-            job_id, "./test_resources/images/test/ComfyUI_00001_.png"
-        )
+@unittest.skipUnless(FakeComfyUI, "aiohttp is not installed")
+class TestComfyRequests(unittest.TestCase):
+    def setUp(self):
+        self.server = FakeComfyUI(latency_ms=10, frames=2, frame_bytes=256)
+        host = self.server.start()
+        self.addCleanup(self.server.stop)
+        for name, value in (("COMFY_HOST", host), ("readiness", Readiness(handler.probe_server))):
+            patcher = patch(f"handler.{name}", value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
 
-    @patch("handler.os.path.exists")
-    @patch("handler.rp_upload.upload_image")
-    @patch.dict(
-        os.environ,
-        {
-            "COMFY_OUTPUT_PATH": RUNPOD_WORKER_COMFY_TEST_RESOURCES_IMAGES,
-            "BUCKET_ENDPOINT_URL": "http://example.com",
-            "BUCKET_ACCESS_KEY_ID": "",
-            "BUCKET_SECRET_ACCESS_KEY": "",
-        },
-    )
-    def test_bucket_image_upload_fails_env_vars_wrong_or_missing(
-        self, mock_upload_image, mock_exists
-    ):
-        # Simulate the file existing in the output path
-        mock_exists.return_value = True
-
-        # When AWS credentials are wrong or missing, upload_image should return 'simulated_uploaded/...'
-        mock_upload_image.return_value = "simulated_uploaded/image.png"
-
-        outputs = {
-            "node_id": {"images": [{"filename": "ComfyUI_00001_.png", "subfolder": ""}]}
-        }
-        job_id = "123"
-
-        result = handler.process_output_images(outputs, job_id)
-
-        # Check if the image was saved to the 'simulated_uploaded' directory
-        self.assertIn("simulated_uploaded", result["message"])
+    def test_empty_input(self):
+        result = handler.handler({"id": "job-1", "input": None})
         self.assertEqual(result["status"], "success")
+        self.assertEqual(result["message"], "ComfyUI server is ready (test/health-check request)")
 
-    @patch("handler.requests.post")
-    def test_upload_images_successful(self, mock_post):
-        mock_response = unittest.mock.Mock()
-        mock_response.status_code = 200
-        mock_response.text = "Successfully uploaded"
-        mock_post.return_value = mock_response
+    def test_check_server_server_up(self):
+        self.assertTrue(handler.probe_server())
 
-        test_image_data = base64.b64encode(b"Test Image Data").decode("utf-8")
+    def test_check_server_server_down(self):
+        with patch("handler.COMFY_HOST", "127.0.0.1:9"):
+            with self.assertRaises(handler.requests.RequestException):
+                handler.probe_server()
 
-        images = [{"name": "test_image.png", "image": test_image_data}]
+    def test_queue_prompt(self):
+        result = handler.queue_workflow({"1": {"class_type": "SaveImage", "inputs": {}}}, "client-1")
+        self.assertIn("prompt_id", result)
+        self.assertEqual(self.server.prompts, [{"1": {"class_type": "SaveImage", "inputs": {}}}])
 
-        responses = handler.upload_images(images)
+    def test_rejected_prompt_raises(self):
+        self.server.failures.add("prompt")
+        with self.assertRaises(handler.requests.HTTPError):
+            handler.queue_workflow({}, "client-1")
 
-        self.assertEqual(len(responses), 3)
-        self.assertEqual(responses["status"], "success")
+    def test_get_history(self):
+        self.server.history["123"] = {"status": {"status_str": "success"}, "outputs": {}}
+        self.assertEqual(handler.get_history("123"), {"123": self.server.history["123"]})
+        self.assertEqual(handler.get_history("unknown"), {})
 
-    @patch("handler.requests.post")
-    def test_upload_images_failed(self, mock_post):
-        mock_response = unittest.mock.Mock()
-        mock_response.status_code = 400
-        mock_response.text = "Error uploading"
-        mock_post.return_value = mock_response
+    def test_upload_images_successful(self):
+        self.assertTrue(handler.upload_image_bytes(b"Test Image Data", "test_image.png"))
+        self.assertEqual(self.server.uploads, {"test_image.png": b"Test Image Data"})
+        self.assertEqual(handler.get_image_data("test_image.png", "", "input"), b"Test Image Data")
 
-        test_image_data = base64.b64encode(b"Test Image Data").decode("utf-8")
+    def test_upload_images_failed(self):
+        self.server.failures.add("upload")
+        self.assertFalse(handler.upload_image_bytes(b"Test Image Data", "test_image.png"))
+        self.assertEqual(self.server.uploads, {})
 
-        images = [{"name": "test_image.png", "image": test_image_data}]
+    def test_missing_output_returns_none(self):
+        self.assertIsNone(handler.get_image_data("missing.png", "", "input"))
 
-        responses = handler.upload_images(images)
 
-        self.assertEqual(len(responses), 3)
-        self.assertEqual(responses["status"], "error")
+if __name__ == "__main__":
+    unittest.main()
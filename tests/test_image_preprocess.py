@@ -0,0 +1,91 @@
+import unittest
+from unittest.mock import patch
+import base64
+from io import BytesIO
+
+import handler
+from src.image_preprocess import fit_size, preprocess_available
+from src.upload_index import UploadIndex
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+
+def make_image(size, image_format="PNG"):
+    output = BytesIO()
+    Image.new("RGB", size, (200, 10, 10)).save(output, format=image_format)
+    return output.getvalue()
+
+
+class TestDecodeBase64Image(unittest.TestCase):
+    def test_chunked_decode_handles_prefix_and_line_breaks(self):
+        data = bytes(range(256)) * 50
+        encoded = base64.encodebytes(data).decode()  # wrapped at 76 characters
+        with patch("handler.BASE64_DECODE_CHUNK", 101):
+            self.assertEqual(handler.decode_base64_image("data:image/png;base64," + encoded), data)
+            self.assertEqual(handler.decode_base64_image("  " + encoded + "\n"), data)
+
+    def test_truncated_input_raises(self):
+        with self.assertRaises(Exception):
+            handler.decode_base64_image(base64.b64encode(b"abcdef").decode()[:-1])
+
+
+class TestFitSize(unittest.TestCase):
+    def test_covers_target_keeping_aspect(self):
+        self.assertEqual(fit_size((4032, 3024), (1138, 640)), (1138, 854))
+        self.assertEqual(fit_size((3024, 4032), (854, 480)), (854, 1139))
+
+
+@unittest.skipUnless(preprocess_available(), "Pillow not installed")
+@patch("handler.upload_image_bytes", return_value=True)
+class TestPreresize(unittest.TestCase):
+    def setUp(self):
+        patcher = patch("handler.upload_index", UploadIndex(None))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_large_images_are_downsized_before_upload(self, mock_upload):
+        original = make_image((4000, 3000), "JPEG")
+        stats = handler.new_upload_stats()
+
+        filename, error = handler.upload_input_image(base64.b64encode(original).decode(), stats, (1280, 720))
+
+        self.assertIsNone(error)
+        self.assertTrue(filename.endswith("_1280x720.jpg"))
+        uploaded = mock_upload.call_args[0][0]
+        self.assertEqual(Image.open(BytesIO(uploaded)).size, (1280, 960))
+        self.assertEqual(stats["bytes_uploaded"], len(uploaded))
+        self.assertEqual(stats["bytes_saved"], len(original) - len(uploaded))
+
+        # The same original and target is a hit without resizing again
+        handler.upload_input_image(base64.b64encode(original).decode(), stats, (1280, 720))
+        self.assertEqual(mock_upload.call_count, 1)
+        self.assertEqual(stats["hits"], 1)
+
+    def test_small_images_are_uploaded_unchanged(self, mock_upload):
+        original = make_image((640, 360))
+        filename, _ = handler.upload_input_image(base64.b64encode(original).decode(), handler.new_upload_stats(), (1280, 720))
+
+        self.assertNotIn("x", filename.split(".")[0])
+        self.assertEqual(mock_upload.call_args[0][0], original)
+
+    def test_corrupt_image_is_rejected(self, mock_upload):
+        _, error = handler.upload_input_image(base64.b64encode(b"\x89PNG\r\n\x1a\ngarbage").decode(), handler.new_upload_stats(), (1280, 720))
+
+        self.assertIn("not a valid image", error)
+        mock_upload.assert_not_called()
+
+    def test_start_and_end_upload_concurrently(self, mock_upload):
+        images = [base64.b64encode(make_image((100, 100 + i))).decode() for i in range(2)]
+        stats = handler.new_upload_stats()
+
+        results = handler.upload_input_images(images, stats)
+
+        self.assertEqual(len({filename for filename, _ in results}), 2)
+        self.assertEqual(stats["misses"], 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
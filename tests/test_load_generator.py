@@ -0,0 +1,111 @@
+import unittest
+import asyncio
+import csv
+import json
+import os
+import shutil
+import tempfile
+
+import test_runpod
+
+try:
+    from aiohttp import web
+except ImportError:  # aiohttp ships with runpod
+    web = None
+
+
+async def serve_endpoint():
+    """Minimal RunPod-style endpoint: every third job fails, others pass through IN_PROGRESS."""
+    polls = {}
+
+    async def run(request):
+        job_id = f"job-{len(polls)}"
+        polls[job_id] = 0
+        return web.json_response({"id": job_id, "status": "IN_QUEUE"})
+
+    async def runsync(request):
+        return web.json_response({"id": "sync", "status": "COMPLETED", "output": {"frames": ["AAAA"]}})
+
+    async def status(request):
+        job_id = request.match_info["job_id"]
+        polls[job_id] += 1
+        if polls[job_id] == 1:
+            return web.json_response({"id": job_id, "status": "IN_PROGRESS"})
+        if job_id == "job-2":
+            return web.json_response({"id": job_id, "status": "FAILED", "error": "boom"})
+        return web.json_response({"id": job_id, "status": "COMPLETED", "delayTime": 1500, "executionTime": 4000,
+                                  "output": {"frames": ["AAAA"]}})
+
+    app = web.Application()
+    app.router.add_post("/v2/test/run", run)
+    app.router.add_post("/v2/test/runsync", runsync)
+    app.router.add_get("/v2/test/status/{job_id}", status)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, "127.0.0.1", 0)
+    await site.start()
+    return runner, f"http://127.0.0.1:{runner.addresses[0][1]}/v2/test"
+
+
+class TestReport(unittest.TestCase):
+    def test_percentiles(self):
+        values = list(range(1, 101))
+        self.assertAlmostEqual(test_runpod.percentile(values, 50), 50.5)
+        self.assertAlmostEqual(test_runpod.percentile(values, 99), 99.01)
+        self.assertIsNone(test_runpod.percentile([], 50))
+
+    def test_error_taxonomy(self):
+        self.assertIsNone(test_runpod.classify_error({"status": "COMPLETED", "output": {"frames": []}}))
+        self.assertEqual(test_runpod.classify_error({"status": "COMPLETED", "output": {"error": "x"}}), "handler_error")
+        self.assertEqual(test_runpod.classify_error({"status": "FAILED"}), "job_failed")
+        self.assertEqual(test_runpod.classify_error({"status": "TIMED_OUT"}), "timed_out")
+
+
+@unittest.skipUnless(web, "aiohttp is not installed")
+class TestLoadRun(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.payload = os.path.join(self.directory, "payload.json")
+        with open(self.payload, "w") as f:
+            json.dump({"input": {}}, f)
+
+    def run_load(self, path, *options):
+        async def run():
+            runner, base = await serve_endpoint()
+            try:
+                args = test_runpod.parse_args([f"--url={base}{path}", f"--payload={self.payload}", "--poll-interval=0.01",
+                                               "--quiet", *options])
+                return await test_runpod.run_load(args, {"input": {}})
+            finally:
+                await runner.cleanup()
+
+        return asyncio.run(run())
+
+    def test_async_jobs_are_polled_and_summarized(self):
+        results, wall_s = self.run_load("/run", "--jobs=4", "--concurrency=2", "--rate=100")
+        summary = test_runpod.summarize(results, wall_s)
+        self.assertEqual(summary["succeeded"], 3)
+        self.assertEqual(summary["errors"], {"job_failed": 1})
+        self.assertEqual(summary["queue_s"]["p50"], 1.5)
+        self.assertEqual(summary["execution_s"]["p99"], 4.0)
+        self.assertGreater(summary["response_bytes"]["max"], 0)
+
+    def test_runsync_and_reports(self):
+        results, wall_s = self.run_load("/runsync", "--jobs=2", "--concurrency=2")
+        summary = test_runpod.summarize(results, wall_s)
+        self.assertEqual(summary["succeeded"], 2)
+        self.assertIsNone(summary["queue_s"]["p50"])
+
+        json_path = os.path.join(self.directory, "report.json")
+        csv_path = os.path.join(self.directory, "report.csv")
+        args = test_runpod.parse_args(["--url=http://x/runsync", f"--json={json_path}", f"--csv={csv_path}", "--label=a"])
+        test_runpod.write_reports(args, summary, results)
+        with open(json_path) as f:
+            self.assertEqual(json.load(f)["config"]["label"], "a")
+        with open(csv_path) as f:
+            self.assertEqual(len(list(csv.DictReader(f))), 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
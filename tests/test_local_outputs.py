@@ -0,0 +1,67 @@
+import unittest
+from unittest.mock import patch
+import base64
+import mmap
+import os
+import shutil
+import tempfile
+
+import handler
+from src.local_outputs import read_mapped, resolve_output_path
+
+
+class TestLocalOutputs(unittest.TestCase):
+    def setUp(self):
+        self.root = tempfile.mkdtemp()
+        os.makedirs(os.path.join(self.root, "output", "clips"))
+        self.frame_path = os.path.join(self.root, "output", "clips", "frame_00001_.png")
+        with open(self.frame_path, "wb") as f:
+            f.write(b"\x89PNG frame")
+        self.roots = {"output": os.path.join(self.root, "output")}
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_resolves_subfolder_and_type(self):
+        path = resolve_output_path("frame_00001_.png", "clips", "output", self.roots)
+        self.assertEqual(path, os.path.realpath(self.frame_path))
+
+    def test_rejects_path_traversal(self):
+        self.assertIsNone(resolve_output_path("../../etc/passwd", "clips", "output", self.roots))
+        self.assertIsNone(resolve_output_path("frame_00001_.png", "../..", "output", self.roots))
+
+    def test_unknown_type_or_missing_file(self):
+        self.assertIsNone(resolve_output_path("frame_00001_.png", "clips", "temp", self.roots))
+        self.assertIsNone(resolve_output_path("missing.png", "clips", "output", self.roots))
+
+    def test_read_mapped_is_zero_copy_buffer(self):
+        content = read_mapped(self.frame_path)
+        self.assertIsInstance(content, mmap.mmap)
+        self.assertEqual(base64.b64decode(base64.b64encode(content)), b"\x89PNG frame")
+        content.close()
+
+    def test_read_mapped_empty_file(self):
+        empty = os.path.join(self.root, "empty.png")
+        open(empty, "wb").close()
+        self.assertIsNone(read_mapped(empty))
+
+    @patch("handler.get_image_data", return_value=b"over http")
+    def test_fetch_frame_prefers_local_file(self, mock_get_image_data):
+        with patch("handler.COMFY_OUTPUT_PATH", self.roots["output"]):
+            local = handler.fetch_frame({"filename": "frame_00001_.png", "subfolder": "clips", "type": "output"})
+            remote = handler.fetch_frame({"filename": "frame_00002_.png", "subfolder": "clips", "type": "output"})
+
+        self.assertEqual(handler.encode_frame(local), base64.b64encode(b"\x89PNG frame").decode())
+        self.assertTrue(local.closed)
+        self.assertEqual(remote, b"over http")
+        mock_get_image_data.assert_called_once_with("frame_00002_.png", "clips", "output")
+
+    @patch("handler.get_image_data", return_value=b"over http")
+    def test_direct_read_can_be_disabled(self, mock_get_image_data):
+        with patch("handler.COMFY_OUTPUT_PATH", self.roots["output"]), patch("handler.COMFY_DIRECT_READ", False):
+            content = handler.fetch_frame({"filename": "frame_00001_.png", "subfolder": "clips", "type": "output"})
+        self.assertEqual(content, b"over http")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,128 @@
+import unittest
+from unittest.mock import MagicMock, patch
+
+import handler
+from src.memory_profiles import GIB, MemoryProfiles, device_vram_gb, megapixel_frames
+from src.workflow_registry import CompiledWorkflow, WorkflowError
+
+IMAGES = {"start_image_base64": "c3RhcnQ=", "end_image_base64": "ZW5k"}
+
+
+def system_stats(vram_gb):
+    devices = [{"name": "cpu", "type": "cpu", "vram_total": 0}]
+    if vram_gb:
+        devices.append({"name": "cuda:0", "type": "cuda", "index": 0, "vram_total": vram_gb * GIB, "vram_free": GIB})
+    return {"system": {"ram_total": 64 * GIB}, "devices": devices}
+
+
+class TestMemoryProfiles(unittest.TestCase):
+    def setUp(self):
+        self.profiles = handler.workflow_registry.get("wan22_i2v")[0].memory_profiles
+
+    def select(self, resolution, frames, vram_gb):
+        size = megapixel_frames(handler.resolution_to_dimensions(resolution), frames)
+        return self.profiles.select(size, vram_gb)["name"]
+
+    def test_table_scales_with_job_size_and_gpu(self):
+        self.assertEqual(self.select(480, 17, 80), "fast")
+        self.assertEqual(self.select(640, 65, 48), "standard")
+        self.assertEqual(self.select(1080, 129, 80), "large")
+        self.assertEqual(self.select(1080, 129, 48), "low_memory")
+        self.assertEqual(self.select(480, 17, 24), "low_memory")
+        # Unknown GPU only matches profiles without a memory requirement
+        self.assertEqual(self.select(480, 17, None), "low_memory")
+
+    def test_device_vram_from_system_stats(self):
+        self.assertEqual(device_vram_gb(system_stats(80)), 80)
+        self.assertIsNone(device_vram_gb(system_stats(0)))
+        self.assertIsNone(device_vram_gb({}))
+
+    def test_overrides_write_every_target(self):
+        self.assertEqual(
+            sorted(self.profiles.overrides("low_memory")),
+            [("115", "clear_cache_after_n_frames", 10), ("158", "enable_tiling", True)],
+        )
+        self.assertEqual(self.profiles.overrides("missing"), [])
+
+    def test_block_swap_is_chosen_per_worker(self):
+        self.assertEqual(self.profiles.worker_overrides(80), [("128", "blocks_to_swap", 20)])
+        self.assertEqual(self.profiles.worker_overrides(24), [("128", "blocks_to_swap", 40)])
+        self.assertEqual(self.profiles.worker_overrides(None), [("128", "blocks_to_swap", 40)])
+
+    def test_profiles_only_change_nodes_after_the_samplers(self):
+        # The loaders (131, 132) take block_swap_args from 128; changing it between jobs would reload both models
+        for profile in self.profiles.profiles:
+            self.assertEqual({node_id for node_id, _, _ in self.profiles.overrides(profile["name"])}, {"115", "158"})
+
+    def test_invalid_tables_are_rejected(self):
+        template = {"1": {"class_type": "SaveImage", "inputs": {}}}
+        inputs = {"swap": [["1", "blocks_to_swap"]]}
+        with self.assertRaisesRegex(WorkflowError, "unknown input"):
+            CompiledWorkflow("t", template, {"output_node": "1", "memory_profiles": {
+                "inputs": inputs, "profiles": [{"name": "a", "tiling": True}]}}, "v1")
+        with self.assertRaisesRegex(WorkflowError, "per-worker input"):
+            CompiledWorkflow("t", template, {"output_node": "1", "memory_profiles": {
+                "inputs": inputs, "worker": [{"swap": 10}], "profiles": [{"name": "a", "swap": 20}]}}, "v1")
+        with self.assertRaisesRegex(WorkflowError, "node 2 for memory profiles"):
+            CompiledWorkflow("t", template, {"output_node": "1", "memory_profiles": {
+                "inputs": {"swap": [["2", "blocks_to_swap"]]}, "profiles": []}}, "v1")
+        self.assertIsNone(MemoryProfiles({"inputs": inputs, "profiles": [{"name": "a", "max_megapixel_frames": 1}]}).select(2, 80))
+
+
+class TestHandlerMemoryProfiles(unittest.TestCase):
+    def setUp(self):
+        for name, value in (("_device_vram_gb", None), ("_worker_memory", {})):
+            patcher = patch(f"handler.{name}", value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def stub_system_stats(self, vram_gb):
+        session = MagicMock()
+        session.get.return_value.json.return_value = system_stats(vram_gb)
+        patcher = patch("handler.get_session", return_value=session)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        return session
+
+    def test_profile_is_applied_and_recorded(self):
+        self.stub_system_stats(80)
+        params, _ = handler.parse_job_input(dict(IMAGES, resolution=480, frame_length=17))
+        values = handler.with_memory_profile(params["workflow"], params["values"])
+        self.assertEqual(values["memory_profile"], "fast")
+
+        workflow = handler.build_workflow(params, {"start_image": "a.png", "end_image": "b.png"}, values)
+        self.assertEqual(workflow["128"]["inputs"]["blocks_to_swap"], 20)
+        self.assertEqual(workflow["115"]["inputs"]["clear_cache_after_n_frames"], 100)
+        self.assertIs(workflow["158"]["inputs"]["enable_tiling"], False)
+        # The template itself is left untouched
+        self.assertEqual(params["workflow"].template["115"]["inputs"]["clear_cache_after_n_frames"], 50)
+        self.assertEqual(handler.build_metadata(params, 34, values=values)["memory_profile"], "fast")
+
+    def test_system_stats_is_read_once(self):
+        session = self.stub_system_stats(48)
+        params, _ = handler.parse_job_input(dict(IMAGES, resolution=1080, frame_length=129))
+        for _ in range(3):
+            self.assertEqual(handler.with_memory_profile(params["workflow"], params["values"])["memory_profile"], "low_memory")
+        session.get.assert_called_once()
+
+    def test_loader_inputs_stay_the_same_across_profiles(self):
+        self.stub_system_stats(80)
+        images = {"start_image": "a.png", "end_image": "b.png"}
+        loaders = []
+        for resolution, frames in ((480, 17), (1080, 129), (640, 65)):
+            params, _ = handler.parse_job_input(dict(IMAGES, resolution=resolution, frame_length=frames))
+            values = handler.with_memory_profile(params["workflow"], params["values"])
+            workflow = handler.build_workflow(params, images, values)
+            loaders.append([workflow[node_id] for node_id in ("128", "131", "132")])
+        self.assertEqual(loaders[0], loaders[1])
+        self.assertEqual(loaders[0], loaders[2])
+
+    def test_disabled(self):
+        self.stub_system_stats(80)
+        params, _ = handler.parse_job_input(IMAGES)
+        with patch("handler.MEMORY_PROFILES", False):
+            self.assertNotIn("memory_profile", handler.with_memory_profile(params["workflow"], params["values"]))
+
+
+if __name__ == "__main__":
+    unittest.main()
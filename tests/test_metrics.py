@@ -0,0 +1,102 @@
+import unittest
+from unittest.mock import patch
+import urllib.request
+
+import handler
+from src.metrics import MetricsRegistry, PhaseTimer
+from tests.helpers import FakeClock
+
+JOB = {"id": "job-1", "input": {"start_image_base64": "c3RhcnQ=", "end_image_base64": "ZW5k"}}
+OUTPUTS = {"117": {"images": [{"filename": f"frame_{i}.png", "subfolder": "", "type": "output"} for i in range(3)]}}
+
+
+class TestPhaseTimer(unittest.TestCase):
+    def test_phases_accumulate_in_milliseconds(self):
+        clock = FakeClock()
+        timer = PhaseTimer(clock)
+        with timer.phase("upload"):
+            clock.now += 0.25
+        with timer.phase("upload"):
+            clock.now += 0.25
+        timer.add_node("139", 1.5)
+        self.assertEqual(timer.as_dict(), {"upload": 500.0, "nodes": {"139": 1500.0}})
+        self.assertEqual(timer.current, "upload")
+
+    def test_timed_does_not_change_current_phase(self):
+        clock = FakeClock()
+        timer = PhaseTimer(clock)
+        timer.current = "frame_fetch"
+
+        def encode(value):
+            clock.now += 0.1
+            return value * 2
+
+        self.assertEqual(timer.timed("encode", encode)(4), 8)
+        self.assertEqual(timer.current, "frame_fetch")
+        self.assertAlmostEqual(timer.phases["encode"], 0.1)
+
+
+class TestMetricsRegistry(unittest.TestCase):
+    def setUp(self):
+        self.registry = MetricsRegistry()
+        self.jobs = self.registry.counter("jobs_total", "Jobs.")
+        self.latency = self.registry.histogram("phase_seconds", "Latency.", buckets=(1, 10))
+
+    def test_prometheus_text_format(self):
+        self.jobs.inc(status="completed")
+        self.jobs.inc(2, status="failed")
+        self.latency.observe(0.5, phase="upload")
+        self.latency.observe(5, phase="upload")
+        self.latency.observe(50, phase="upload")
+        text = self.registry.render()
+        self.assertIn("# TYPE jobs_total counter", text)
+        self.assertIn('jobs_total{status="failed"} 2', text)
+        self.assertIn('phase_seconds_bucket{phase="upload",le="1"} 1', text)
+        self.assertIn('phase_seconds_bucket{phase="upload",le="10"} 2', text)
+        self.assertIn('phase_seconds_bucket{phase="upload",le="+Inf"} 3', text)
+        self.assertIn('phase_seconds_sum{phase="upload"} 55.5', text)
+
+    def test_serves_metrics_endpoint(self):
+        self.jobs.inc(status="completed")
+        server = self.registry.serve(0, host="127.0.0.1")
+        self.addCleanup(server.shutdown)
+        url = f"http://127.0.0.1:{server.server_address[1]}/metrics"
+        with urllib.request.urlopen(url, timeout=5) as response:
+            self.assertIn('jobs_total{status="completed"} 1', response.read().decode())
+
+
+@patch("handler.execute_workflow", return_value=(OUTPUTS, None))
+@patch("handler.upload_image_bytes", return_value=True)
+@patch("handler.check_server", return_value=True)
+@patch("handler.get_image_data", side_effect=lambda f, s, t: f.encode())
+class TestJobMetrics(unittest.TestCase):
+    def test_metadata_includes_phase_timings(self, *_):
+        result = handler.handler(JOB)
+        timings = result["metadata"]["timings"]
+        for phase in ("server_check", "upload", "workflow_patch", "frame_fetch", "encode", "response_build"):
+            self.assertIn(phase, timings)
+
+    def test_counters_track_frames_bytes_and_outcomes(self, *_):
+        frames = handler.FRAMES_TOTAL.value()
+        completed = handler.JOBS_TOTAL.value(status="completed")
+        output_bytes = handler.OUTPUT_BYTES_TOTAL.value(sink="inline")
+        result = handler.handler(JOB)
+        self.assertEqual(handler.FRAMES_TOTAL.value(), frames + 3)
+        self.assertEqual(handler.JOBS_TOTAL.value(status="completed"), completed + 1)
+        self.assertEqual(handler.OUTPUT_BYTES_TOTAL.value(sink="inline"), output_bytes + sum(len(f) for f in result["frames"]))
+
+    def test_failures_are_labelled_by_phase(self, _, check_server, *__):
+        check_server.return_value = False
+        failures = handler.FAILURES_TOTAL.value(cause="server_check")
+        self.assertEqual(handler.handler(JOB)["error"], "ComfyUI server unreachable.")
+        self.assertEqual(handler.FAILURES_TOTAL.value(cause="server_check"), failures + 1)
+
+    def test_timeouts_are_labelled_separately(self, *_):
+        timer = PhaseTimer()
+        timer.current = "execution"
+        self.assertEqual(handler.failure_cause({"error": "Workflow execution timeout after 300s"}, timer), "timeout")
+        self.assertEqual(handler.failure_cause({"error": "Workflow execution error: {}"}, timer), "execution")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,158 @@
+import unittest
+from unittest.mock import MagicMock, patch
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+
+import handler
+from src.local_outputs import read_mapped
+
+try:
+    import boto3
+    from moto import mock_aws
+except ImportError:
+    mock_aws = None
+
+from src.output_sink import S3OutputSink
+
+BUCKET = "outputs"
+OUTPUTS = {"117": {"images": [{"filename": f"interpolated_frames_{i:05d}_.png", "subfolder": "", "type": "output"} for i in range(5)]}}
+
+
+def fake_image_data(filename, subfolder, image_type):
+    return filename.encode("utf-8") * 100
+
+
+@unittest.skipUnless(mock_aws, "boto3/moto not installed")
+class TestS3OutputSink(unittest.TestCase):
+    def setUp(self):
+        self.mock = mock_aws()
+        self.mock.start()
+        self.addCleanup(self.mock.stop)
+        self.client = boto3.client("s3", region_name="us-east-1", aws_access_key_id="test", aws_secret_access_key="test")
+        self.client.create_bucket(Bucket=BUCKET)
+
+    def get_object(self, key):
+        return self.client.get_object(Bucket=BUCKET, Key=key)["Body"].read()
+
+    def test_parallel_uploads_keep_order_and_checksums(self):
+        sink = S3OutputSink(self.client, BUCKET, "job-1", workers=4)
+        for i in range(10):
+            sink.submit(f"frame_{i}.png", f"frame {i}".encode(), "image/png")
+        results = list(sink.completed(wait=True))
+        sink.close()
+
+        self.assertEqual([r["filename"] for r in results], [f"frame_{i}.png" for i in range(10)])
+        self.assertEqual(results[3]["sha256"], hashlib.sha256(b"frame 3").hexdigest())
+        self.assertEqual(results[3]["size_bytes"], 7)
+        self.assertIn("job-1/frame_3.png", results[3]["url"])
+        self.assertEqual(self.get_object("job-1/frame_3.png"), b"frame 3")
+
+    def test_multipart_upload_of_large_video(self):
+        video = os.urandom(6 * 1024 * 1024)
+        sink = S3OutputSink(self.client, BUCKET, "job-2", multipart_threshold=5 * 1024 * 1024)
+        result = sink.upload("output.mp4", video, "video/mp4")
+        sink.close()
+
+        head = self.client.head_object(Bucket=BUCKET, Key="job-2/output.mp4")
+        self.assertIn("-", head["ETag"])  # Multipart ETags carry a part count suffix
+        self.assertEqual(head["ContentType"], "video/mp4")
+        self.assertEqual(result["sha256"], hashlib.sha256(video).hexdigest())
+        self.assertEqual(self.get_object("job-2/output.mp4"), video)
+
+    def test_uploads_mapped_frames_and_closes_them(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        path = os.path.join(tmpdir, "frame.png")
+        with open(path, "wb") as f:
+            f.write(b"mapped frame")
+        content = read_mapped(path)
+
+        sink = S3OutputSink(self.client, BUCKET, "job-3")
+        sink.upload("frame.png", content, "image/png")
+        sink.close()
+
+        self.assertTrue(content.closed)
+        self.assertEqual(self.get_object("job-3/frame.png"), b"mapped frame")
+
+
+class TestS3OutputSinkClose(unittest.TestCase):
+    def test_close_releases_frames_of_cancelled_uploads(self):
+        tmpdir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmpdir)
+        path = os.path.join(tmpdir, "frame.png")
+        with open(path, "wb") as f:
+            f.write(b"mapped frame")
+        content = read_mapped(path)
+
+        started, release = threading.Event(), threading.Event()
+        client = MagicMock()
+        client.upload_fileobj.side_effect = lambda *args, **kwargs: (started.set(), release.wait(5))
+        sink = S3OutputSink(client, BUCKET, "job-4", workers=1)
+        sink.submit("first.png", b"first", "image/png")
+        started.wait(5)
+        sink.submit("frame.png", content, "image/png")  # queued behind the running upload
+        threading.Timer(0.1, release.set).start()
+        sink.close()
+
+        self.assertTrue(content.closed)
+        self.assertEqual(client.upload_fileobj.call_count, 1)
+
+
+@unittest.skipUnless(mock_aws, "boto3/moto not installed")
+@patch("handler.execute_workflow", return_value=(OUTPUTS, None))
+@patch("handler.upload_image_bytes", return_value=True)
+@patch("handler.check_server", return_value=True)
+@patch("handler.get_image_data", side_effect=fake_image_data)
+class TestHandlerOutputSink(unittest.TestCase):
+    def setUp(self):
+        self.mock = mock_aws()
+        self.mock.start()
+        self.addCleanup(self.mock.stop)
+        self.client = boto3.client("s3", region_name="us-east-1", aws_access_key_id="test", aws_secret_access_key="test")
+        self.client.create_bucket(Bucket=BUCKET)
+        for name, value in {"get_output_bucket_client": lambda: self.client, "OUTPUT_BUCKET_NAME": BUCKET}.items():
+            patcher = patch(f"handler.{name}", value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def job(self, **extra):
+        return {"id": "job-9", "input": dict({"start_image_base64": "c3RhcnQ=", "end_image_base64": "ZW5k", "chunk_size": 2}, **extra)}
+
+    def test_s3_sink_returns_urls(self, *_):
+        result = handler.handler(self.job(output_sink="s3"))
+
+        self.assertNotIn("frames", result)
+        self.assertEqual(len(result["frame_files"]), 5)
+        self.assertEqual(result["metadata"]["output_sink"], "s3")
+        first = result["frame_files"][0]
+        self.assertEqual(first["size_bytes"], len(fake_image_data(first["filename"], "", "")))
+        self.assertEqual(self.client.get_object(Bucket=BUCKET, Key=f"job-9/{first['filename']}")["Body"].read(), fake_image_data(first["filename"], "", ""))
+
+    def test_auto_sink_switches_on_threshold(self, *_):
+        with patch("handler.INLINE_MAX_BYTES", 1 << 20):
+            small = handler.handler(self.job(output_sink="auto"))
+        with patch("handler.INLINE_MAX_BYTES", 1000):
+            large = handler.handler(self.job(output_sink="auto"))
+
+        self.assertEqual(len(small["frames"]), 5)
+        self.assertEqual(small["metadata"]["output_sink"], "inline")
+        self.assertEqual(len(large["frame_files"]), 5)
+        self.assertEqual(large["metadata"]["output_sink"], "s3")
+
+    def test_streamed_chunks_carry_files(self, *_):
+        items = list(handler.stream_handler(self.job(output_sink="s3")))
+        chunks = [item for item in items if "frame_files" in item]
+        self.assertEqual([c["index"] for c in chunks], [0, 2, 4])
+
+    def test_s3_sink_without_bucket_fails_before_running(self, mock_get_image_data, mock_check_server, mock_upload, mock_execute):
+        with patch("handler.get_output_bucket_client", return_value=None):
+            result = handler.handler(self.job(output_sink="s3"))
+        self.assertIn("requires BUCKET_ENDPOINT_URL", result["error"])
+        mock_execute.assert_not_called()
+
+
+if __name__ == "__main__":
+    unittest.main()
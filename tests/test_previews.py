@@ -0,0 +1,103 @@
+import unittest
+import base64
+import json
+import struct
+from io import BytesIO
+
+import websocket
+
+from src.comfy_events import ComfyEventClient
+from src.previews import PreviewEncoder, parse_preview_frame, preview_available
+from src.progress import ProgressTracker
+from tests.helpers import FakeClock
+from tests.test_comfy_events import FakeWebSocket, event
+
+
+def make_png(size=(512, 288)):
+    from PIL import Image
+    output = BytesIO()
+    Image.new("RGB", size, (200, 40, 40)).save(output, format="PNG")
+    return output.getvalue()
+
+
+def preview_frame(image, metadata=None):
+    if metadata is None:
+        return struct.pack(">II", 1, 2) + image
+    header = json.dumps(metadata).encode()
+    return struct.pack(">II", 4, len(header)) + header + image
+
+
+class TestParsePreviewFrame(unittest.TestCase):
+    def test_preview_image(self):
+        self.assertEqual(parse_preview_frame(preview_frame(b"jpeg-bytes")), (b"jpeg-bytes", {}))
+
+    def test_preview_with_metadata(self):
+        image, metadata = parse_preview_frame(preview_frame(b"png", {"prompt_id": "p1", "node_id": "139"}))
+        self.assertEqual(image, b"png")
+        self.assertEqual(metadata["node_id"], "139")
+
+    def test_other_binary_events_are_ignored(self):
+        self.assertIsNone(parse_preview_frame(struct.pack(">II", 3, 0) + b"text"))
+        self.assertIsNone(parse_preview_frame(b"\x00"))
+
+
+@unittest.skipUnless(preview_available(), "Pillow not installed")
+class TestPreviewEncoder(unittest.TestCase):
+    def test_downsamples_to_jpeg(self):
+        from PIL import Image
+        encoded = PreviewEncoder(max_size=128, min_interval=0).offer(make_png())
+        with Image.open(BytesIO(base64.b64decode(encoded))) as image:
+            self.assertEqual(image.format, "JPEG")
+            self.assertEqual(image.size, (128, 72))
+
+    def test_throttles_before_decoding(self):
+        clock = FakeClock()
+        encoder = PreviewEncoder(min_interval=3, clock=clock)
+        self.assertIsNotNone(encoder.offer(make_png()))
+        clock.now = 1
+        self.assertIsNone(encoder.offer(b"not even an image"))
+        clock.now = 3
+        self.assertIsNotNone(encoder.offer(make_png()))
+
+    def test_undecodable_frame_is_skipped(self):
+        self.assertIsNone(PreviewEncoder(min_interval=0).offer(b"garbage"))
+
+    def test_tracker_sends_each_preview_once(self):
+        sent = []
+        clock = FakeClock()
+        tracker = ProgressTracker([], sent.append, min_interval=0, clock=clock, previews=PreviewEncoder(min_interval=0))
+        tracker.preview(make_png())
+        tracker.update({"type": "progress", "data": {"node": "139", "value": 1, "max": 4}})
+        self.assertIn("preview", sent[0])
+        self.assertNotIn("preview", sent[1])
+
+
+class TestPreviewRouting(unittest.TestCase):
+    def setUp(self):
+        self.client = ComfyEventClient("comfy:8188", reconnect_attempts=0, ws_factory=FakeWebSocket)
+        self.client.ensure_connected()
+        self.addCleanup(self.client.close)
+
+    def put_binary(self, data):
+        self.client._ws.messages.put((websocket.ABNF.OPCODE_BINARY, data))
+
+    def test_routes_frames_to_executing_prompt_that_asked_for_previews(self):
+        wants = self.client.register("p1", previews=True)
+        other = self.client.register("p2")
+        self.client._ws.messages.put(event("executing", "p1", node="139"))
+        self.put_binary(preview_frame(b"img"))
+        self.assertEqual(wants.get(2)["type"], "executing")
+        preview = wants.get(2)
+        self.assertEqual((preview["type"], preview["data"]["image"]), ("preview", b"img"))
+        self.assertIsNone(other.get(0.05))
+
+    def test_waiters_without_previews_get_no_frames(self):
+        waiter = self.client.register("p1")
+        self.put_binary(preview_frame(b"img", {"prompt_id": "p1", "node_id": "139"}))
+        self.client._ws.messages.put(event("executing", "p1", node=None))
+        self.assertEqual(waiter.get(2)["type"], "executing")
+        self.assertIsNone(waiter.get(0.05))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,88 @@
+import unittest
+from unittest.mock import patch
+
+import handler
+from src.progress import ProgressTracker
+from tests.helpers import FakeClock
+
+STAGES = [
+    {"name": "text_encode", "nodes": ["134"], "weight": 10},
+    {"name": "high_noise_sampling", "nodes": ["139"], "weight": 40},
+    {"name": "low_noise_sampling", "nodes": ["140"], "weight": 40},
+    {"name": "save", "nodes": ["117"], "weight": 10},
+]
+
+
+def executing(node):
+    return {"type": "executing", "data": {"node": node, "prompt_id": "p1"}}
+
+
+def progress(node, value, maximum):
+    return {"type": "progress", "data": {"node": node, "value": value, "max": maximum, "prompt_id": "p1"}}
+
+
+class TestProgressTracker(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock(100.0)
+        self.sent = []
+        self.tracker = ProgressTracker(STAGES, self.sent.append, min_interval=2, clock=self.clock)
+
+    def test_percent_combines_stage_weights_and_steps(self):
+        self.tracker.update(executing("134"))
+        self.tracker.update(executing("139"))
+        self.tracker.update(progress("139", 2, 4))
+        self.assertAlmostEqual(self.tracker.percent, 0.3)
+        self.assertEqual(self.sent[-1]["stage"], "high_noise_sampling")
+
+    def test_step_updates_are_rate_limited_but_stage_changes_are_not(self):
+        self.tracker.update(executing("139"))
+        for step in range(1, 5):
+            self.tracker.update(progress("139", step, 8))
+        self.assertEqual(len(self.sent), 1)
+        self.clock.now += 2
+        self.tracker.update(progress("139", 5, 8))
+        self.assertEqual(self.sent[-1]["step"], 5)
+        self.tracker.update(executing("140"))
+        self.assertEqual(self.sent[-1]["stage"], "low_noise_sampling")
+        self.assertEqual(len(self.sent), 3)
+
+    def test_unmapped_nodes_keep_stage_and_percent_never_drops(self):
+        self.tracker.update(executing("140"))
+        self.tracker.update(executing("999"))
+        self.assertEqual(self.tracker.stage, "low_noise_sampling")
+        self.tracker.update(executing("134"))
+        self.assertAlmostEqual(self.tracker.percent, 0.5)
+
+    def test_eta_extrapolates_elapsed_time(self):
+        self.tracker.update(executing("134"))
+        self.clock.now += 30
+        self.tracker.update(executing("139"))
+        self.tracker.update(progress("139", 2, 4))
+        self.assertEqual(self.tracker.eta_seconds(), 70)
+
+    def test_report_failure_does_not_raise(self):
+        def fail(payload):
+            raise RuntimeError("api down")
+        ProgressTracker(STAGES, fail).queued()
+
+
+class TestProgressWiring(unittest.TestCase):
+    def test_tracker_only_for_real_jobs(self):
+        workflow = handler.workflow_registry.get()[0]
+        self.assertIsNone(handler.create_progress_tracker({"input": {}}, workflow))
+        tracker = handler.create_progress_tracker({"id": "job-1"}, workflow)
+        self.assertEqual(tracker.stages, workflow.stages)
+        with patch("handler.PROGRESS_UPDATES", False):
+            self.assertIsNone(handler.create_progress_tracker({"id": "job-1"}, workflow))
+
+    @patch("runpod.serverless.progress_update")
+    def test_tracker_sends_runpod_progress_updates(self, progress_update):
+        tracker = handler.create_progress_tracker({"id": "job-1"}, handler.workflow_registry.get()[0])
+        tracker.update(executing("139"))
+        job, payload = progress_update.call_args[0]
+        self.assertEqual(job["id"], "job-1")
+        self.assertEqual(payload["stage"], "high_noise_sampling")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,157 @@
+import unittest
+from unittest.mock import MagicMock, patch
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import handler
+from src.remote_inputs import InputFetchError, check_host, fetch_s3
+from src.upload_index import UploadIndex
+
+PNG = b"\x89PNG\r\n\x1a\n" + b"p" * 5000
+
+
+class ImageServer(BaseHTTPRequestHandler):
+    """Local stand-in for an image host / presigned object URL."""
+
+    def do_GET(self):
+        if self.path == "/start.png":
+            self.send_response(200)
+            self.send_header("Content-Length", str(len(PNG)))
+            self.end_headers()
+            self.wfile.write(PNG)
+        elif self.path == "/chunked.png":
+            # No Content-Length: the size limit must be enforced while streaming
+            self.send_response(200)
+            self.send_header("Connection", "close")
+            self.end_headers()
+            for _ in range(10):
+                self.wfile.write(PNG)
+        elif self.path.startswith("/redirect?to="):
+            self.send_response(302)
+            self.send_header("Location", self.path.split("=", 1)[1])
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+        else:
+            self.send_error(404)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class TestRemoteInputs(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        cls.server = ThreadingHTTPServer(("127.0.0.1", 0), ImageServer)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.base_url = f"http://127.0.0.1:{cls.server.server_address[1]}"
+
+    def setUp(self):
+        # The local image server is on loopback, which input URLs may only reach when allowed
+        patcher = patch("handler.INPUT_ALLOWED_HOSTS", ("127.0.0.1",))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def test_downloads_http_url(self):
+        self.assertEqual(handler.download_input_image(f"{self.base_url}/start.png"), PNG)
+
+    def test_rejects_announced_size_over_limit(self):
+        with patch("handler.INPUT_MAX_BYTES", 100):
+            with self.assertRaisesRegex(InputFetchError, "exceeding the 100 byte input limit"):
+                handler.download_input_image(f"{self.base_url}/start.png")
+
+    def test_enforces_limit_while_streaming(self):
+        with patch("handler.INPUT_MAX_BYTES", len(PNG) * 3), patch("handler.INPUT_DOWNLOAD_CHUNK_BYTES", 1024):
+            with self.assertRaisesRegex(InputFetchError, "exceeds"):
+                handler.download_input_image(f"{self.base_url}/chunked.png")
+
+    def test_http_errors_and_unknown_schemes(self):
+        with self.assertRaisesRegex(InputFetchError, "404"):
+            handler.download_input_image(f"{self.base_url}/missing.png")
+        with self.assertRaisesRegex(InputFetchError, "unsupported URL scheme 'ftp'"):
+            handler.download_input_image("ftp://example.com/a.png")
+
+    def test_rejects_internal_addresses(self):
+        with patch("handler.INPUT_ALLOWED_HOSTS", ()):
+            for url in (f"{self.base_url}/start.png", "http://169.254.169.254/latest/meta-data/",
+                        "http://10.0.0.5/a.png", "http://[::ffff:127.0.0.1]:8188/view", "http://0.0.0.0:8188/"):
+                with self.assertRaisesRegex(InputFetchError, "non-public address"):
+                    handler.download_input_image(url)
+
+    def test_every_redirect_is_checked(self):
+        port = self.server.server_address[1]
+        self.assertEqual(handler.download_input_image(f"{self.base_url}/redirect?to=/start.png"), PNG)
+        # localhost is the same server, but it isn't allowed
+        with self.assertRaisesRegex(InputFetchError, "non-public address"):
+            handler.download_input_image(f"{self.base_url}/redirect?to=http://localhost:{port}/start.png")
+        with self.assertRaisesRegex(InputFetchError, "more than 5 redirects"):
+            handler.download_input_image(f"{self.base_url}/redirect?to=/redirect?to=/redirect?to=/redirect?to="
+                                         "/redirect?to=/redirect?to=/start.png")
+
+    def test_check_host_uses_resolved_addresses(self):
+        def resolve(address):
+            return lambda host, port, type: [(2, 1, 6, "", (address, port))]
+
+        check_host("https://images.example.com/a.png", resolve=resolve("93.184.216.34"))
+        with self.assertRaisesRegex(InputFetchError, "169.254.169.254"):
+            check_host("https://metadata.example.com/a.png", resolve=resolve("169.254.169.254"))
+        check_host("http://minio.internal:9000/a.png", ("minio.internal",), resolve=resolve("10.0.0.5"))
+
+    @patch("handler.upload_image_bytes", return_value=True)
+    def test_url_and_base64_inputs_share_content_address(self, mock_upload):
+        stats = handler.new_upload_stats()
+        with patch("handler.upload_index", UploadIndex(None)):
+            results = handler.upload_input_images([{"url": f"{self.base_url}/start.png"}, {"url": f"{self.base_url}/missing.png"}], stats)
+
+        self.assertTrue(results[0][0].endswith(".png"))
+        self.assertIsNone(results[1][0])
+        self.assertIn("404", results[1][1])
+        mock_upload.assert_called_once_with(PNG, results[0][0], "image/png")
+
+    def test_parse_job_input_accepts_urls(self):
+        params, error = handler.parse_job_input({"start_image_url": " https://a/b.png ", "end_image_base64": "ZW5k"})
+        self.assertIsNone(error)
+        self.assertEqual(params["images"]["start_image"], {"url": "https://a/b.png"})
+        self.assertEqual(params["images"]["end_image"], "ZW5k")
+
+    def test_parse_job_input_rejects_non_string_images(self):
+        for job_input in ({"start_image_url": 123, "end_image_base64": "ZW5k"},
+                          {"start_image_base64": "c3RhcnQ=", "end_image_url": ["https://a/b.png"]},
+                          {"start_image_base64": {"data": "x"}, "end_image_base64": "ZW5k"}):
+            params, error = handler.parse_job_input(job_input)
+            self.assertIsNone(params)
+            self.assertIn("must be a string", error["error"])
+
+
+class TestFetchS3(unittest.TestCase):
+    def make_client(self, data):
+        body = MagicMock()
+        body.iter_chunks.return_value = iter([data[:10], data[10:]])
+        client = MagicMock()
+        client.get_object.return_value = {"Body": body, "ContentLength": len(data)}
+        return client, body
+
+    def test_streams_object(self):
+        client, body = self.make_client(PNG)
+        self.assertEqual(fetch_s3("s3://inputs/jobs/start.png", client, 1 << 20), PNG)
+        client.get_object.assert_called_once_with(Bucket="inputs", Key="jobs/start.png")
+        body.close.assert_called_once()
+
+    def test_missing_bucket_configuration(self):
+        with self.assertRaisesRegex(InputFetchError, "require"):
+            fetch_s3("s3://inputs/start.png", None, 1 << 20)
+
+    def test_invalid_url_and_size_limit(self):
+        client, _ = self.make_client(PNG)
+        with self.assertRaisesRegex(InputFetchError, "expected s3://bucket/key"):
+            fetch_s3("s3://inputs", client, 1 << 20)
+        with self.assertRaisesRegex(InputFetchError, "input limit"):
+            fetch_s3("s3://inputs/start.png", client, 100)
+
+
+if __name__ == "__main__":
+    unittest.main()
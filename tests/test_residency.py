@@ -0,0 +1,98 @@
+import unittest
+from unittest.mock import patch
+import threading
+
+import handler
+from src.residency import ResidencyManager, describe_memory
+
+GB = 1024**3
+IDLE = {"queue_running": [], "queue_pending": []}
+
+
+def system_stats(vram_free_gb=60, ram_free_gb=100):
+    return {
+        "system": {"ram_total": 256 * GB, "ram_free": ram_free_gb * GB},
+        "devices": [{"name": "cuda:0", "type": "cuda", "vram_total": 80 * GB, "vram_free": vram_free_gb * GB}],
+    }
+
+
+class TestResidencyManager(unittest.TestCase):
+    def manager(self, *readings, queue=IDLE):
+        self.readings = list(readings)
+        self.frees = []
+        self.sleeps = []
+        return ResidencyManager(
+            lambda: self.readings.pop(0), lambda: queue, self.frees.append,
+            min_free_vram=0.1, min_free_ram=0.1, settle_s=2, sleep=self.sleeps.append,
+        )
+
+    def test_models_stay_resident_while_memory_fits(self):
+        manager = self.manager(system_stats())
+        self.assertIsNone(manager.check())
+        self.assertEqual(self.frees, [])
+
+    def test_low_vram_unloads_models_but_keeps_the_cache(self):
+        manager = self.manager(system_stats(vram_free_gb=4), system_stats(vram_free_gb=70))
+        self.assertEqual(manager.check(), "unload_models")
+        self.assertEqual(self.frees, [{"unload_models": True}])
+        self.assertEqual(self.sleeps, [2])
+        self.assertEqual(manager.last["before"], "VRAM 4.0/80.0 GB free, RAM 100.0/256.0 GB free")
+        self.assertEqual(manager.last["after"], "VRAM 70.0/80.0 GB free, RAM 100.0/256.0 GB free")
+
+    def test_low_ram_drops_the_cache(self):
+        manager = self.manager(system_stats(vram_free_gb=4, ram_free_gb=10), system_stats())
+        self.assertEqual(manager.check(), "free_memory")
+        self.assertEqual(self.frees, [{"unload_models": True, "free_memory": True}])
+
+    def test_busy_comfyui_is_left_alone(self):
+        for queue in ({"queue_running": [[0, "p"]], "queue_pending": []}, {"queue_running": [], "queue_pending": [[1, "p"]]}):
+            manager = self.manager(system_stats(vram_free_gb=1), queue=queue)
+            self.assertIsNone(manager.check())
+            self.assertEqual(self.frees, [])
+
+    def test_background_checks_do_not_overlap(self):
+        release = threading.Event()
+        started = threading.Event()
+
+        def get_queue():
+            started.set()
+            release.wait(5)
+            return IDLE
+
+        manager = ResidencyManager(lambda: system_stats(), get_queue, lambda request: None)
+        self.assertTrue(manager.after_job())
+        started.wait(5)
+        self.assertFalse(manager.after_job())
+        release.set()
+
+    def test_describe_memory_without_stats(self):
+        self.assertEqual(describe_memory({}), "no memory stats")
+
+
+def execute_job(prompt_ids):
+    def run(job, timer, cancelled, files):
+        for prompt_id in prompt_ids:
+            files.add_prompt(prompt_id)
+        yield {"status": "completed", "frame_count": 1}
+    return run
+
+
+@patch("handler.residency")
+class TestHandlerResidency(unittest.TestCase):
+    def test_check_runs_after_jobs_that_ran_a_prompt(self, residency):
+        with patch("handler.execute_job", side_effect=execute_job(["p1"])):
+            list(handler.run_job({"id": "job-1", "input": {}}))
+            residency.after_job.assert_called_once()
+            with patch("handler.RESIDENCY_MANAGER", False):
+                list(handler.run_job({"id": "job-2", "input": {}}))
+        residency.after_job.assert_called_once()
+
+    def test_jobs_without_prompts_are_skipped(self, residency):
+        # Health checks, invalid input and cache hits never reach ComfyUI
+        with patch("handler.execute_job", side_effect=execute_job([])):
+            list(handler.run_job({"id": "job-1", "input": {}}))
+        residency.after_job.assert_not_called()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,109 @@
+import unittest
+from unittest.mock import patch
+import os
+import shutil
+import tempfile
+
+import handler
+from src.result_cache import ResultCache, cache_key
+from tests.helpers import FakeClock
+
+JOB = {"id": "job-1", "input": {"start_image_base64": "c3RhcnQ=", "end_image_base64": "ZW5k", "seed": 7, "cache": True}}
+OUTPUTS = {"117": {"images": [{"filename": f"frame_{i}.png", "subfolder": "", "type": "output"} for i in range(3)]}}
+
+
+def store(cache, key, items):
+    writer = cache.writer(key)
+    for item in items:
+        writer.write(item)
+    writer.commit()
+
+
+class TestResultCache(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        self.clock = FakeClock(1000.0)
+        self.cache = ResultCache(self.directory, max_bytes=10**6, ttl_seconds=60, clock=self.clock)
+
+    def test_roundtrip_and_stats(self):
+        self.assertIsNone(self.cache.get("a"))
+        store(self.cache, "a", [{"metadata": {"seed": 7}}, {"frames": ["AAAA"], "index": 0}])
+        self.assertEqual(list(self.cache.get("a")), [{"metadata": {"seed": 7}}, {"frames": ["AAAA"], "index": 0}])
+        self.assertEqual(self.cache.stats(), {"hits": 1, "misses": 1, "stores": 1, "evictions": 0})
+
+    def test_aborted_entries_are_never_visible(self):
+        writer = self.cache.writer("a")
+        writer.write({"frames": ["AAAA"]})
+        writer.abort()
+        self.assertIsNone(self.cache.get("a"))
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def test_entries_expire_after_ttl(self):
+        store(self.cache, "a", [{"frames": []}])
+        self.clock.now += 61
+        self.assertIsNone(self.cache.get("a"))
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def test_least_recently_served_entry_is_evicted(self):
+        self.cache.max_bytes = 2 * len('{"frames":["AAAA"]}\n')
+        store(self.cache, "a", [{"frames": ["AAAA"]}])
+        self.clock.now += 1
+        store(self.cache, "b", [{"frames": ["BBBB"]}])
+        self.clock.now += 1
+        list(self.cache.get("a"))
+        self.clock.now += 1
+        store(self.cache, "c", [{"frames": ["CCCC"]}])
+        self.assertEqual(sorted(os.listdir(self.directory)), ["a.jsonl", "c.jsonl"])
+        self.assertEqual(self.cache.stats()["evictions"], 1)
+
+    def test_key_is_canonical(self):
+        self.assertEqual(cache_key({"a": 1, "b": [1, 2]}), cache_key({"b": [1, 2], "a": 1}))
+        self.assertNotEqual(cache_key({"a": 1}), cache_key({"a": 2}))
+
+
+@patch("handler.upload_image_bytes", return_value=True)
+@patch("handler.check_server", return_value=True)
+@patch("handler.get_image_data", side_effect=lambda f, s, t: f.encode())
+class TestCachedJobs(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        patcher = patch("handler.result_cache", ResultCache(self.directory))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_identical_job_is_served_from_cache(self, *_):
+        with patch("handler.execute_workflow", return_value=(OUTPUTS, None)) as execute_workflow:
+            first = handler.handler(JOB)
+            second = handler.handler(JOB)
+        self.assertEqual(execute_workflow.call_count, 1)
+        self.assertEqual(first["metadata"]["cache"], "miss")
+        self.assertEqual(second["metadata"]["cache"], "hit")
+        self.assertEqual(second["frames"], first["frames"])
+        self.assertEqual(second["metadata"]["frame_count"], 3)
+
+    def test_changed_parameters_miss(self, *_):
+        with patch("handler.execute_workflow", return_value=(OUTPUTS, None)) as execute_workflow:
+            handler.handler(JOB)
+            handler.handler(dict(JOB, input=dict(JOB["input"], steps=12)))
+        self.assertEqual(execute_workflow.call_count, 2)
+
+    def test_random_seed_is_not_cached(self, *_):
+        job = dict(JOB, input=dict(JOB["input"], seed=0))
+        with patch("handler.execute_workflow", return_value=(OUTPUTS, None)) as execute_workflow:
+            handler.handler(job)
+            result = handler.handler(job)
+        self.assertEqual(execute_workflow.call_count, 2)
+        self.assertNotIn("cache", result["metadata"])
+        self.assertEqual(os.listdir(self.directory), [])
+
+    def test_failed_output_is_not_cached(self, *_):
+        with patch("handler.execute_workflow", return_value=(OUTPUTS, None)), \
+                patch("handler.get_image_data", side_effect=OSError("gone")):
+            self.assertIn("error", handler.handler(JOB))
+        self.assertEqual(os.listdir(self.directory), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
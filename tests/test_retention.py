@@ -0,0 +1,179 @@
+import unittest
+from unittest.mock import MagicMock, patch
+import os
+import shutil
+import tempfile
+
+import handler
+from src.retention import RetentionManager
+from src.upload_index import UploadIndex
+from tests.helpers import FakeClock
+
+INPUT = "0123456789abcdef0123456789abcdef.png"
+OUTPUTS = {"117": {"images": [{"filename": f"frame_{i}.png", "subfolder": "", "type": "output"} for i in range(2)]}}
+
+
+class RetentionTestCase(unittest.TestCase):
+    def setUp(self):
+        self.base = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.base)
+        self.roots = {name: os.path.join(self.base, name) for name in ("input", "output", "temp")}
+        for root in self.roots.values():
+            os.makedirs(root)
+        self.clock = FakeClock(10000.0)
+        self.delete_history = MagicMock()
+        self.manager = RetentionManager(self.roots, self.delete_history, max_bytes=10**6, max_age=3600, clock=self.clock)
+
+    def touch(self, root, name, age=0, size=10):
+        path = os.path.join(self.roots[root], name)
+        with open(path, "wb") as f:
+            f.write(b"x" * size)
+        os.utime(path, (self.clock.now - age,) * 2)
+        return path
+
+    def remaining(self, root):
+        return sorted(os.listdir(self.roots[root]))
+
+
+class TestJobCleanup(RetentionTestCase):
+    def test_finished_job_removes_outputs_and_history(self):
+        for i in range(2):
+            self.touch("output", f"frame_{i}.png")
+        self.touch("output", "other_job.png")
+        files = self.manager.begin()
+        files.add_prompt("p1")
+        files.add_outputs(OUTPUTS)
+        self.assertEqual(self.manager.finish(files), 2)
+        self.assertEqual(self.remaining("output"), ["other_job.png"])
+        self.delete_history.assert_called_once_with("p1")
+
+    def test_inputs_are_released_but_kept_for_reuse(self):
+        self.touch("input", INPUT, age=7200)
+        first, second = self.manager.begin(), self.manager.begin()
+        self.manager.hold(first, INPUT)
+        self.manager.hold(second, INPUT)
+        self.manager.finish(first)
+        self.assertEqual(self.manager._refs, {INPUT: 1})
+        self.manager.finish(second)
+        self.assertEqual(self.remaining("input"), [INPUT])
+        self.assertEqual(self.manager._refs, {})
+
+    def test_outputs_shared_by_two_jobs_are_kept_until_the_last(self):
+        # An identical prompt served from ComfyUI's cache reports the first prompt's files
+        for i in range(2):
+            self.touch("output", f"frame_{i}.png")
+        first, second = self.manager.begin(), self.manager.begin()
+        self.manager.hold_outputs(first, OUTPUTS)
+        self.manager.hold_outputs(second, OUTPUTS)
+        self.assertEqual(self.manager.finish(first), 0)
+        self.assertEqual(self.remaining("output"), ["frame_0.png", "frame_1.png"])
+        self.assertEqual(self.manager.finish(second), 2)
+        self.assertEqual(self.remaining("output"), [])
+        self.assertEqual(self.manager._output_refs, {})
+
+    def test_cleanup_can_be_disabled(self):
+        self.manager.cleanup_jobs = False
+        self.touch("input", INPUT)
+        self.touch("output", "frame_0.png")
+        files = self.manager.begin()
+        self.manager.hold(files, INPUT)
+        files.add_outputs(OUTPUTS)
+        self.assertEqual(self.manager.finish(files), 0)
+        self.assertEqual(self.remaining("input"), [INPUT])
+        self.delete_history.assert_not_called()
+
+
+class TestSweep(RetentionTestCase):
+    def test_expired_orphans_are_removed(self):
+        self.touch("output", "old.png", age=7200)
+        self.touch("temp", "old_preview.png", age=7200)
+        self.touch("output", "recent.png", age=60)
+        self.touch("input", INPUT, age=7200)
+        self.touch("input", "example.png", age=7200)
+        self.assertEqual(self.manager.sweep(), (3, 30))
+        self.assertEqual(self.remaining("output"), ["recent.png"])
+        self.assertEqual(self.remaining("input"), ["example.png"])
+
+    def test_size_quota_removes_oldest_first(self):
+        self.manager.max_bytes = 25
+        for age, name in ((300, "a.png"), (200, "b.png"), (100, "c.png")):
+            self.touch("output", name, age=age)
+        self.manager.sweep()
+        self.assertEqual(self.remaining("output"), ["b.png", "c.png"])
+
+    def test_running_jobs_are_protected(self):
+        self.touch("input", INPUT, age=7200)
+        files = self.manager.begin()
+        self.manager.hold(files, INPUT)
+        self.clock.now += 7200
+        self.touch("output", "in_progress.png", age=3700)
+        self.assertEqual(self.manager.sweep(), (0, 0))
+        self.manager.finish(files)
+        self.assertEqual(self.remaining("input"), [INPUT])
+        self.assertEqual(self.manager.sweep(), (2, 20))
+
+    def test_held_outputs_are_not_swept(self):
+        # Files reported from ComfyUI's cache can be older than the job holding them
+        self.touch("output", "frame_0.png", age=7200)
+        files = self.manager.begin()
+        self.manager.hold_outputs(files, {"117": {"images": [{"filename": "frame_0.png", "type": "output"}]}})
+        self.assertEqual(self.manager.sweep(), (0, 0))
+        self.assertEqual(self.manager.finish(files), 1)
+
+
+@patch("handler.execute_workflow", return_value=(OUTPUTS, None))
+@patch("handler.upload_image_bytes", return_value=True)
+@patch("handler.check_server", return_value=True)
+@patch("handler.get_image_data", side_effect=lambda f, s, t: f.encode())
+class TestHandlerCleanup(RetentionTestCase):
+    def test_job_files_are_removed_after_delivery(self, *_):
+        for i in range(2):
+            self.touch("output", f"frame_{i}.png")
+        with patch("handler.retention", self.manager):
+            result = handler.handler({"id": "job-1", "input": {"start_image_base64": "c3RhcnQ=", "end_image_base64": "ZW5k"}})
+        self.assertEqual(len(result["frames"]), 2)
+        self.assertEqual(self.remaining("output"), [])
+        self.assertEqual(self.manager._refs, {})
+
+    def test_job_finishing_first_keeps_outputs_of_a_running_job(self, *_):
+        for i in range(2):
+            self.touch("output", f"frame_{i}.png")
+        job = {"input": {"start_image_base64": "c3RhcnQ=", "end_image_base64": "ZW5k", "chunk_size": 1}}
+        with patch("handler.retention", self.manager):
+            first = handler.run_job(dict(job, id="job-1"))
+            next(first)  # metadata: its prompt is done and holds the outputs
+            second = list(handler.run_job(dict(job, id="job-2")))
+            self.assertEqual(second[-1]["status"], "completed")
+            self.assertEqual(self.remaining("output"), ["frame_0.png", "frame_1.png"])
+            self.assertEqual(list(first)[-1]["status"], "completed")
+        self.assertEqual(self.remaining("output"), [])
+
+    def test_identical_prompts_write_their_own_files(self, *_):
+        params, _ = handler.parse_job_input({"start_image_base64": "c3RhcnQ=", "end_image_base64": "ZW5k", "seed": 1})
+        images = {"start_image": "a.png", "end_image": "b.png"}
+        prefixes = {handler.build_workflow(params, images)["117"]["inputs"]["filename_prefix"] for _ in range(2)}
+        self.assertEqual(len(prefixes), 2)
+        self.assertTrue(all(prefix.startswith("interpolated_frames_") for prefix in prefixes))
+
+    def test_second_job_reuses_inputs_of_the_first(self, _, __, upload_image_bytes, ___):
+        def upload(data, filename, mime_type):
+            with open(os.path.join(self.roots["input"], filename), "wb") as f:
+                f.write(data)
+            return True
+
+        upload_image_bytes.side_effect = upload
+        job = {"input": {"start_image_base64": "c3RhcnQ=", "end_image_base64": "ZW5k"}}
+        with patch("handler.retention", self.manager), patch("handler.upload_index", UploadIndex(self.roots["input"])):
+            for job_id in ("job-1", "job-2"):
+                self.touch("output", "frame_0.png")
+                self.touch("output", "frame_1.png")
+                result = handler.handler(dict(job, id=job_id))
+                self.assertEqual(len(result["frames"]), 2)
+        # Both images were uploaded once; the second job found them in place
+        self.assertEqual(upload_image_bytes.call_count, 2)
+        self.assertEqual(len(self.remaining("input")), 2)
+        self.assertEqual(self.remaining("output"), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
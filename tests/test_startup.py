@@ -0,0 +1,65 @@
+import unittest
+from unittest.mock import patch
+
+import handler
+from src.metrics import PhaseTimer
+from src.startup import Readiness, StartupPipeline
+from tests.helpers import FakeClock
+
+
+class TestReadiness(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        self.up_at = 1.0
+        self.readiness = Readiness(lambda: self.clock.now >= self.up_at, initial_delay=0.1, max_delay=0.5,
+                                   backoff=2, ttl=30, clock=self.clock, sleep=self.clock.sleep)
+
+    def test_backoff_grows_up_to_max_delay(self):
+        self.assertTrue(self.readiness.wait(10))
+        self.assertEqual(self.clock.sleeps, [0.1, 0.2, 0.4, 0.5])
+
+    def test_readiness_is_cached_until_ttl(self):
+        self.readiness.wait(10)
+        probes = self.readiness.probes
+        self.clock.now += 10
+        self.assertTrue(self.readiness.wait(10))
+        self.assertEqual(self.readiness.probes, probes)
+        self.clock.now += 30
+        self.assertTrue(self.readiness.wait(10))
+        self.assertEqual(self.readiness.probes, probes + 1)
+
+    def test_timeout_and_probe_errors(self):
+        self.readiness.probe = lambda: 1 / 0
+        self.assertFalse(self.readiness.wait(1))
+        self.assertAlmostEqual(self.clock.now, 1.0)
+        self.assertFalse(self.readiness.ready)
+
+
+class TestStartupPipeline(unittest.TestCase):
+    def test_steps_are_timed_and_failures_do_not_stop_the_pipeline(self):
+        ran = []
+
+        def fail():
+            raise ConnectionError("comfy down")
+
+        done = []
+        pipeline = StartupPipeline([("session_open", lambda: ran.append("session")), ("comfy_boot", fail),
+                                    ("websocket_connect", lambda: ran.append("ws"))], PhaseTimer(), lambda: done.append(1))
+        pipeline.start().join(5)
+        self.assertTrue(pipeline.done.is_set())
+        self.assertEqual(ran, ["session", "ws"])
+        self.assertEqual(set(pipeline.timings()), {"session_open", "comfy_boot", "websocket_connect"})
+        self.assertEqual(done, [1])
+
+
+class TestHealthCheck(unittest.TestCase):
+    @patch("handler.check_server", return_value=True)
+    def test_health_check_reports_cold_start(self, _):
+        with patch("handler.cold_start.phases", {"registry_load": 0.012}):
+            result = handler.handler({"id": "health", "input": {}})
+        self.assertEqual(result["status"], "success")
+        self.assertEqual(result["cold_start"], {"registry_load": 12.0})
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,64 @@
+import unittest
+from unittest.mock import patch
+import base64
+
+import handler
+
+JOB = {"id": "job-1", "input": {"start_image_base64": "c3RhcnQ=", "end_image_base64": "ZW5k", "seed": 7, "chunk_size": 2}}
+OUTPUTS = {"117": {"images": [{"filename": f"interpolated_frames_{i:05d}_.png", "subfolder": "", "type": "output"} for i in range(5)]}}
+
+
+def fake_image_data(filename, subfolder, image_type):
+    return filename.encode("utf-8")
+
+
+@patch("handler.execute_workflow", return_value=(OUTPUTS, None))
+@patch("handler.upload_image_bytes", return_value=True)
+@patch("handler.check_server", return_value=True)
+@patch("handler.get_image_data", side_effect=fake_image_data)
+class TestStreamHandler(unittest.TestCase):
+    def test_yields_metadata_then_chunks(self, *_):
+        items = list(handler.stream_handler(JOB))
+
+        self.assertEqual(items[0]["metadata"]["frame_count"], 5)
+        self.assertEqual(items[0]["metadata"]["seed"], 7)
+        chunks = [item for item in items if "frames" in item]
+        self.assertEqual([len(c["frames"]) for c in chunks], [2, 2, 1])
+        self.assertEqual([c["index"] for c in chunks], [0, 2, 4])
+        self.assertEqual(base64.b64decode(chunks[0]["frames"][0]), b"interpolated_frames_00000_.png")
+        self.assertIn("frame_fetch", items[-1].pop("timings"))
+        self.assertEqual(items[-1], {"status": "completed", "frame_count": 5, "output_sink": "inline"})
+
+    def test_handler_aggregates_stream(self, *_):
+        result = handler.handler(JOB)
+
+        self.assertEqual(len(result["frames"]), 5)
+        self.assertEqual(result["metadata"]["frame_count"], 5)
+        self.assertEqual(base64.b64decode(result["frames"][4]), b"interpolated_frames_00004_.png")
+
+    def test_failed_frames_are_skipped(self, mock_get_image_data, *_):
+        mock_get_image_data.side_effect = lambda f, s, t: None if f.endswith("00001_.png") else f.encode()
+
+        result = handler.handler(JOB)
+
+        self.assertEqual(result["metadata"]["frame_count"], 4)
+
+    def test_missing_images_yield_single_error(self, *_):
+        items = list(handler.stream_handler({"id": "job-2", "input": {"start_image_base64": "c3RhcnQ="}}))
+
+        self.assertEqual(items, [{"error": "start_image_base64 and end_image_base64 (or start_image_url and end_image_url) are required."}])
+
+
+class TestParseJobInput(unittest.TestCase):
+    def test_clamps_chunk_size(self):
+        params, error = handler.parse_job_input({"start_image_base64": "a", "end_image_base64": "b", "chunk_size": 1000})
+        self.assertIsNone(error)
+        self.assertEqual(params["chunk_size"], handler.STREAM_CHUNK_SIZE_MAX)
+
+    def test_resolution_to_dimensions(self):
+        self.assertEqual(handler.resolution_to_dimensions(480), (854, 480))
+        self.assertEqual(handler.resolution_to_dimensions(1080), (1920, 1080))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,127 @@
+import unittest
+from unittest.mock import patch
+import json
+import os
+import shutil
+import tempfile
+
+import handler
+from src.comfy_events import ComfyEventClient
+from src.concurrency import PromptGate
+from src.metrics import PhaseTimer
+from src.tracing import COMFY_TID, JobTrace, TraceWriter
+from tests.test_comfy_events import FakeWebSocket, event
+
+WORKFLOW = {
+    "131": {"class_type": "WanVideoModelLoader", "inputs": {}},
+    "139": {"class_type": "WanVideoSampler", "inputs": {}},
+    "117": {"class_type": "SaveImage", "inputs": {}},
+}
+OUTPUTS = {"117": {"images": [{"filename": "frame_0.png", "subfolder": "", "type": "output"}]}}
+
+
+def spans(trace, category=None):
+    return [e for e in trace.events if e["ph"] == "X" and (category is None or e["cat"] == category)]
+
+
+class TestJobTrace(unittest.TestCase):
+    def test_spans_are_chrome_complete_events_in_microseconds(self):
+        trace = JobTrace("job-1")
+        trace.add_span("upload", 1.0, 1.25)
+        trace.add_node("139", "WanVideoSampler", 2.0, 5.0)
+        upload, node = spans(trace)
+        self.assertEqual((upload["ts"], upload["dur"]), (1e6, 0.25e6))
+        self.assertEqual((node["name"], node["tid"]), ("WanVideoSampler #139", COMFY_TID))
+        self.assertEqual(json.loads(trace.to_json())["traceEvents"], trace.events)
+
+    def test_cached_nodes_are_zero_length(self):
+        trace = JobTrace("job-1")
+        trace.add_node("131", "WanVideoModelLoader", 2.0, 9.0, cached=True)
+        cached = spans(trace, "cached")[0]
+        self.assertEqual(cached["dur"], 0)
+        self.assertTrue(cached["args"]["cached"])
+
+
+class TestTraceWriter(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+
+    def test_rotation_keeps_newest_within_limits(self):
+        writer = TraceWriter(self.directory, max_bytes=10**6, max_files=2)
+        for job_id in ("a", "b", "c"):
+            path = writer.write(JobTrace(job_id))
+            os.utime(path, (len(os.listdir(self.directory)),) * 2)
+        self.assertEqual(sorted(os.listdir(self.directory)), ["b.trace.json", "c.trace.json"])
+
+    def test_size_limit_never_removes_latest_trace(self):
+        writer = TraceWriter(self.directory, max_bytes=1, max_files=10)
+        writer.write(JobTrace("old"))
+        os.utime(os.path.join(self.directory, "old.trace.json"), (1, 1))
+        writer.write(JobTrace("new/../x"))
+        self.assertEqual(os.listdir(self.directory), ["new____x.trace.json"])
+
+
+class TestExecutionSpans(unittest.TestCase):
+    def setUp(self):
+        self.client = ComfyEventClient("comfy:8188", reconnect_attempts=0, ws_factory=FakeWebSocket)
+        for name, value in (("comfy_events", self.client), ("prompt_gate", PromptGate(lambda: (0, 0, None)))):
+            patcher = patch(f"handler.{name}", value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.addCleanup(self.client.close)
+
+    @patch("handler.get_history", return_value={"p1": {"outputs": OUTPUTS}})
+    def test_node_spans_from_websocket_events(self, _):
+        messages = [
+            json.dumps({"type": "execution_cached", "data": {"nodes": ["131"], "prompt_id": "p1"}}),
+            event("executing", "p1", node="139"),
+            event("executing", "p1", node="117"),
+            event("executed", "p1", node="117", output={}),
+            event("executing", "p1", node=None),
+        ]
+
+        def queue_workflow(workflow, client_id):
+            for message in messages:
+                self.client._ws.messages.put(message)
+            return {"prompt_id": "p1"}
+
+        timer = PhaseTimer(trace=JobTrace("job-1"))
+        with patch("handler.queue_workflow", side_effect=queue_workflow):
+            outputs, error = handler.execute_workflow(WORKFLOW, timer=timer)
+        self.assertIsNone(error)
+        names = {span["name"]: span["cat"] for span in spans(timer.trace)}
+        self.assertEqual(names["WanVideoModelLoader #131"], "cached")
+        self.assertEqual(names["WanVideoSampler #139"], "node")
+        self.assertEqual(names["SaveImage #117"], "node")
+        for phase in ("queue", "queue_wait", "execution", "history_fetch"):
+            self.assertEqual(names[phase], "phase")
+        self.assertEqual(set(timer.nodes), {"139", "117"})
+
+
+@patch("handler.execute_workflow", return_value=(OUTPUTS, None))
+@patch("handler.upload_image_bytes", return_value=True)
+@patch("handler.check_server", return_value=True)
+@patch("handler.get_image_data", side_effect=lambda f, s, t: f.encode())
+class TestJobTraceFiles(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.directory)
+        patcher = patch("handler.trace_writer", TraceWriter(self.directory))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_traced_job_writes_trace_file(self, *_):
+        handler.handler({"id": "job-9", "input": {"start_image_base64": "c3RhcnQ=", "end_image_base64": "ZW5k", "trace": True}})
+        with open(os.path.join(self.directory, "job-9.trace.json")) as f:
+            names = [e["name"] for e in json.load(f)["traceEvents"] if e["ph"] == "X"]
+        for name in ("job", "server_check", "upload", "workflow_patch", "execute_workflow", "output"):
+            self.assertIn(name, names)
+
+    def test_untraced_job_writes_nothing(self, *_):
+        handler.handler({"id": "job-10", "input": {"start_image_base64": "c3RhcnQ=", "end_image_base64": "ZW5k"}})
+        self.assertEqual(os.listdir(self.directory), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
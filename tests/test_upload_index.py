@@ -0,0 +1,83 @@
+import unittest
+from unittest.mock import patch
+import base64
+import os
+import shutil
+import tempfile
+
+import handler
+from src.upload_index import UploadIndex, content_filename, detect_image_type
+
+PNG = b"\x89PNG\r\n\x1a\n" + b"pixels"
+JPEG = b"\xff\xd8\xff\xe0" + b"pixels"
+
+
+class TestUploadIndex(unittest.TestCase):
+    def setUp(self):
+        self.input_dir = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.input_dir)
+
+    def test_content_filename_is_stable_and_typed(self):
+        self.assertEqual(content_filename(PNG, ".png"), content_filename(PNG, ".png"))
+        self.assertNotEqual(content_filename(PNG, ".png"), content_filename(JPEG, ".png"))
+        self.assertEqual(detect_image_type(PNG), (".png", "image/png"))
+        self.assertEqual(detect_image_type(JPEG), (".jpg", "image/jpeg"))
+        self.assertEqual(detect_image_type(b"RIFF\x00\x00\x00\x00WEBPVP8 "), (".webp", "image/webp"))
+
+    def test_in_memory_index_without_visible_input_dir(self):
+        index = UploadIndex(os.path.join(self.input_dir, "missing"))
+        self.assertFalse(index.contains("a.png"))
+        index.add("a.png")
+        self.assertTrue(index.contains("a.png"))
+
+    def test_verifies_against_input_dir(self):
+        index = UploadIndex(self.input_dir)
+        index.add("a.png")
+        # Uploaded entry was removed from ComfyUI's input folder -> no stale hit
+        self.assertFalse(index.contains("a.png"))
+        self.assertEqual(len(index), 0)
+
+        # Files left by an earlier handler process count as known
+        open(os.path.join(self.input_dir, "b.png"), "wb").close()
+        self.assertTrue(index.contains("b.png"))
+
+
+@patch("handler.upload_image_bytes", return_value=True)
+class TestUploadInputImage(unittest.TestCase):
+    def setUp(self):
+        self.index = UploadIndex(None)
+        patcher = patch("handler.upload_index", self.index)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_skips_known_images(self, mock_upload):
+        stats = handler.new_upload_stats()
+        encoded = "data:image/png;base64," + base64.b64encode(PNG).decode()
+
+        first, _ = handler.upload_input_image(encoded, stats)
+        second, _ = handler.upload_input_image(encoded, stats)
+
+        self.assertEqual(first, second)
+        self.assertTrue(first.endswith(".png"))
+        mock_upload.assert_called_once_with(PNG, first, "image/png")
+        self.assertEqual(stats, {"hits": 1, "misses": 1, "bytes_uploaded": len(PNG), "bytes_saved": len(PNG)})
+
+    def test_failed_upload_is_not_indexed(self, mock_upload):
+        mock_upload.return_value = False
+        stats = handler.new_upload_stats()
+
+        self.assertEqual(handler.upload_input_image(base64.b64encode(JPEG).decode(), stats), (None, "upload to ComfyUI failed"))
+        self.assertEqual(len(self.index), 0)
+        self.assertEqual(stats["misses"], 0)
+
+    def test_invalid_base64(self, mock_upload):
+        filename, error = handler.upload_input_image("not base64!", handler.new_upload_stats())
+        self.assertIsNone(filename)
+        self.assertIn("invalid base64", error)
+        mock_upload.assert_not_called()
+
+
+if __name__ == "__main__":
+    unittest.main()
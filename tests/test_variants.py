@@ -0,0 +1,77 @@
+import unittest
+from unittest.mock import patch
+
+import handler
+
+IMAGES = {"start_image_base64": "c3RhcnQ=", "end_image_base64": "ZW5k"}
+JOB = {"id": "job-1", "input": dict(IMAGES, steps=8, variants=[{"seed": 1}, {"seed": 2, "steps": 12}])}
+
+
+def outputs_for(prompt_id):
+    return {"117": {"images": [{"filename": f"{prompt_id}_{i}.png", "subfolder": "", "type": "output"} for i in range(2)]}}
+
+
+class TestParseVariants(unittest.TestCase):
+    def test_variants_override_job_parameters(self):
+        params, error = handler.parse_job_input(JOB["input"])
+        self.assertIsNone(error)
+        self.assertEqual([(v["seed"], v["steps"]) for v in params["variants"]], [(1, 8), (2, 12)])
+
+    def test_jobs_without_variants(self):
+        params, _ = handler.parse_job_input(IMAGES)
+        self.assertIsNone(params["variants"])
+
+    def test_invalid_variants(self):
+        for variants, message in (
+            ([], "non-empty list"),
+            ([{"start_image": "x.png"}], "Variant 0: unsupported parameter(s) start_image"),
+            ([{}, "seed=3"], "non-empty list"),
+            ([{}] * (handler.MAX_VARIANTS + 1), "Too many variants"),
+        ):
+            _, error = handler.parse_job_input(dict(IMAGES, variants=variants))
+            self.assertIn(message, error["error"])
+
+
+@patch("handler.upload_image_bytes", return_value=True)
+@patch("handler.check_server", return_value=True)
+@patch("handler.get_image_data", side_effect=lambda f, s, t: f.encode())
+class TestVariantJobs(unittest.TestCase):
+    def setUp(self):
+        self.calls = []
+
+        def submit_workflow(workflow, previews=False, timer=None, files=None, cancelled=None):
+            self.calls.append(("submit", workflow))
+            return f"p{len(self.calls)}", None
+
+        def execute_workflow(workflow, timeout_seconds, cancelled=None, progress=None, timer=None, submitted=None,
+                             files=None):
+            self.calls.append(("wait", submitted[0]))
+            return outputs_for(submitted[0]), None
+
+        for name, side_effect in (("submit_workflow", submit_workflow), ("execute_workflow", execute_workflow)):
+            patcher = patch(f"handler.{name}", side_effect=side_effect)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_all_variants_are_queued_before_waiting(self, *_):
+        result = handler.handler(JOB)
+        self.assertEqual([call[0] for call in self.calls], ["submit", "submit", "wait", "wait"])
+        self.assertEqual([v["metadata"]["seed"] for v in result["variants"]], [1, 2])
+        self.assertEqual(len(result["variants"][1]["frames"]), 2)
+        self.assertIn("timings", result["variants"][0]["metadata"])
+
+    def test_streamed_items_are_tagged(self, *_):
+        items = list(handler.stream_handler(JOB))
+        self.assertEqual([item["variant"] for item in items if "metadata" in item], [0, 1])
+        self.assertEqual([item["variant"] for item in items if item.get("status") == "completed"], [0, 1])
+
+    def test_failed_variant_releases_queued_prompts(self, *_):
+        with patch("handler.execute_workflow", return_value=(None, {"error": "Workflow execution interrupted"})), \
+                patch("handler.release_prompt") as release_prompt:
+            result = handler.handler(JOB)
+        self.assertEqual(result, {"error": "Workflow execution interrupted", "variant": 0})
+        release_prompt.assert_called_once_with("p2")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,94 @@
+import unittest
+from unittest.mock import patch
+import base64
+import os
+import shutil
+import stat
+import tempfile
+
+import handler
+from src.video import VideoEncoder, VideoEncoderError
+
+# Stand-in for ffmpeg: concatenates stdin into the output path (last argument)
+FAKE_FFMPEG = """#!/bin/sh
+for arg; do out="$arg"; done
+cat > "$out"
+"""
+
+JOB = {"id": "job-1", "input": {"start_image_base64": "c3RhcnQ=", "end_image_base64": "ZW5k", "output_format": "mp4", "crf": 18}}
+OUTPUTS = {"117": {"images": [{"filename": f"frame_{i}.png", "subfolder": "", "type": "output"} for i in range(3)]}}
+
+
+class FakeFfmpegMixin:
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.ffmpeg = os.path.join(self.tmpdir, "ffmpeg")
+        with open(self.ffmpeg, "w") as f:
+            f.write(FAKE_FFMPEG)
+        os.chmod(self.ffmpeg, os.stat(self.ffmpeg).st_mode | stat.S_IEXEC)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+
+class TestVideoEncoder(FakeFfmpegMixin, unittest.TestCase):
+    def test_build_command_mp4(self):
+        cmd = VideoEncoder("mp4", "h264", 23, 32).build_command("out.mp4")
+        self.assertIn("libx264", cmd)
+        self.assertEqual(cmd[cmd.index("-crf") + 1], "23")
+        self.assertEqual(cmd[cmd.index("-framerate") + 1], "32")
+        self.assertEqual(cmd[-1], "out.mp4")
+
+    def test_build_command_webm_uses_constant_quality(self):
+        cmd = VideoEncoder("webm", "vp9", 32, 16).build_command("out.webm")
+        self.assertIn("libvpx-vp9", cmd)
+        self.assertEqual(cmd[cmd.index("-b:v") + 1], "0")
+
+    def test_pipes_frames_to_ffmpeg(self):
+        with VideoEncoder("mp4", "h264", 23, 32, ffmpeg=self.ffmpeg) as encoder:
+            encoder.write_frame(b"one")
+            encoder.write_frame(b"two")
+            self.assertEqual(encoder.finish(), b"onetwo")
+        self.assertEqual(encoder.frame_count, 2)
+
+    def test_missing_ffmpeg_raises(self):
+        encoder = VideoEncoder("mp4", "h264", 23, 32, ffmpeg=os.path.join(self.tmpdir, "missing"))
+        with self.assertRaises(VideoEncoderError):
+            encoder.start()
+
+    @unittest.skipUnless(shutil.which("ffmpeg"), "ffmpeg not installed")
+    def test_real_ffmpeg_rejects_invalid_frames(self):
+        with VideoEncoder("mp4", "h264", 23, 32, ffmpeg="ffmpeg") as encoder:
+            encoder.write_frame(b"not a png")
+            with self.assertRaises(VideoEncoderError):
+                encoder.finish()
+
+
+@patch("handler.execute_workflow", return_value=(OUTPUTS, None))
+@patch("handler.upload_image_bytes", return_value=True)
+@patch("handler.check_server", return_value=True)
+@patch("handler.get_image_data", side_effect=lambda f, s, t: f.encode())
+class TestVideoOutput(FakeFfmpegMixin, unittest.TestCase):
+    def test_handler_returns_single_video(self, *_):
+        with patch("src.video.FFMPEG_BINARY", self.ffmpeg):
+            result = handler.handler(JOB)
+
+        self.assertNotIn("frames", result)
+        self.assertEqual(base64.b64decode(result["video"]), b"frame_0.pngframe_1.pngframe_2.png")
+        self.assertEqual(result["metadata"]["format"], "mp4")
+        self.assertEqual(result["metadata"]["codec"], "h264")
+        self.assertEqual(result["metadata"]["crf"], 18)
+        self.assertEqual(result["metadata"]["frame_count"], 3)
+        self.assertEqual(result["metadata"]["size_bytes"], 33)
+
+    def test_unknown_codec_lists_available(self, *_):
+        result = handler.handler({"input": dict(JOB["input"], codec="av1")})
+        self.assertEqual(result["error"], "Unsupported codec 'av1' for mp4. Available: h264, h265")
+
+    def test_unknown_output_format(self, *_):
+        result = handler.handler({"input": dict(JOB["input"], output_format="gif")})
+        self.assertIn("Available: frames, mp4, webm", result["error"])
+
+
+if __name__ == "__main__":
+    unittest.main()
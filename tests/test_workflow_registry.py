@@ -0,0 +1,125 @@
+import unittest
+import json
+import os
+import shutil
+import tempfile
+
+import handler
+from src.workflow_registry import CompiledWorkflow, WorkflowError, WorkflowRegistry
+
+TEMPLATE = {
+    "1": {"class_type": "LoadImage", "inputs": {"image": "placeholder.png"}},
+    "2": {"class_type": "Sampler", "inputs": {"steps": 20, "end_step": 10, "seed": 1}},
+    "3": {"class_type": "SaveImage", "inputs": {"filename_prefix": "out"}},
+}
+SPEC = {
+    "output_node": "3",
+    "params": {
+        "image": {"type": "image", "required": True, "targets": [["1", "image"]]},
+        "steps": {"type": "int", "default": 8, "min": 4, "max": 20, "targets": [["2", "steps"]],
+                  "derived": [{"fn": "half", "targets": [["2", "end_step"]]}]},
+        "seed": {"type": "seed", "targets": [["2", "seed"]]},
+    },
+}
+
+
+class TestCompiledWorkflow(unittest.TestCase):
+    def setUp(self):
+        self.workflow = CompiledWorkflow("test", TEMPLATE, SPEC, "v1")
+
+    def test_validate_clamps_and_falls_back_to_default(self):
+        values, error = self.workflow.validate({"steps": "many", "seed": 7})
+        self.assertIsNone(error)
+        self.assertEqual(values, {"steps": 8, "seed": 7})
+        self.assertEqual(self.workflow.validate({"steps": 99})[0]["steps"], 20)
+
+    def test_zero_seed_is_randomized(self):
+        values, _ = self.workflow.validate({"seed": 0})
+        self.assertNotEqual(values["seed"], 0)
+
+    def test_render_writes_targets_and_derived_values(self):
+        workflow = self.workflow.render({"image": "abc.png", "steps": 12, "seed": 5})
+        self.assertEqual(workflow["1"]["inputs"]["image"], "abc.png")
+        self.assertEqual(workflow["2"]["inputs"], {"steps": 12, "end_step": 6, "seed": 5})
+
+    def test_render_leaves_template_untouched(self):
+        workflow = self.workflow.render({"image": "abc.png", "steps": 12, "seed": 5})
+        self.assertEqual(TEMPLATE["1"]["inputs"]["image"], "placeholder.png")
+        self.assertEqual(TEMPLATE["2"]["inputs"]["steps"], 20)
+        self.assertIs(workflow["3"], TEMPLATE["3"])
+
+    def test_missing_target_node_fails_at_compile_time(self):
+        spec = dict(SPEC, params={"steps": {"type": "int", "targets": [["99", "steps"]]}})
+        with self.assertRaises(WorkflowError):
+            CompiledWorkflow("broken", TEMPLATE, spec, "v1")
+
+
+class TestWorkflowRegistry(unittest.TestCase):
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        with open(os.path.join(self.tmpdir, "good.json"), "w") as f:
+            json.dump({"input": {"workflow": TEMPLATE}}, f)
+        with open(os.path.join(self.tmpdir, "bad.json"), "w") as f:
+            json.dump(TEMPLATE, f)
+        manifest = {
+            "default": "good",
+            "workflows": {
+                "good": dict(SPEC, file="good.json"),
+                "bad": dict(SPEC, file="bad.json", output_node="42"),
+            },
+        }
+        self.manifest = os.path.join(self.tmpdir, "registry.json")
+        with open(self.manifest, "w") as f:
+            json.dump(manifest, f)
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_load_unwraps_request_files_and_records_errors(self):
+        registry = WorkflowRegistry.load(self.manifest)
+        workflow, error = registry.get()
+        self.assertIsNone(error)
+        self.assertEqual(workflow.name, "good")
+        self.assertEqual(len(workflow.version), 16)
+        self.assertIn("failed to load", registry.get("bad")[1])
+        self.assertIn("Available: good", registry.get("missing")[1])
+
+    def test_shipped_manifest_loads_cleanly(self):
+        registry = WorkflowRegistry.load(handler.WORKFLOW_REGISTRY_FILE)
+        self.assertEqual(registry.errors, {})
+        self.assertEqual(registry.default, "wan22_i2v")
+
+
+class TestHandlerWorkflowSelection(unittest.TestCase):
+    def test_default_workflow_renders_wan_nodes(self):
+        params, error = handler.parse_job_input(
+            {"start_image_base64": "c3RhcnQ=", "end_image_base64": "ZW5k", "steps": 10, "resolution": 720, "seed": 3}
+        )
+        self.assertIsNone(error)
+        workflow = handler.build_workflow(params, {"start_image": "s.png", "end_image": "e.png"})
+        self.assertEqual(workflow["148"]["inputs"]["image"], "s.png")
+        self.assertEqual(workflow["151"]["inputs"]["value"], 5)
+        self.assertEqual((workflow["156"]["inputs"]["width"], workflow["156"]["inputs"]["height"]), (1280, 720))
+        self.assertEqual(workflow["140"]["inputs"]["seed"], 3)
+
+    def test_missing_images_error_is_unchanged(self):
+        _, error = handler.parse_job_input({"start_image_base64": "c3RhcnQ="})
+        self.assertEqual(
+            error["error"], "start_image_base64 and end_image_base64 (or start_image_url and end_image_url) are required."
+        )
+
+    def test_unknown_workflow_name(self):
+        _, error = handler.parse_job_input({"workflow_name": "nope"})
+        self.assertIn("Unknown workflow 'nope'", error["error"])
+
+    def test_text_to_image_workflow_needs_no_images(self):
+        params, error = handler.parse_job_input({"workflow_name": "sd15_webp", "positive_prompt": "a cat"})
+        self.assertIsNone(error)
+        self.assertEqual(params["images"], {})
+        self.assertEqual(handler.build_workflow(params, {})["6"]["inputs"]["text"], "a cat")
+        metadata = handler.build_metadata(params, 1)
+        self.assertEqual((metadata["workflow"], metadata["format"]), ("sd15_webp", "webp"))
+
+
+if __name__ == "__main__":
+    unittest.main()